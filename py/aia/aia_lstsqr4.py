@@ -209,10 +209,16 @@ for iwave, wave in enumerate(waves):
             pkl_location = locations['pickle']
             ifilename = ident + '.datacube'
             pkl_file_location = os.path.join(pkl_location, ifilename + '.pickle')
-            print('Loading ' + pkl_file_location)
-            pkl_file = open(pkl_file_location, 'rb')
-            dc = pickle.load(pkl_file)
-            pkl_file.close()
+            npy_file_location = os.path.join(pkl_location, ifilename + '.npy')
+            if os.path.isfile(npy_file_location):
+                # Large or simulated datacubes are stored as memory maps
+                print('Loading ' + npy_file_location)
+                dc = np.load(npy_file_location, mmap_mode='r')
+            else:
+                print('Loading ' + pkl_file_location)
+                pkl_file = open(pkl_file_location, 'rb')
+                dc = pickle.load(pkl_file)
+                pkl_file.close()
 
             # Get some properties of the datacube
             ny = dc.shape[0]
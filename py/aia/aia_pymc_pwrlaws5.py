@@ -20,8 +20,11 @@ from scipy.stats import shapiro, anderson
 from statsmodels.graphics.gofplots import qqplot
 
 import aia_specific
+import campaign
 import pymcmodels2
+import npmodels
 import rnspectralmodels
+import modelcomparison
 from paper1 import sunday_name, prettyprint, log_10_product
 from paper1 import csv_timeseries_write, pkl_write, fix_nonfinite, fit_details
 
@@ -33,20 +36,23 @@ np.random.seed(1)
 # Functions to calculate and store results
 #
 def fit_summary(M, maxlogp, chisquared, k=None):
-    # Calculate the log likelihood
-    lnL = np.sum([x.logp for x in M.observed_stochastics])
-    print 'fit_summary: lnL as calculated by PyMC ', lnL
+    # The log likelihood at the maximum found by the npmodels.MAP fit M
+    lnL = maxlogp
+    print 'fit_summary: lnL at the maximum ', lnL
 
     # Number of variables
     if k == None:
-        k = M.len - M.data_len
+        k = M.logposterior.nparameters
     print 'fit_summary: number of variables in fit = %i' % (k)
 
+    # Number of data points
+    data_len = M.logposterior.power.size
+
     # Calculate the AIC
     AIC = 2. * (k - lnL)
 
     # Calculate the BIC
-    BIC = k * np.log(M.data_len) - 2.0 * lnL
+    BIC = k * np.log(data_len) - 2.0 * lnL
 
     return {"AIC": AIC, "BIC": BIC, "maxlogp": maxlogp, "chi2": chisquared}
 
@@ -77,32 +83,59 @@ def get_log_likelihood(y, f, sigma):
     return np.sum(B + A)
 
 
+#
+# Maximum of the log posterior, starting from the posterior mean of the
+# MCMC samples.  The bounded fit respects the limits of the priors, so no
+# further least-squares refit is needed.
+#
+def get_map(M, logposterior):
+    start = [M.stats()[name]['mean'] for name in logposterior.names]
+    return npmodels.MAP(logposterior).fit(start=start)
+
+
+def get_likelihood(map_M):
+    # The uniform priors are flat, so the log likelihood at the maximum
+    # differs from the log posterior by a constant
+    return map_M.logp_at_max - map_M.logposterior.logprior_constant
+
+
+def get_uncertainties(map_M):
+    # Standard deviations from the Hessian at the maximum
+    if not np.all(np.isfinite(map_M.hessian)):
+        return np.zeros(len(map_M.values)) + np.nan
+    return np.sqrt(np.diagonal(np.linalg.pinv(-map_M.hessian)))
+
+
+#
+# One unit of the campaign: sample a model, storing the samples in a pickle
+# database, and find the maximum of its log posterior.  PyMC cannot resume a
+# partly sampled chain, so the checkpoint is not used; an interrupted unit is
+# run again from the start.
+#
+def sample_and_fit(pymcmodel, logposterior, dbname, itera, burn, thin, checkpoint=None):
+    M = pymc.MCMC(pymcmodel, db='pickle', dbname=dbname)
+    M.sample(iter=itera, burn=burn, thin=thin, progress_bar=True)
+    M.db.close()
+    return get_map(M, logposterior)
+
+
+def load_samples(pymcmodel, dbname):
+    # The samples of a completed unit, read back from its pickle database
+    return pymc.MCMC(pymcmodel, db=pymc.database.pickle.load(dbname))
+
+
 #
 # Hypothesis 0 functions
 #
 def get_variables_M0(m):
-    A = [m.value.power_law_norm, m.value.power_law_index, m.value.background]
+    A = [m.power_law_norm.value, m.power_law_index.value, m.background.value]
     return A
 
 
-def curve_fit_M0(x, y, p0, sigma):
-    answer = curve_fit(rnspectralmodels.Log_splwc_CF, x, y, p0=p0, sigma=sigma)
-    return answer[0]
-
-
 def get_spectrum_M0(x, A):
     return rnspectralmodels.Log_splwc(x, A)
 
 
-def get_likelihood_M0(map_M0, x, pwr, sigma, tau, obstype):
-    A0 = get_variables_M0(map_M0)
-    A0 = curve_fit_M0(x, pwr, A0, sigma)
-    if obstype == '.logiobs':
-        return pymc.normal_like(pwr, get_spectrum_M0(x, A0), tau)
-    else:
-        return pymc.lognormal_like(pwr, get_spectrum_M0(x, A0), tau)
-
-
 def get_chi_M0(map_M0, x, pwr, sigma):
     A0 = get_variables_M0(map_M0)
     spectrum = get_spectrum_M0(x, A0)
@@ -240,40 +273,15 @@ def write_plots(M, region_id, obstype, savefig, model, passnumber,
 # Hypothesis 1 functions
 #
 def get_variables_M1(m):
-    A = [m.value.power_law_norm, m.value.power_law_index, m.value.background,
-         m.value.eda_amplitude, m.value.eda_frequency, m.value.eda_index]
+    A = [m.power_law_norm.value, m.power_law_index.value, m.background.value,
+         m.eda_amplitude.value, m.eda_frequency.value, m.eda_index.value]
     return A
 
 
-def curve_fit_M1(x, y, p0, sigma, n_attempt_limit=10):
-    p_in = p0
-    n_attempt = 0
-    success = False
-    while (not success) and (n_attempt <= n_attempt_limit):
-        try:
-            answer = curve_fit(rnspectralmodels.Log_splwc_AddExpDecayAutocor_CF, x, y, p0=p_in, sigma=sigma)
-            success = True
-        except RuntimeError:
-            print 'Model M1 curve fit did not work - try varying parameters a tiny bit'
-            p_in = p0 + 0.1 * np.random.random(size=(6))
-            n_attempt = n_attempt + 1
-            print 'Attempt number: %i' % (n_attempt)
-    if success:
-        return answer[0]
-    else:
-        return p0
-
-
 def get_spectrum_M1(x, A):
     return rnspectralmodels.Log_splwc_AddExpDecayAutocor(x, A)
 
 
-def get_likelihood_M1(map_M1, x, pwr, sigma, tau, obstype):
-    A1 = get_variables_M1(map_M1)
-    A1 = curve_fit_M1(x, pwr, A1, sigma)
-    return pymc.normal_like(pwr, get_spectrum_M1(x, A1), tau)
-
-
 def get_chi_M1(map_M1, x, pwr, sigma):
     A1 = get_variables_M1(map_M1)
     spectrum = get_spectrum_M1(x, A1)
@@ -375,6 +383,14 @@ imgfiletype = 'pdf'
 # Frequency scaling
 freqfactor = 1000.0
 
+# Fit summaries of every region, for comparing the models
+comparison_table = modelcomparison.ComparisonTable(os.path.join(ldirroot, corename + '.model_comparison.pickle'))
+
+# Model fits completed by earlier runs are read back rather than repeated,
+# so an interrupted run carries on from the first unfinished fit
+fits = campaign.Campaign(os.path.join(ldirroot, corename + '.campaign'),
+                         config={"itera": itera, "burn": burn, "thin": thin})
+
 for iwave, wave in enumerate(waves):
     print(' ')
     print('##################################################################')
@@ -565,7 +581,6 @@ for iwave, wave in enumerate(waves):
                 # sigma mean
                 prettyprint('Model fitting and results')
                 for jjj, sigma in enumerate((sigma_of_distribution, sigma_for_mean)):
-                    tau = 1.0 / (sigma ** 2)
                     pwr = pwr_ff
                     if jjj == 0:
                         pymcmodel0 = pymcmodels2.Log_splwc(x, pwr, sigma)
@@ -573,20 +588,14 @@ for iwave, wave in enumerate(waves):
                         pymcmodel0 = pymcmodels2.Log_splwc(x, pwr, sigma, init=A0)
                     passnumber = str(jjj)
 
-                    # Initiate the sampler
+                    # Run the sampler and then the MAP, unless an earlier
+                    # run has already done so
                     dbname0 = os.path.join(pkl_location, 'MCMC.M0.' + passnumber + region_id + obstype)
-                    M0 = pymc.MCMC(pymcmodel0, db='pickle', dbname=dbname0)
-
-                    # Run the sampler
                     print('M0 : pass %i : Running simple power law model' % (jjj + 1))
-                    M0.sample(iter=itera, burn=burn, thin=thin, progress_bar=True)
-                    M0.db.close()
-
-                    # Now run the MAP
-                    map_M0 = pymc.MAP(pymcmodel0)
-                    print(' ')
-                    print('M0 : pass %i : fitting to find the maximum likelihood' % (jjj + 1))
-                    map_M0.fit(method='fmin_powell')
+                    map_M0 = fits.run((wave, region, window, obstype, 'M0', passnumber),
+                                      sample_and_fit, pymcmodel0, npmodels.Log_splwc(x, pwr, sigma),
+                                      dbname0, itera, burn, thin)
+                    M0 = load_samples(pymcmodel0, dbname0)
 
                     # Get the variables and the best fit
                     A0 = get_variables_M0(map_M0)
@@ -596,14 +605,14 @@ for iwave, wave in enumerate(waves):
                     write_plots(M0, region_id, obstype, savefig, 'M0', passnumber, bins=40, extra_factors=[xnorm])
 
                     # Get the likelihood at the maximum
-                    #likelihood0_data = map_M0.logp_at_max
-                    l0_data = get_likelihood_M0(map_M0, x, pwr, sigma, tau, obstype)
+                    l0_data = get_likelihood(map_M0)
                     l0_data_logp = get_log_likelihood(pwr, M0_bf, sigma)
 
                     # Get the chi-squared value
                     chi0 = get_chi_M0(map_M0, x, pwr, sigma)
                     print('M0 : pass %i : reduced chi-squared = %f' % (jjj + 1, chi0))
                     print('   : variables ', A0)
+                    print('   : uncertainties ', get_uncertainties(map_M0))
                     print('   : estimate log likelihood = %f' % (l0_data_logp))
 
                 #
@@ -634,7 +643,6 @@ for iwave, wave in enumerate(waves):
                 # Second model - power law with Gaussian bumps
                 #
                 for jjj, sigma in enumerate((sigma_of_distribution, sigma_for_mean)):
-                    tau = 1.0 / (sigma ** 2)
                     pwr = pwr_ff
                     if jjj == 0:
                         if A1_estimate[4] < bump_frequency_limits[0]:
@@ -656,20 +664,15 @@ for iwave, wave in enumerate(waves):
                     # Define the pass number
                     passnumber = str(jjj)
 
-                    # Initiate the sampler
+                    # Run the sampler and then the MAP, unless an earlier
+                    # run has already done so
                     dbname1 = os.path.join(pkl_location, 'MCMC.M1.' + passnumber + region_id + obstype)
-                    M1 = pymc.MCMC(pymcmodel1, db='pickle', dbname=dbname1)
-
-                    # Run the sampler
                     print('M1 : pass %i : Running power law plus bump model' % (jjj + 1))
-                    M1.sample(iter=itera, burn=burn, thin=thin, progress_bar=True)
-                    M1.db.close()
-
-                    # Now run the MAP
-                    map_M1 = pymc.MAP(pymcmodel1)
-                    print(' ')
-                    print('M1 : pass %i : fitting to find the maximum likelihood' % (jjj + 1))
-                    map_M1.fit(method='fmin_powell')
+                    map_M1 = fits.run((wave, region, window, obstype, 'M1', passnumber),
+                                      sample_and_fit, pymcmodel1,
+                                      npmodels.Log_splwc_AddExpDecayAutoCor(x, pwr, sigma, normalized_frequency_limits=bump_frequency_limits),
+                                      dbname1, itera, burn, thin)
+                    M1 = load_samples(pymcmodel1, dbname1)
 
                     # Get the variables and the best fit
                     A1 = get_variables_M1(map_M1)
@@ -679,18 +682,20 @@ for iwave, wave in enumerate(waves):
                     write_plots(M1, region_id, obstype, savefig, 'M1', passnumber, bins=40, extra_factors=[xnorm])
 
                     # Get the likelihood at the maximum
-                    #likelihood1_data = map_M1.logp_at_max
-                    l1_data = get_likelihood_M1(map_M1, x, pwr, sigma, tau, obstype)
+                    l1_data = get_likelihood(map_M1)
                     l1_data_logp = get_log_likelihood(pwr, M1_bf, sigma)
 
                     # Get the chi-squared value
                     chi1 = get_chi_M1(map_M1, x, pwr, sigma)
                     print('M1 : pass %i : reduced chi-squared = %f' % (jjj + 1, chi1))
                     print('   : variables ', A1)
+                    print('   : uncertainties ', get_uncertainties(map_M1))
                     print('   : estimate log likelihood = %f' % (l1_data_logp))
 
                 # Store these results
                 fitsummarydata = FitSummary(map_M0, l0_data, chi0, map_M1, l1_data, chi1)
+                comparison_table.add_fitsummary((corename, wave, region, window, obstype),
+                                                passnumber, fitsummarydata).save()
 
                 # Print out these results
                 print ' '
@@ -22,6 +22,7 @@ from statsmodels.graphics.gofplots import qqplot
 import aia_specific
 import pymcmodels3
 import rnspectralmodels
+import rnoptimize
 from paper1 import sunday_name, prettyprint, log_10_product
 from paper1 import csv_timeseries_write, pkl_write, fix_nonfinite, fit_details
 
@@ -296,24 +297,16 @@ def get_variables_M1(m):
 
 
 def curve_fit_M1(x, y, p0, sigma, bump_type, n_attempt_limit=10):
-    p_in = p0
-    n_attempt = 0
-    success = False
-    while (not success) and (n_attempt <= n_attempt_limit):
-        try:
-            if bump_type == 'lognormal':
-                answer = curve_fit(rnspectralmodels.Log_splwc_AddLognormalBump2_CF, x, y, p0=p_in, sigma=sigma)
-            if bump_type == 'normal':
-                answer = curve_fit(rnspectralmodels.Log_splwc_AddNormalBump2_allexp_CF, x, y, p0=p_in, sigma=sigma)
-            success = True
-        except RuntimeError:
-            print 'Model M1 curve fit did not work - try varying parameters a tiny bit'
-            p_in = p0 + 0.1 * np.random.random(size=(6))
-            n_attempt = n_attempt + 1
-            print 'Attempt number: %i' % (n_attempt)
-    if success:
+    if bump_type == 'lognormal':
+        model = rnspectralmodels.Log_splwc_AddLognormalBump2
+    if bump_type == 'normal':
+        model = rnspectralmodels.Log_splwc_AddNormalBump2_allexp
+    try:
+        answer = rnoptimize.multistart_curve_fit(model, x, y, p0, sigma=sigma,
+                                                 nrefine=n_attempt_limit + 1)
         return answer[0]
-    else:
+    except RuntimeError:
+        print 'Model M1 curve fit did not work from any starting point'
         return p0
 
 
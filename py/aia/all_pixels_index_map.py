@@ -0,0 +1,61 @@
+"""
+Specifies a datacube and fits a power law with a constant background to the
+Fourier power in every pixel.  The fit parameters, their uncertainties and
+the goodness of fit are written out as memory-mapped maps.  Re-running this
+program after an interruption resumes the fitting where it stopped.
+"""
+import numpy as np
+from matplotlib import pyplot as plt
+import tsutils
+import os
+from scipy.io import readsav
+import rnspectralmodels
+from rnlimits import limits
+from indexmap import index_map
+
+location = '~/Data/oscillations/mcateer/outgoing3/AR_A.sav'
+maindir = os.path.expanduser(location)
+print('Loading data from ' + maindir)
+idl = readsav(maindir)
+dc = np.swapaxes(np.swapaxes(idl['region_window'], 0, 2), 0, 1)
+
+# Where the maps are stored
+output = os.path.expanduser('~/ts/index_map/AR_A')
+
+# Get some properties of the datacube
+ny = dc.shape[0]
+nx = dc.shape[1]
+nt = dc.shape[2]
+
+# Sample cadence
+dt = 12.0
+
+# Fix the input datacube for any non-finite data and remove the mean
+for i in range(0, nx):
+    for j in range(0, ny):
+        d = tsutils.fix_nonfinite(dc[j, i, :].flatten())
+        dc[j, i, :] = d - np.mean(d)
+
+# Fourier power in each pixel, normalized as in timeseries.TimeSeries
+allfreqs = np.fft.fftfreq(nt, dt)
+posindex = allfreqs > 0
+freqs = allfreqs[posindex]
+pwr = (np.abs(np.fft.fft(dc, axis=2)) ** 2)[:, :, posindex] / (1.0 * nt)
+
+# Fit every pixel
+lower = [limits['power_law_norm'][0],
+         limits['power_law_index'][0],
+         limits['background'][0]]
+upper = [limits['power_law_norm'][1],
+         limits['power_law_index'][1],
+         limits['background'][1]]
+maps = index_map(pwr, freqs, output,
+                 model=rnspectralmodels.power_law_with_constant,
+                 lower=lower, upper=upper)
+
+# Show the power law index map
+plt.figure()
+plt.imshow(maps.parameters[:, :, 1], origin='lower', vmin=lower[1], vmax=upper[1])
+plt.colorbar()
+plt.title('power law index [%8.1f pixels per second]' % (maps.pixels_per_second))
+plt.show()
@@ -0,0 +1,55 @@
+#
+# Program to make a synthetic datacube of spatially correlated red noise,
+# with known power law indices, for testing the analysis at scale.  The
+# cube is written where aia_lstsqr4 looks for datacubes.
+#
+import os
+import aia_specific
+import cubesimulation
+
+# Reproducible
+seed = 1
+
+#
+# Set up the cube
+#
+ldirroot = '~/ts/pickle_cc_final/'
+corename = 'simulated'
+sunlocation = 'disk'
+fits_level = '1.5'
+wave = '171'
+region = 'synthetic'
+
+ny = 512
+nx = 512
+nt = 1800
+dt = 12.0
+
+# Spatial correlation length in pixels, of both the noise and the map of
+# power law indices
+correlation_length = 2.0
+index_correlation_length = 50.0
+
+# Power law index, normalization and background of each pixel
+index = cubesimulation.correlated_map(ny, nx, 2.0, 0.3, index_correlation_length,
+                                      random_state=seed)
+norm = 0.0
+background = -8.0
+
+# Mean value of each time series
+mean = 100.0
+
+#
+# Make the cube
+#
+branches = [corename, sunlocation, fits_level, wave, region]
+locations = aia_specific.save_location_calculator({"pickle": ldirroot}, branches)
+ident = aia_specific.ident_creator(branches)
+filename = os.path.join(locations["pickle"], ident + '.datacube.npy')
+
+print('Writing ' + filename)
+dc = cubesimulation.simulate_datacube(filename, index, norm=norm,
+                                      background=background, nt=nt, dt=dt,
+                                      correlation_length=correlation_length,
+                                      mean=mean, random_state=seed + 1)
+print('Datacube shape ', dc.shape)
@@ -0,0 +1,75 @@
+"""
+Test that a campaign.Campaign runs each unit once and resumes from
+checkpoints.
+"""
+
+import shutil
+import tempfile
+import campaign
+
+
+def counting(calls):
+    def unit(x, checkpoint=None):
+        calls.append(x)
+        return x ** 2
+    return unit
+
+
+def test_units_run_once():
+    directory = tempfile.mkdtemp()
+    try:
+        calls = []
+        c = campaign.Campaign(directory, config={"a": 1, "b": [1, 2]}, verbose=False)
+        assert c.run(('M0', 3), counting(calls), 3) == 9
+        assert c.run(('M0', 3), counting(calls), 3) == 9
+        assert calls == [3]
+
+        # Completed units are found by a new campaign with the same
+        # configuration, whatever the order it is written in
+        c = campaign.Campaign(directory, config={"b": [1, 2], "a": 1}, verbose=False)
+        assert c.done(('M0', 3))
+        assert c.keys() == [('M0', 3)]
+        assert c.results() == {('M0', 3): 9}
+
+        # A different configuration runs the unit again
+        c = campaign.Campaign(directory, config={"a": 2, "b": [1, 2]}, verbose=False)
+        assert not c.done(('M0', 3))
+        assert c.run(('M0', 3), counting(calls), 3) == 9
+        assert calls == [3, 3]
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_checkpoint_resume():
+    # A unit interrupted part way through carries on from its last
+    # checkpoint, and the checkpoint is removed once the unit completes
+    directory = tempfile.mkdtemp()
+    try:
+        c = campaign.Campaign(directory, verbose=False)
+
+        def unit(n, stop=None, checkpoint=None):
+            state = checkpoint.load()
+            done = [] if state is None else state
+            for i in range(len(done), n):
+                if i == stop:
+                    raise KeyboardInterrupt
+                done.append(i)
+                checkpoint.save(done)
+            return done
+
+        try:
+            c.run('unit', unit, 5, stop=3)
+        except KeyboardInterrupt:
+            pass
+        assert c.checkpoint('unit').load() == [0, 1, 2]
+        assert not c.done('unit')
+        assert c.run('unit', unit, 5) == [0, 1, 2, 3, 4]
+        assert c.checkpoint('unit').load() is None
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    test_units_run_once()
+    test_checkpoint_resume()
+    print('ok')
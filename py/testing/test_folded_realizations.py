@@ -0,0 +1,45 @@
+"""
+Test that the time series made from the folded power spectrum have the same
+power as those made from the oversampled power spectrum.
+"""
+
+import numpy as np
+from rnsimulation import SimplePowerLawSpectrum, TimeSeriesRealizations
+
+
+def mean_periodograms(nt, V, W, alpha, nrealizations, seed=1):
+    """Mean periodogram of the time series made both ways"""
+    pls = SimplePowerLawSpectrum([0.0, alpha], nt=nt, dt=12.0)
+    answer = []
+    for folded in (False, True):
+        data = TimeSeriesRealizations(pls, nrealizations, V=V, W=W,
+                                      folded=folded, full_circle=True,
+                                      random_state=seed).sample
+        answer.append(np.mean(np.abs(np.fft.rfft(data, axis=-1)[:, 1:]) ** 2, axis=0))
+    return answer
+
+
+def test_folded_mean_periodogram():
+    nrealizations = 4000
+    for nt, V, W, alpha in [(100, 4, 3, 2.0), (101, 10, 10, 1.5), (64, 2, 5, 3.0)]:
+        oversampled, folded = mean_periodograms(nt, V, W, alpha, nrealizations)
+        ratio = folded / oversampled
+        # Each mean periodogram has a fractional standard error of about
+        # 1/sqrt(nrealizations), a little more at the real Nyquist term
+        assert np.all(np.abs(ratio - 1) < 6 * np.sqrt(2.0 / nrealizations)), ratio
+        assert np.abs(np.mean(ratio) - 1) < 0.02, np.mean(ratio)
+
+
+def test_folded_needs_full_circle():
+    pls = SimplePowerLawSpectrum([0.0, 2.0], nt=100, dt=12.0)
+    try:
+        TimeSeriesRealizations(pls, 10, V=2, W=2, folded=True)
+    except ValueError:
+        return
+    raise AssertionError('folded time series made with half circle phases')
+
+
+if __name__ == '__main__':
+    test_folded_mean_periodogram()
+    test_folded_needs_full_circle()
+    print('ok')
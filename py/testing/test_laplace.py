@@ -0,0 +1,67 @@
+"""
+Test the MAP fits of npmodels and the Laplace approximation of rnlaplace on
+a posterior that is exactly normal.
+"""
+
+import numpy as np
+import npmodels
+import rnlaplace
+from test_sampler import linear_gaussian
+
+
+def test_bounded_map_linear_gaussian():
+    # The MAP values of each spectrum are its least-squares values, and the
+    # Hessian is minus the inverse of the posterior covariance
+    fits = [linear_gaussian(seed=seed) for seed in range(0, 5)]
+    lp = linear_gaussian()[0]
+    lp.power = np.array([fit[0].power for fit in fits])
+    answer = npmodels.bounded_map(lp, start=np.zeros((5, 2)) + [0.0, 1.0])
+    assert np.all(answer["converged"])
+    assert np.all(answer["status"] == 0)
+    for i, (lpi, mean, covariance) in enumerate(fits):
+        assert np.allclose(answer["parameters"][i], mean, rtol=0, atol=1e-6)
+        assert np.allclose(answer["hessian"][i], -np.linalg.inv(covariance), rtol=1e-4)
+        assert np.allclose(answer["logp"][i], lpi.logp(mean))
+
+
+def test_bounded_map_at_limit():
+    # A maximum outside the prior is moved onto the limit
+    lp, mean, covariance = linear_gaussian()
+    lp.upper = np.array([10.0, mean[1] - 0.1])
+    answer = npmodels.bounded_map(lp)
+    assert answer["parameters"][1] == lp.upper[1]
+    assert answer["converged"]
+
+
+def test_laplace_linear_gaussian():
+    # The Laplace approximation of a normal posterior is exact
+    lp, mean, covariance = linear_gaussian()
+    L = rnlaplace.Laplace(lp, nsamples=20000, random_state=1)
+    assert L.converged
+    assert not L.flagged
+    assert np.allclose(L.parameters, mean, rtol=0, atol=1e-6)
+    assert np.allclose(L.covariance, covariance, rtol=1e-4)
+    sd = np.sqrt(np.diag(covariance))
+    assert np.all(np.abs(L.samples.mean(axis=0) - mean) < 4 * sd / np.sqrt(20000))
+    assert np.allclose(np.cov(L.samples.T), covariance, rtol=0.05, atol=0.05 * sd[0] * sd[1])
+    stats = L.stats()
+    for i, name in enumerate(lp.names):
+        assert np.abs(stats[name]['mean'] - mean[i]) < 4 * sd[i] / np.sqrt(20000)
+
+
+def test_laplace_flags_prior_limit():
+    # A posterior cut off by its prior is not normal
+    lp, mean, covariance = linear_gaussian()
+    lp.upper = np.array([10.0, mean[1] + np.sqrt(covariance[1, 1])])
+    L = rnlaplace.Laplace(lp, random_state=1)
+    assert L.flagged
+    assert L.reasons["near prior limit"]
+    assert not L.reasons["not converged"]
+
+
+if __name__ == '__main__':
+    test_bounded_map_linear_gaussian()
+    test_bounded_map_at_limit()
+    test_laplace_linear_gaussian()
+    test_laplace_flags_prior_limit()
+    print('ok')
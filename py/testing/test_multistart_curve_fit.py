@@ -0,0 +1,37 @@
+"""
+Test that the multi-start least-squares fit recovers the parameters of a
+power law with a constant plus an exponentially decaying autocorrelation,
+starting away from the true values.
+"""
+
+import numpy as np
+from scipy.optimize import curve_fit
+import rnoptimize
+import rnspectralmodels
+
+
+def test_recover_splwc_AddExpDecayAutocor():
+    f = np.arange(1, 451) / (900 * 12.0)
+    true = np.array([0.0, 2.5, -12.0, -6.0, 0.01, 4.0])
+    sigma = 0.3 * np.ones(f.size)
+    model = rnspectralmodels.Log_splwc_AddExpDecayAutocor
+    for seed in range(0, 10):
+        random_state = np.random.RandomState(seed)
+        y = model(f, true) + sigma * random_state.standard_normal(f.size)
+        popt, pcov = rnoptimize.multistart_curve_fit(model, f, y, true + 0.2,
+                                                     sigma=sigma,
+                                                     random_state=seed)
+        assert np.all(np.isfinite(pcov)), seed
+
+        # The least-squares fit found by starting at the true values
+        ptrue = curve_fit(lambda x, *a: model(x, np.asarray(a)), f, y,
+                          p0=true, sigma=sigma)[0]
+        chi2 = np.sum(((y - model(f, popt)) / sigma) ** 2)
+        chi2_ptrue = np.sum(((y - model(f, ptrue)) / sigma) ** 2)
+        assert chi2 <= chi2_ptrue * (1.0 + 1e-6), (seed, chi2, chi2_ptrue)
+        assert np.allclose(popt, ptrue, rtol=1e-3, atol=1e-2), (seed, popt, ptrue)
+
+
+if __name__ == '__main__':
+    test_recover_splwc_AddExpDecayAutocor()
+    print('ok')
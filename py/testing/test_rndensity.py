@@ -0,0 +1,61 @@
+"""
+Test the gridded densities of rndensity against the densities they tabulate.
+"""
+
+import numpy as np
+from scipy.stats import gaussian_kde, kstest, norm
+import rndensity
+
+
+def bimodal(n=500, seed=1):
+    random_state = np.random.RandomState(seed)
+    return np.concatenate((random_state.normal(2.0, 0.5, size=n),
+                           random_state.normal(5.0, 1.0, size=n)))
+
+
+def test_kernel_density_logp():
+    # The tabulated density matches the kernel density estimate wherever
+    # the density is not negligible
+    dataset = bimodal()
+    kde = gaussian_kde(dataset)
+    density = rndensity.kernel_density(dataset, rtol=1e-3)
+    x = np.linspace(density.lower, density.upper, 3001)
+    exact = kde(x)
+    significant = exact > 1e-3 * np.max(exact)
+    error = np.abs(np.exp(density.logp(x)) - exact)[significant] / exact[significant]
+    assert np.max(error) < 2e-3, np.max(error)
+    assert np.all(density.logp([density.lower - 0.1, density.upper + 0.1]) == -np.inf)
+
+
+def test_kernel_density_random():
+    # Draws follow the kernel density estimate
+    dataset = bimodal()
+    kde = gaussian_kde(dataset)
+    density = rndensity.kernel_density(dataset)
+    draws = density.random(size=2000, random_state=np.random.RandomState(2))
+
+    def cdf(x):
+        return np.array([kde.integrate_box_1d(-np.inf, v) for v in np.atleast_1d(x)])
+    assert kstest(draws, cdf)[1] > 0.01
+
+
+def test_truncated_normal():
+    # A density is truncated at the bounds of its grid
+    density = rndensity.GriddedDensity(norm.pdf, 0.0, 3.0)
+    x = np.linspace(0.0, 3.0, 101)
+    expected = norm.logpdf(x) - np.log(norm.cdf(3.0) - 0.5)
+    assert np.allclose(density.logp(x), expected, atol=2e-3)
+    assert np.allclose(density.dlogp(x[1:-1]), -x[1:-1], atol=0.02)
+    draws = density.random(size=5000, random_state=np.random.RandomState(3))
+    assert np.all((draws >= 0.0) & (draws <= 3.0))
+
+    def cdf(x):
+        return (norm.cdf(x) - 0.5) / (norm.cdf(3.0) - 0.5)
+    assert kstest(draws, cdf)[1] > 0.01
+
+
+if __name__ == '__main__':
+    test_kernel_density_logp()
+    test_kernel_density_random()
+    test_truncated_normal()
+    print('ok')
@@ -0,0 +1,111 @@
+"""
+Test the lock-step Metropolis sampler of rnsampler.
+"""
+
+import numpy as np
+import npmodels
+import rnsampler
+import rnspectralmodels
+
+
+def standard_normal(x):
+    return -0.5 * np.sum(x ** 2, axis=-1)
+
+
+def linear_gaussian(seed=1, sigma=0.5):
+    """
+    A power law observed in log power with Gaussian noise.  The log power
+    is linear in the parameters, so with wide uniform priors the posterior
+    is the normal distribution of ordinary least squares.
+    """
+    f = np.arange(1, 101) * 0.001
+    logx = np.log(f / f[0])
+    random_state = np.random.RandomState(seed)
+    power = 1.0 - 1.5 * logx + sigma * random_state.standard_normal(size=f.size)
+    lp = npmodels.LogPosterior(['power_law_norm', 'power_law_index'],
+                               [-10.0, -5.0], [10.0, 5.0],
+                               rnspectralmodels.PowerLaw(f), power, sigma,
+                               init=[0.0, 1.0])
+    X = np.transpose([np.ones(f.size), -logx])
+    covariance = sigma ** 2 * np.linalg.inv(np.dot(X.T, X))
+    mean = np.dot(covariance, np.dot(X.T, power)) / sigma ** 2
+    return lp, mean, covariance
+
+
+def test_metropolis_linear_gaussian():
+    # The samples have the mean and covariance of the exact posterior, and
+    # the chains agree with each other
+    lp, mean, covariance = linear_gaussian()
+    M = rnsampler.MCMC(lp, random_state=2).sample(20000, burn=5000, nchains=4)
+    samples = M.samples()
+    sd = np.sqrt(np.diag(covariance))
+    diagnostics = M.diagnostics()
+    ess = np.array([diagnostics[name]["ESS"] for name in lp.names])
+    rhat = np.array([diagnostics[name]["R-hat"] for name in lp.names])
+    assert np.all(rhat < 1.01), rhat
+    assert np.all(ess > 2000), ess
+    assert np.all(np.abs(samples.mean(axis=0) - mean) < 4 * sd / np.sqrt(ess))
+    assert np.allclose(np.cov(samples.T), covariance, rtol=0.1, atol=0.1 * sd[0] * sd[1])
+    stats = M.stats()
+    for i, name in enumerate(lp.names):
+        assert np.abs(stats[name]['mean'] - mean[i]) < 4 * sd[i] / np.sqrt(ess[i])
+
+
+def test_effective_sample_size_ar1():
+    # Chains of an AR(1) process with coefficient rho have an effective
+    # sample size of n (1 - rho) / (1 + rho)
+    rho, n, m = 0.9, 20000, 4
+    random_state = np.random.RandomState(3)
+    e = random_state.standard_normal(size=(n, m, 1)) * np.sqrt(1 - rho ** 2)
+    x = np.zeros((n, m, 1))
+    x[0] = random_state.standard_normal(size=(m, 1))
+    for i in range(1, n):
+        x[i] = rho * x[i - 1] + e[i]
+    expected = n * m * (1 - rho) / (1 + rho)
+    ess = rnsampler.effective_sample_size(x)
+    assert np.abs(ess[0] / expected - 1) < 0.2, (ess, expected)
+
+
+def test_gelman_rubin():
+    # Chains sampling the same distribution have R-hat close to one.
+    # Chains sampling different distributions do not.
+    random_state = np.random.RandomState(4)
+    x = random_state.standard_normal(size=(5000, 4, 2))
+    assert np.all(np.abs(rnsampler.gelman_rubin(x) - 1) < 0.01)
+    x[:, 0, :] = x[:, 0, :] + 3.0
+    assert np.all(rnsampler.gelman_rubin(x) > 1.2)
+
+
+def test_ess_budget():
+    # The burn-in uses at most half of the budget, and the budget is never
+    # exceeded
+    start = np.zeros((4, 2)) + 5.0
+    for max_iter, block in ((3000, 5000), (20000, 3000), (7000, 2000)):
+        answer = rnsampler.ess_targeted_metropolis(standard_normal, start, 1e6, max_iter,
+                                                   block=block, tune_interval=500,
+                                                   random_state=np.random.RandomState(1))
+        assert answer["burn"] <= max_iter // 2, (max_iter, block, answer["burn"])
+        assert answer["iter"] == max_iter, (max_iter, block, answer["iter"])
+        assert answer["trace"].shape == (max_iter - answer["burn"], 4, 2)
+        assert np.all(answer["ess"] > 0)
+        assert not answer["converged"]
+
+
+def test_ess_budget_too_small():
+    # Half of the budget cannot cover one tuning interval
+    try:
+        rnsampler.ess_targeted_metropolis(standard_normal, np.zeros((4, 2)), 1000, 3000,
+                                          block=5000, tune_interval=1000)
+    except ValueError:
+        pass
+    else:
+        raise AssertionError('no ValueError raised')
+
+
+if __name__ == '__main__':
+    test_metropolis_linear_gaussian()
+    test_effective_sample_size_ar1()
+    test_gelman_rubin()
+    test_ess_budget()
+    test_ess_budget_too_small()
+    print('ok')
@@ -0,0 +1,62 @@
+"""
+Test the posterior predictive calibration of the likelihood ratio test
+statistic.  A power law M0 is nested inside a power law with curvature M1,
+which reduces to M0 when the curvature is zero.  The log power spectra have
+Gaussian noise and both models are linear in their parameters, so under M0
+the statistic T_LRT has a chi-squared distribution with one degree of
+freedom.
+"""
+
+import numpy as np
+import npmodels
+import rnlaplace
+import rnppcheck
+import rnspectralmodels
+
+
+class CurvedPowerLaw(rnspectralmodels.SpectralModel):
+    def power(self, a):
+        a = rnspectralmodels.arrange_parameters(a)
+        return np.exp(a[0] - a[1] * self.logx + a[2] * self.logx ** 2)
+
+
+def power_law(f, power, sigma, init=None):
+    return npmodels.LogPosterior(['power_law_norm', 'power_law_index'],
+                                 [-10.0, -1.0], [10.0, 6.0],
+                                 rnspectralmodels.PowerLaw(f), power, sigma,
+                                 init=init)
+
+
+def curved_power_law(f, power, sigma, init=None):
+    return npmodels.LogPosterior(['power_law_norm', 'power_law_index', 'curvature'],
+                                 [-10.0, -1.0, -5.0], [10.0, 6.0, 5.0],
+                                 CurvedPowerLaw(f), power, sigma, init=init)
+
+
+def test_t_lrt_chi2():
+    random_state = np.random.RandomState(1)
+    f = np.arange(1, 150) / 1800.0
+    sigma = 0.5 * np.ones(f.size)
+    true = np.array([np.log(10.0), 2.0])
+    power = np.log(rnspectralmodels.power_law(f, true)) + sigma * random_state.standard_normal(f.size)
+
+    lp0 = power_law(f, power, sigma, init=true)
+    laplace = rnlaplace.Laplace(lp0, nsamples=4000, random_state=random_state)
+    answer = rnppcheck.t_lrt_distribution(lp0, laplace.samples, power_law, curved_power_law,
+                                          laplace.parameters, np.append(laplace.parameters, 0.0),
+                                          nsample=4000, observed=3.841,
+                                          random_state=random_state)
+    t_lrt = answer["t_lrt"][answer["good"]]
+    assert np.all(answer["converged0"]) and np.all(answer["converged1"])
+    assert np.mean(answer["good"]) > 0.99
+    # Mean 1 and variance 2, with standard errors of about 0.02 and 0.1
+    assert np.abs(np.mean(t_lrt) - 1.0) < 0.1, np.mean(t_lrt)
+    assert np.abs(np.var(t_lrt) - 2.0) < 0.5, np.var(t_lrt)
+    # 5% of a chi-squared distribution with one degree of freedom lies
+    # above 3.841
+    assert np.abs(answer["p_value"] - 0.05) < 0.015, answer["p_value"]
+
+
+if __name__ == '__main__':
+    test_t_lrt_chi2()
+    print('ok')
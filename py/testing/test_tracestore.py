@@ -0,0 +1,88 @@
+"""
+Test that traces written to a tracestore.TraceStore read back unchanged.
+"""
+
+import os
+import shutil
+import tempfile
+import numpy as np
+import rnsampler
+import tracestore
+from test_sampler import linear_gaussian
+
+
+def round_trip(compress):
+    directory = tempfile.mkdtemp()
+    try:
+        random_state = np.random.RandomState(1)
+        names = ['a', 'b', 'c']
+        chunks = [random_state.standard_normal(size=(n, 2, 3)) for n in (50, 20)]
+        logps = [random_state.standard_normal(size=(n, 2)) for n in (50, 20)]
+        store = tracestore.TraceStore(os.path.join(directory, 'store'), names=names,
+                                      compress=compress, description={"seed": 1})
+        for trace, logp in zip(chunks, logps):
+            store.append(trace, logp=logp)
+
+        # Read back through a new store object, as a later run would
+        store = tracestore.TraceStore(os.path.join(directory, 'store'))
+        trace = np.concatenate(chunks)
+        assert store.names == names
+        assert store.meta["description"] == {"seed": 1}
+        assert len(store) == 70
+        for i, name in enumerate(names):
+            assert np.array_equal(store.column(name), trace[:, :, i])
+            # Chains concatenated, as rnsampler.MCMC.trace returns them
+            assert np.array_equal(store.trace(name), np.concatenate((trace[:, 0, i], trace[:, 1, i])))
+        assert np.array_equal(store.column('logp'), np.concatenate(logps))
+        assert store.trace().shape == (140, 3)
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_round_trip_compressed():
+    round_trip(True)
+
+
+def test_round_trip_uncompressed():
+    round_trip(False)
+
+
+def test_different_parameters():
+    # A store cannot be reopened with other parameters
+    directory = tempfile.mkdtemp()
+    try:
+        tracestore.TraceStore(directory, names=['a', 'b'])
+        try:
+            tracestore.TraceStore(directory, names=['a', 'c'])
+        except ValueError:
+            pass
+        else:
+            raise AssertionError('no ValueError raised')
+    finally:
+        shutil.rmtree(directory)
+
+
+def test_save_mcmc():
+    # The stored samples give the same statistics as the sampler
+    lp, mean, covariance = linear_gaussian()
+    M = rnsampler.MCMC(lp, random_state=2).sample(2000, burn=1000, nchains=2)
+    directory = tempfile.mkdtemp()
+    try:
+        store = tracestore.save(M, os.path.join(directory, 'store'))
+        for name in lp.names:
+            assert np.array_equal(store.trace(name), M.trace(name))
+        assert np.array_equal(store.column('logp'), M.results["logp"])
+        stats = store.stats(lp)
+        mstats = M.stats()
+        for name in lp.names + ['fourier_power_spectrum']:
+            assert np.allclose(stats[name]['mean'], mstats[name]['mean'])
+    finally:
+        shutil.rmtree(directory)
+
+
+if __name__ == '__main__':
+    test_round_trip_compressed()
+    test_round_trip_uncompressed()
+    test_different_parameters()
+    test_save_mcmc()
+    print('ok')
@@ -0,0 +1,65 @@
+"""
+Test the batched Whittle likelihood fits against a general purpose minimizer.
+"""
+
+import numpy as np
+from scipy.optimize import minimize
+import rnspectralmodels
+import rnwhittle
+
+
+def periodograms(model, f, a, nspectra, random_state):
+    # The periodogram is S * chi-squared(2) / 2 at each frequency
+    return model(f, a) * random_state.chisquare(2, size=(nspectra, f.size)) / 2.0
+
+
+def nelder_mead(function, x0):
+    return minimize(function, x0, method='Nelder-Mead',
+                    options={'xatol': 1e-10, 'fatol': 1e-12,
+                             'maxiter': 20000, 'maxfev': 40000})
+
+
+def test_power_law_with_constant():
+    random_state = np.random.RandomState(1)
+    model = rnspectralmodels.power_law_with_constant
+    f = np.arange(1, 301) / 3600.0
+    true = np.array([0.0, 2.0, -5.0])
+    power = periodograms(model, f, true, 20, random_state)
+    answer = rnwhittle.fit(model, f, power, true + 0.5)
+    assert np.all(answer["converged"])
+    assert np.all(answer["status"] == 0)
+    for i in range(0, power.shape[0]):
+        def nll(a):
+            return -rnwhittle.whittle_loglike(power[i], model(f, a))
+        best = nelder_mead(nll, answer["parameters"][i])
+        assert np.abs(answer["loglike"][i] + best.fun) < 1e-5, i
+        # The same parameters to within a small fraction of their errors
+        error = np.sqrt(np.diagonal(answer["covariance"][i]))
+        assert np.all(np.abs(answer["parameters"][i] - best.x) < 0.01 * error), i
+
+
+def test_double_broken_power_law_converged():
+    # Fits reported as converged are at a maximum of the likelihood.  The
+    # model is not continuous at the break, so the location of the break is
+    # held fixed when the fit is refined.
+    random_state = np.random.RandomState(1)
+    model = rnspectralmodels.double_broken_power_law_with_constant
+    f = np.arange(1, 301) / 3600.0
+    true = np.array([0.0, 1.5, -4.0, np.log(f[60]), 3.0])
+    power = periodograms(model, f, true, 40, random_state)
+    answer = rnwhittle.fit(model, f, power, true + np.array([0.3, -0.3, 0.3, 0.2, -0.3]))
+    assert np.all(answer["converged"] == (answer["status"] == 0))
+    assert np.sum(answer["converged"]) >= 20
+    for i in np.flatnonzero(answer["converged"]):
+        a = answer["parameters"][i]
+
+        def nll(b):
+            return -rnwhittle.whittle_loglike(power[i], model(f, np.insert(b, 3, a[3])))
+        best = nelder_mead(nll, np.delete(a, 3))
+        assert -answer["loglike"][i] - best.fun < 1e-3, (i, -answer["loglike"][i] - best.fun)
+
+
+if __name__ == '__main__':
+    test_power_law_with_constant()
+    test_double_broken_power_law_converged()
+    print('ok')
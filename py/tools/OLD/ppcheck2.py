@@ -1,6 +1,9 @@
 import numpy as np
+import multiprocessing
 from rnsimulation import SimplePowerLawSpectrumWithConstantBackground
 from rnfit2 import Do_MCMC
+import rnstatistics
+import rnrandom
 from pymcmodels import single_power_law_with_constant_not_normalized
 from matplotlib import pyplot as plt
 
@@ -34,10 +37,52 @@ Returns a test statistic used to compare nested models."""
     return -2 * (logp_model1 - logp_model2)
 
 
+def _map_fit(args):
+    """Find the MAP values of the power law with constant fit to one
+    posterior predictive spectrum"""
+    frequencies, S, pymcmodel, estimate, backend = args
+    analysis2 = Do_MCMC(([frequencies, S],)).okgo(pymcmodel, estimate=estimate,
+                                                  MAP_only=True, backend=backend)
+    mp2 = analysis2.mp
+    return [mp2.power_law_norm.value,
+            mp2.power_law_index.value,
+            mp2.background.value]
+
+
 def posterior_predictive_distribution(ts, M, estimate,
                                       nsample=1000,
                                       statistic=('vaughan_2010_T_R', 'vaughan_2010_T_SSE'),
-                                      verbose=True):
+                                      verbose=True,
+                                      MAP_only=False,
+                                      pymcmodel=single_power_law_with_constant_not_normalized,
+                                      backend='pymc',
+                                      processes=None,
+                                      random_state=np.random):
+    """
+    Distribution of test statistics of the posterior predictive spectra.
+
+    By default each posterior predictive spectrum is analyzed with a full
+    Do_MCMC run.  With MAP_only=True only the MAP values are found.  This
+    skips the sampling, and the fits can be spread over a pool of
+    'processes' worker processes.  The MAP values, best fit spectra and
+    statistics are computed exactly as in the MAP step of a full run, and
+    the distribution is returned in the same form.  With backend='numpy'
+    the MAP values are found with the bounded optimizer of npmodels, and
+    pymcmodel must be an npmodels model of (frequencies, power, estimate).
+    The posterior samples are chosen with random_state, a seed, RandomState
+    or Generator, see rnrandom.get_random_state.
+    """
+    random_state = rnrandom.get_random_state(random_state)
+    if MAP_only:
+        return _posterior_predictive_distribution_MAP(ts, M, estimate,
+                                                      nsample=nsample,
+                                                      statistic=statistic,
+                                                      verbose=verbose,
+                                                      pymcmodel=pymcmodel,
+                                                      backend=backend,
+                                                      processes=processes,
+                                                      random_state=random_state)
+
     # Get some properties of the original time series
     nt = ts.SampleTimes.nt
     dt = ts.SampleTimes.dt
@@ -55,7 +100,7 @@ def posterior_predictive_distribution(ts, M, estimate,
             print('Sample number %i out of %i' % (i + 1, nsample))
 
         # get a random sample from the posterior
-        r = np.random.randint(0, nposterior)
+        r = rnrandom.integers(random_state, 0, nposterior)
 
         # Get a posterior power spectrum
         S = M.trace("predictive")[r]
@@ -64,7 +109,7 @@ def posterior_predictive_distribution(ts, M, estimate,
         this2 = ([ts.PowerSpectrum.frequencies.positive, S],)
 
         # Analyze using MCMC
-        analysis2 = Do_MCMC(this2).okgo(single_power_law_with_constant_not_normalized, estimate=estimate,
+        analysis2 = Do_MCMC(this2).okgo(pymcmodel, estimate=estimate,
                                  iter=50000, burn=1000, thin=5,
                                     progress_bar=False)
 
@@ -98,3 +143,51 @@ def posterior_predictive_distribution(ts, M, estimate,
                                                        best_fit_power_spectrum2))
             print k, calculate_statistic(k, S, best_fit_power_spectrum2)
     return distribution
+
+
+def _posterior_predictive_distribution_MAP(ts, M, estimate, nsample=1000,
+                                           statistic=('vaughan_2010_T_R', 'vaughan_2010_T_SSE'),
+                                           verbose=True,
+                                           pymcmodel=single_power_law_with_constant_not_normalized,
+                                           backend='pymc',
+                                           processes=None,
+                                           random_state=np.random):
+    """MAP only version of posterior_predictive_distribution"""
+    # Get some properties of the original time series
+    nt = ts.SampleTimes.nt
+    dt = ts.SampleTimes.dt
+    frequencies = ts.PowerSpectrum.frequencies.positive
+
+    # Storage for the distribution results
+    distribution = {k: [] for k in statistic}
+
+    # Posterior predictive spectra from random samples of the posterior
+    nposterior = M.trace("power_law_index")[:].size
+    predictive = M.trace("predictive")
+    spectra = [predictive[rnrandom.integers(random_state, 0, nposterior)] for i in range(0, nsample)]
+
+    # MAP values of the fit to each spectrum
+    jobs = [(frequencies, S, pymcmodel, estimate, backend) for S in spectra]
+    if processes is None:
+        maps = [_map_fit(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes=processes)
+        try:
+            maps = pool.map(_map_fit, jobs)
+        finally:
+            pool.close()
+            pool.join()
+
+    # Best fit spectra
+    fits = np.asarray([SimplePowerLawSpectrumWithConstantBackground(m, nt=nt, dt=dt).power() for m in maps])
+
+    # Values of the test statistics of all the spectra at once
+    values = rnstatistics.statistics(np.asarray(spectra), fits, names=statistic)
+    for k in statistic:
+        distribution[k] = list(values[k])
+    if verbose:
+        for i in range(0, nsample):
+            print('Sample number %i out of %i' % (i + 1, nsample))
+            for k in statistic:
+                print k, distribution[k][i]
+    return distribution
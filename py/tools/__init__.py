@@ -10,6 +10,23 @@ import pymcmodels2
 import rnfit2
 import rnsimulation
 import rnspectralmodels
+import rnwhittle
+import rnoptimize
+import indexmap
+import npmodels
+import rnlimits
+import rndensity
+import rnsampler
+import tracestore
+import cubesimulation
+import rnlaplace
+import campaign
+import rnprofile
+import rnrandom
+import rnppcheck
+import rnstatistics
+import modelcomparison
 import tssimulation
 import timeseries
 import ppcheck2
+import montecarlo
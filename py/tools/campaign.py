@@ -0,0 +1,176 @@
+"""
+Run long campaigns of analyses that can be interrupted and resumed.
+
+A campaign is made of units of work, for example one model fitted to one
+region at one wavelength.  Each unit is identified by a key, a tuple such
+as (wave, region, window, obstype, model, passnumber).  When a unit
+finishes its output is stored in the campaign directory together with a
+hash of the configuration it was run with.  Running the campaign again
+returns the stored outputs of the completed units straight away, so an
+interrupted campaign resumes where it stopped and a rerun with unchanged
+inputs goes straight to the reporting.  Units that are part way through can
+save their state with a Checkpoint.
+
+The campaign directory contains
+
+    units/<unit hash>.pickle       : key, configuration hash and output of
+                                     each completed unit
+    checkpoints/<unit hash>.pickle : latest saved state of units in progress
+"""
+
+import os
+import pickle
+import hashlib
+
+
+def config_hash(config):
+    """
+    A hash of a configuration.  Dictionaries are hashed in key order, so
+    the hash does not depend on the order the configuration was built in.
+    """
+    return hashlib.sha1(_canonical(config).encode('utf-8')).hexdigest()
+
+
+def _canonical(obj):
+    if isinstance(obj, dict):
+        return '{' + ','.join([_canonical(k) + ':' + _canonical(obj[k]) for k in sorted(obj.keys(), key=repr)]) + '}'
+    if isinstance(obj, (list, tuple)):
+        return '(' + ','.join([_canonical(v) for v in obj]) + ')'
+    if hasattr(obj, 'tolist'):
+        # numpy arrays and scalars
+        return _canonical(obj.tolist())
+    return repr(obj)
+
+
+def _write_pickle(filename, obj):
+    # Write then rename so an interruption never leaves a partial file
+    tmp = filename + '.tmp'
+    f = open(tmp, 'wb')
+    pickle.dump(obj, f, protocol=pickle.HIGHEST_PROTOCOL)
+    f.close()
+    os.rename(tmp, filename)
+
+
+def _read_pickle(filename):
+    f = open(filename, 'rb')
+    obj = pickle.load(f)
+    f.close()
+    return obj
+
+
+class Checkpoint:
+    def __init__(self, filename, interval=1):
+        """
+        Saved state of a unit of work that is in progress.
+
+        Parameters
+        ----------
+        filename : str
+            where the state is saved
+        interval : int
+            only every interval-th call to save writes to disk
+        """
+        self.filename = filename
+        self.interval = interval
+        self.ncalls = 0
+
+    def load(self):
+        """The last saved state, or None if there is none"""
+        if os.path.isfile(self.filename):
+            return _read_pickle(self.filename)
+        return None
+
+    def save(self, state):
+        """Save the state of the unit"""
+        self.ncalls = self.ncalls + 1
+        if self.ncalls % self.interval == 0:
+            _write_pickle(self.filename, state)
+
+    def clear(self):
+        """Remove the saved state once the unit is complete"""
+        if os.path.isfile(self.filename):
+            os.remove(self.filename)
+
+
+class Campaign:
+    def __init__(self, directory, config=None, verbose=True):
+        """
+        Parameters
+        ----------
+        directory : str
+            where the outputs and checkpoints are stored
+        config : object
+            the configuration of the campaign, typically a dictionary of
+            the settings that change the results.  Units completed with a
+            different configuration are run again.
+        """
+        self.directory = os.path.expanduser(directory)
+        self.config = config
+        self.hash = config_hash(config)
+        self.verbose = verbose
+        for sub in ('units', 'checkpoints'):
+            d = os.path.join(self.directory, sub)
+            if not os.path.isdir(d):
+                os.makedirs(d)
+
+    def _unit_hash(self, key):
+        return config_hash(key)
+
+    def _unit_file(self, key):
+        return os.path.join(self.directory, 'units', self._unit_hash(key) + '.pickle')
+
+    def checkpoint(self, key, interval=1):
+        """The Checkpoint of a unit of work"""
+        return Checkpoint(os.path.join(self.directory, 'checkpoints', self._unit_hash(key) + '.pickle'),
+                          interval=interval)
+
+    def done(self, key):
+        """Whether a unit has been completed with the current configuration"""
+        filename = self._unit_file(key)
+        if not os.path.isfile(filename):
+            return False
+        return _read_pickle(filename)["config_hash"] == self.hash
+
+    def output(self, key):
+        """The stored output of a completed unit"""
+        return _read_pickle(self._unit_file(key))["output"]
+
+    def record(self, key, output):
+        """Store the output of a completed unit"""
+        _write_pickle(self._unit_file(key), {"key": key,
+                                             "config_hash": self.hash,
+                                             "output": output})
+        self.checkpoint(key).clear()
+
+    def run(self, key, function, *args, **kwargs):
+        """
+        Return the output of a unit of work, running it only if it has not
+        already been completed with the current configuration.  The
+        function is called as function(*args, checkpoint=Checkpoint,
+        **kwargs) so that it can save and restore its own progress.
+        """
+        if self.done(key):
+            if self.verbose:
+                print('Campaign: %s already done' % (str(key)))
+            return self.output(key)
+        if self.verbose:
+            print('Campaign: running %s' % (str(key)))
+        kwargs["checkpoint"] = self.checkpoint(key)
+        output = function(*args, **kwargs)
+        self.record(key, output)
+        return output
+
+    def keys(self):
+        """Keys of all the units completed with the current configuration"""
+        keys = []
+        d = os.path.join(self.directory, 'units')
+        for filename in sorted(os.listdir(d)):
+            if filename.endswith('.pickle'):
+                unit = _read_pickle(os.path.join(d, filename))
+                if unit["config_hash"] == self.hash:
+                    keys.append(unit["key"])
+        return keys
+
+    def results(self):
+        """Outputs of all the units completed with the current configuration"""
+        return dict([(key, self.output(key)) for key in self.keys()])
@@ -0,0 +1,202 @@
+"""
+Synthetic datacubes of spatially correlated red noise.
+
+A cube [ny, nx, nt] is made by Fourier synthesis in three dimensions.  At
+each temporal Fourier frequency the complex noise is correlated in space by
+filtering white noise with a Gaussian in the spatial Fourier domain, so that
+the correlation between two pixels a distance r apart is
+
+    exp(-r^2 / (2 correlation_length^2))
+
+The noise of each pixel is then scaled by the square root of that pixel's
+power spectrum, a power law with a constant background as in
+rnspectralmodels.power_law_with_constant, and transformed to a time series
+with an inverse real FFT.  The power law index, normalization and
+background of every pixel are given as maps, so the true values are known
+when the cube is analyzed.
+
+The cube is written to a .npy file that cubetools.get_datacube opens as a
+memory map.  The work is done in blocks of frequencies and then in blocks of
+rows, so cubes much larger than the memory can be made.  The spatial
+correlation is periodic across the edges of the cube.
+"""
+
+import os
+import tempfile
+import numpy as np
+import rnspectralmodels
+import rnrandom
+
+# Largest number of values held in memory by one block
+max_block_size = 2 ** 24
+
+
+def correlation_filter(ny, nx, correlation_length):
+    """
+    Gaussian filter in the spatial Fourier domain that gives white noise of
+    unit variance the correlation exp(-r^2 / (2 correlation_length^2)) and
+    keeps its variance at one.  A correlation length of zero leaves the
+    noise white.
+
+    Returns
+    -------
+    ndarray[ny, nx]
+    """
+    if correlation_length <= 0:
+        return np.ones((ny, nx))
+    ky = np.fft.fftfreq(ny)[:, np.newaxis]
+    kx = np.fft.fftfreq(nx)[np.newaxis, :]
+    # The filter is the transform of a Gaussian kernel of standard deviation
+    # correlation_length / sqrt(2), whose autocorrelation has standard
+    # deviation correlation_length
+    H = np.exp(-np.pi ** 2 * correlation_length ** 2 * (ky ** 2 + kx ** 2))
+    return H / np.sqrt(np.mean(H ** 2))
+
+
+def correlated_noise(shape, correlation_length, complex_values=False,
+                     random_state=np.random):
+    """
+    Gaussian noise of unit variance, correlated in the first two dimensions.
+
+    Parameters
+    ----------
+    shape : tuple
+        (ny, nx) or (ny, nx, n).  Each of the n planes is independent.
+    correlation_length : float
+        in pixels
+    complex_values : bool
+        if True the noise is complex, with independent real and imaginary
+        parts of variance 1/2
+    random_state : numpy.random.RandomState or Generator
+        source of random numbers
+
+    Returns
+    -------
+    ndarray of the given shape
+    """
+    def plane():
+        w = random_state.standard_normal(size=shape[0:2])
+        if complex_values:
+            w = (w + 1j * random_state.standard_normal(size=shape[0:2])) / np.sqrt(2.0)
+        return w
+
+    # The planes are drawn one after another, so the noise does not depend
+    # on how many planes are made at once
+    if len(shape) > 2:
+        w = np.concatenate([plane()[:, :, np.newaxis] for j in range(0, shape[2])], axis=2)
+    else:
+        w = plane()
+    H = correlation_filter(shape[0], shape[1], correlation_length)
+    if len(shape) > 2:
+        H = H[:, :, np.newaxis]
+    filtered = np.fft.ifft2(np.fft.fft2(w, axes=(0, 1)) * H, axes=(0, 1))
+    if complex_values:
+        return filtered
+    return np.real(filtered)
+
+
+def correlated_map(ny, nx, mean, sd, correlation_length, random_state=np.random):
+    """A smooth random map, for example of power law indices, with the given
+    mean, standard deviation and correlation length"""
+    random_state = rnrandom.get_random_state(random_state)
+    return mean + sd * correlated_noise((ny, nx), correlation_length,
+                                        random_state=random_state)
+
+
+def simulate_datacube(filename, index, norm=0.0, background=-10.0, nt=300,
+                      dt=12.0, correlation_length=0.0, mean=0.0,
+                      dtype=np.float32, block=None, random_state=np.random):
+    """
+    Write a cube [ny, nx, nt] of spatially correlated red noise.
+
+    Parameters
+    ----------
+    filename : str
+        the .npy file the cube is written to.  The parameters of the cube
+        are saved next to it, in filename with '.parameters.npz' in place of
+        '.npy'.
+    index : ndarray[ny, nx]
+        power law index of each pixel
+    norm : float or ndarray[ny, nx]
+        natural logarithm of the power law normalization at the lowest
+        non-zero frequency
+    background : float or ndarray[ny, nx]
+        natural logarithm of the constant background power
+    nt : int
+        number of times
+    dt : float
+        cadence
+    correlation_length : float
+        spatial correlation length of the noise in pixels
+    mean : float or ndarray[ny, nx]
+        added to every time series
+    dtype : numpy dtype
+        type of the values written
+    block : int
+        number of frequencies, and then of rows, done at once.  By default
+        as many as keep a block below max_block_size values.
+    random_state : seed, numpy.random.RandomState or Generator
+        source of random numbers, see rnrandom.get_random_state
+
+    Returns
+    -------
+    numpy.memmap[ny, nx, nt]
+        the cube, open for reading
+    """
+    random_state = rnrandom.get_random_state(random_state)
+    filename = os.path.expanduser(filename)
+    index = np.asarray(index, dtype=np.float64)
+    ny, nx = index.shape
+    norm = np.broadcast_to(norm, (ny, nx))
+    background = np.broadcast_to(background, (ny, nx))
+    mean = np.broadcast_to(mean, (ny, nx))
+
+    # Fourier frequencies of the time series, zero frequency excluded
+    nf = nt // 2
+    f = np.arange(1, nf + 1) / (1.0 * nt * dt)
+
+    # Temporary store of the spatially correlated noise at each frequency
+    directory = os.path.dirname(os.path.abspath(filename))
+    handle, noisefile = tempfile.mkstemp(suffix='.npy', dir=directory)
+    os.close(handle)
+    try:
+        noise = np.lib.format.open_memmap(noisefile, mode='w+',
+                                          dtype=np.complex128, shape=(ny, nx, nf))
+        nblock = block or max(1, max_block_size // (ny * nx))
+        for start in range(0, nf, nblock):
+            n = min(nblock, nf - start)
+            noise[:, :, start:start + n] = correlated_noise((ny, nx, n),
+                                                            correlation_length,
+                                                            complex_values=True,
+                                                            random_state=random_state)
+        if nt % 2 == 0:
+            # The Nyquist term is real
+            noise[:, :, nf - 1] = np.sqrt(2.0) * np.real(noise[:, :, nf - 1])
+        noise.flush()
+
+        # Scale by the power spectrum of each pixel and transform to time,
+        # a block of rows at a time
+        cube = np.lib.format.open_memmap(filename, mode='w+', dtype=dtype,
+                                         shape=(ny, nx, nt))
+        nrows = block or max(1, max_block_size // (nx * nt))
+        for start in range(0, ny, nrows):
+            rows = slice(start, min(ny, start + nrows))
+            parameters = np.column_stack((norm[rows].ravel(),
+                                          index[rows].ravel(),
+                                          background[rows].ravel()))
+            S = rnspectralmodels.power_law_with_constant(f, parameters)
+            F = np.zeros((S.shape[0], nf + 1), dtype=np.complex128)
+            F[:, 1:] = np.sqrt(S) * noise[rows].reshape((-1, nf))
+            ts = np.fft.irfft(F, n=nt, axis=-1) + mean[rows].reshape((-1, 1))
+            cube[rows] = ts.reshape((-1, nx, nt))
+        cube.flush()
+        del cube
+        del noise
+    finally:
+        if os.path.isfile(noisefile):
+            os.remove(noisefile)
+
+    np.savez(os.path.splitext(filename)[0] + '.parameters.npz',
+             index=index, norm=norm, background=background, mean=mean,
+             nt=nt, dt=dt, correlation_length=correlation_length)
+    return np.load(filename, mmap_mode='r')
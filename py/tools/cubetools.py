@@ -17,8 +17,12 @@ from skimage.transform import resize
 #
 def get_datacube(path, derotate=False, clip=False):
     """
-    Function that goes to a directory and returns a datacube
+    Function that goes to a directory and returns a datacube.  A .npy file,
+    such as a cube made by cubesimulation.simulate_datacube, is opened as a
+    read-only memory map, so cubes larger than the memory can be used.
     """
+    if path.endswith('.npy'):
+        return np.load(os.path.expanduser(path), mmap_mode='r')
     if os.path.isfile(path):
         idl = readsav(path)
         return np.swapaxes(np.swapaxes(idl['region_window'], 0, 2), 0, 1)
@@ -0,0 +1,245 @@
+"""
+Fit a spectral model to the Fourier power in every pixel of a datacube and
+store the results as maps.
+
+The maps are memory-mapped numpy files written into a single directory:
+
+    parameters.npy      : [ny, nx, nparameters] best fit model parameters
+    uncertainties.npy   : [ny, nx, nparameters] standard deviation of the
+                          parameters estimated from the Fisher information
+    goodness_of_fit.npy : [ny, nx] reduced deviance of the fit
+    status.npy          : [ny, nx] why the fit of each pixel stopped, a key
+                          of npmodels.map_status, or -1 where no fit was made
+    tiles.npy           : [nty, ntx] which tiles of the maps are complete
+
+Pixels whose fit did not converge are blank (NaN) in the parameter,
+uncertainty and goodness of fit maps unless the unconverged estimates are
+asked for, in which case the status map says which pixels to mask.
+
+The datacube is fitted one tile of pixels at a time.  Completed tiles are
+recorded in tiles.npy, so an interrupted run picks up where it stopped.
+"""
+
+import os
+import time
+import pickle
+import numpy as np
+from numpy.lib.format import open_memmap
+import rnspectralmodels
+import rnwhittle
+
+
+def power_law_with_constant_estimate(freqs, pwr, index=2.0, nend=5):
+    """
+    Initial estimate of the parameters of
+    rnspectralmodels.power_law_with_constant for each spectrum in pwr.
+    """
+    nspectra = pwr.shape[0]
+    p0 = np.zeros((nspectra, 3))
+    p0[:, 0] = np.log(np.mean(pwr[:, 0:nend], axis=1))
+    p0[:, 1] = index
+    p0[:, 2] = np.log(np.mean(pwr[:, -nend:], axis=1))
+    return p0
+
+
+def reduced_deviance(pwr, S, nparameters):
+    """
+    Deviance of the observed power given the model spectrum, per degree of
+    freedom.  For chi-squared(2) distributed power the expected value for a
+    good fit is twice the Euler-Mascheroni constant, approximately 1.15.
+    """
+    ratio = pwr / S
+    deviance = 2 * np.sum(ratio - np.log(ratio) - 1.0, axis=-1)
+    return deviance / (1.0 * (pwr.shape[-1] - nparameters))
+
+
+class IndexMap:
+    def __init__(self, directory, shape, nparameters, tile=(32, 32),
+                 description=None):
+        """
+        Memory-mapped storage for the results of fitting every pixel in a
+        datacube.  If the directory already holds maps with the same
+        description they are re-opened, otherwise new maps are created.
+
+        Parameters
+        ----------
+        directory : str
+            where the maps are stored
+        shape : tuple
+            (ny, nx) spatial dimensions of the datacube
+        nparameters : int
+            number of parameters in the fitted model
+        tile : tuple
+            (tile_ny, tile_nx) size of the tiles the datacube is fitted in
+        description : dict
+            what was fitted.  Maps are only re-used when the description
+            matches.
+        """
+        self.directory = os.path.expanduser(directory)
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+        self.ny, self.nx = shape
+        self.nparameters = nparameters
+        self.tile = tile
+        self.nty = int(np.ceil(self.ny / (1.0 * tile[0])))
+        self.ntx = int(np.ceil(self.nx / (1.0 * tile[1])))
+        self.description = {"shape": (self.ny, self.nx),
+                            "nparameters": nparameters,
+                            "tile": tuple(tile)}
+        if description is not None:
+            self.description.update(description)
+
+        # Re-open maps from an earlier run if they were made the same way
+        description_file = os.path.join(self.directory, 'index_map.pickle')
+        mode = 'w+'
+        if os.path.isfile(description_file):
+            f = open(description_file, 'rb')
+            previous = pickle.load(f)
+            f.close()
+            if previous == self.description:
+                mode = 'r+'
+        if mode == 'w+':
+            f = open(description_file, 'wb')
+            pickle.dump(self.description, f)
+            f.close()
+
+        self.parameters = self._open('parameters', (self.ny, self.nx, nparameters), mode)
+        self.uncertainties = self._open('uncertainties', (self.ny, self.nx, nparameters), mode)
+        self.goodness_of_fit = self._open('goodness_of_fit', (self.ny, self.nx), mode)
+        self.status = self._open('status', (self.ny, self.nx), mode, dtype=np.int8)
+        self.tiles = self._open('tiles', (self.nty, self.ntx), mode, dtype=bool)
+
+    def _open(self, name, shape, mode, dtype=np.float64):
+        filename = os.path.join(self.directory, name + '.npy')
+        if mode == 'w+':
+            m = open_memmap(filename, mode=mode, dtype=dtype, shape=shape)
+            if dtype == np.float64:
+                m[...] = np.nan
+            elif dtype != bool:
+                m[...] = -1
+            return m
+        return open_memmap(filename, mode=mode)
+
+    def tile_slices(self, ity, itx):
+        """The spatial extent of a tile"""
+        return (slice(ity * self.tile[0], min((ity + 1) * self.tile[0], self.ny)),
+                slice(itx * self.tile[1], min((itx + 1) * self.tile[1], self.nx)))
+
+    def remaining(self):
+        """Tiles that have not been completed yet"""
+        return [(ity, itx) for ity in range(0, self.nty)
+                for itx in range(0, self.ntx) if not self.tiles[ity, itx]]
+
+    def converged(self):
+        """Where the fit converged"""
+        return np.asarray(self.status) == 0
+
+    def complete(self, ity, itx):
+        """Flush the results for a tile to disk and mark it as complete"""
+        self.parameters.flush()
+        self.uncertainties.flush()
+        self.goodness_of_fit.flush()
+        self.status.flush()
+        self.tiles[ity, itx] = True
+        self.tiles.flush()
+
+
+def index_map(pwr, freqs, directory,
+              model=rnspectralmodels.power_law_with_constant,
+              estimate=power_law_with_constant_estimate,
+              lower=None, upper=None, tile=(32, 32), keep_unconverged=False,
+              verbose=True):
+    """
+    Fit a model to the Fourier power in every pixel of a datacube using the
+    Whittle likelihood, and store the results as memory-mapped maps.
+
+    Parameters
+    ----------
+    pwr : ndarray[ny, nx, nfreq]
+        Fourier power at each pixel.  May itself be memory-mapped.
+    freqs : ndarray[nfreq]
+        positive frequencies the power is defined at
+    directory : str
+        where the maps are stored
+    model : function
+        model from rnspectralmodels that is fit to each pixel
+    estimate : function
+        estimate(freqs, power) returns initial parameter estimates for
+        each row of power
+    lower, upper : ndarray[nparameters]
+        optional bounds on the model parameters
+    tile : tuple
+        number of pixels in each tile fitted at the same time
+    keep_unconverged : bool
+        if True the estimates of the pixels whose fit did not converge are
+        kept in the maps, and may be masked using the status map or
+        IndexMap.converged().  Pixels whose fit failed are always blank.
+
+    Returns
+    -------
+    IndexMap
+        the maps.  The attribute "pixels_per_second" gives the throughput of
+        this run.
+    """
+    ny, nx, nfreq = pwr.shape
+    p0 = estimate(freqs, np.asarray(pwr[0:1, 0, :]))
+    nparameters = p0.shape[1]
+
+    maps = IndexMap(directory, (ny, nx), nparameters, tile=tile,
+                    description={"model": model.__name__,
+                                 "nfreq": nfreq,
+                                 "keep_unconverged": keep_unconverged})
+    todo = maps.remaining()
+    if verbose:
+        print('Index map: %i of %i tiles remaining' % (len(todo), maps.nty * maps.ntx))
+
+    npixels = 0
+    t0 = time.time()
+    for itile, (ity, itx) in enumerate(todo):
+        ys, xs = maps.tile_slices(ity, itx)
+        tile_pwr = np.asarray(pwr[ys, xs, :], dtype=np.float64)
+        tny, tnx = tile_pwr.shape[0:2]
+        tile_pwr = tile_pwr.reshape(tny * tnx, nfreq)
+
+        # Only fit the pixels with usable power
+        good = np.all(np.isfinite(tile_pwr), axis=1) & np.all(tile_pwr > 0, axis=1)
+        parameters = np.zeros((tny * tnx, nparameters)) + np.nan
+        uncertainties = np.zeros((tny * tnx, nparameters)) + np.nan
+        gof = np.zeros(tny * tnx) + np.nan
+        status = np.zeros(tny * tnx, dtype=np.int8) - 1
+        if np.any(good):
+            answer = rnwhittle.fit(model, freqs, tile_pwr[good],
+                                   estimate(freqs, tile_pwr[good]),
+                                   lower=lower, upper=upper)
+            parameters[good] = answer["parameters"]
+            uncertainties[good] = np.sqrt(np.diagonal(answer["covariance"], axis1=1, axis2=2))
+            S = rnwhittle.model_power(model, freqs, answer["parameters"])
+            gof[good] = reduced_deviance(tile_pwr[good], S, nparameters)
+            status[good] = answer["status"]
+            # Pixels whose fit failed, or did not converge, have no estimate
+            if keep_unconverged:
+                blank = np.flatnonzero(good)[answer["failed"]]
+            else:
+                blank = np.flatnonzero(good)[~answer["converged"]]
+            parameters[blank] = np.nan
+            uncertainties[blank] = np.nan
+            gof[blank] = np.nan
+
+        maps.parameters[ys, xs, :] = parameters.reshape(tny, tnx, nparameters)
+        maps.uncertainties[ys, xs, :] = uncertainties.reshape(tny, tnx, nparameters)
+        maps.goodness_of_fit[ys, xs] = gof.reshape(tny, tnx)
+        maps.status[ys, xs] = status.reshape(tny, tnx)
+        maps.complete(ity, itx)
+
+        npixels = npixels + tny * tnx
+        if verbose:
+            print('Index map: tile %i of %i, %8.1f pixels per second' % (itile + 1, len(todo), npixels / (time.time() - t0)))
+
+    elapsed = time.time() - t0
+    if elapsed > 0:
+        maps.pixels_per_second = npixels / elapsed
+    else:
+        maps.pixels_per_second = np.nan
+    if verbose:
+        print('Index map: fit %i pixels in %f seconds (%8.1f pixels per second)' % (npixels, elapsed, maps.pixels_per_second))
+    return maps
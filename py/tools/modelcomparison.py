@@ -0,0 +1,194 @@
+"""
+A table of model fit summaries for comparing models across regions.
+
+Each fit summary (AIC, BIC, maximum log likelihood and reduced chi-squared
+of one model fitted to one spectrum) is stored under the key
+
+    (corename, wave, region, window, obstype, model, passnumber)
+
+The table is kept in a single file, so comparisons between models, regions
+and wavelengths, and the tables for the paper, are queries of the stored
+summaries rather than new fits.
+"""
+
+import os
+import csv
+import pickle
+import numpy as np
+
+# Names of the fields of a key, in order
+key_fields = ('corename', 'wave', 'region', 'window', 'obstype', 'model', 'passnumber')
+
+# Fields of a fit summary, as in FitSummary
+summary_fields = ('AIC', 'BIC', 'maxlogp', 'chi2')
+
+
+class ComparisonTable:
+    def __init__(self, filename=None):
+        """
+        Parameters
+        ----------
+        filename : str
+            where the table is stored.  An existing table is loaded.
+        """
+        self.filename = filename
+        self.rows = {}
+        if (filename is not None) and os.path.isfile(os.path.expanduser(filename)):
+            f = open(os.path.expanduser(filename), 'rb')
+            self.rows = pickle.load(f)
+            f.close()
+
+    def add(self, key, summary):
+        """
+        Store the fit summary of one model.
+
+        Parameters
+        ----------
+        key : tuple
+            (corename, wave, region, window, obstype, model, passnumber)
+        summary : dict
+            the fit summary, with at least the entries of summary_fields
+        """
+        if len(key) != len(key_fields):
+            raise ValueError('a key has the fields %s' % (str(key_fields)))
+        self.rows[tuple(key)] = dict([(k, summary[k]) for k in summary_fields])
+        return self
+
+    def add_fitsummary(self, branch, passnumber, fitsummary):
+        """
+        Store both models of the output of FitSummary.
+
+        Parameters
+        ----------
+        branch : tuple
+            (corename, wave, region, window, obstype)
+        passnumber : str
+            which pass of the fit
+        fitsummary : dict
+            output of FitSummary, with the summaries under "M0" and "M1"
+        """
+        for model in ('M0', 'M1'):
+            self.add(tuple(branch) + (model, passnumber), fitsummary[model])
+        return self
+
+    def save(self, filename=None):
+        """Write the table.  The file is replaced in one step."""
+        if filename is None:
+            filename = self.filename
+        filename = os.path.expanduser(filename)
+        tmp = filename + '.tmp'
+        f = open(tmp, 'wb')
+        pickle.dump(self.rows, f, protocol=pickle.HIGHEST_PROTOCOL)
+        f.close()
+        os.rename(tmp, filename)
+        return self
+
+    def select(self, **criteria):
+        """
+        Rows whose key fields match the criteria, for example
+        select(wave='171', model='M1').  A criterion may also be a list of
+        allowed values.  Each row is a dictionary of the key fields and the
+        summary fields, and the rows are sorted by key.
+        """
+        for name in criteria:
+            if name not in key_fields:
+                raise KeyError(name)
+        rows = []
+        for key in sorted(self.rows.keys()):
+            fields = dict(zip(key_fields, key))
+            if all([_matches(fields[name], value) for name, value in criteria.items()]):
+                fields.update(self.rows[key])
+                rows.append(fields)
+        return rows
+
+    def compare(self, model0='M0', model1='M1', **criteria):
+        """
+        Compare two models fitted to the same data.  For every key fitted
+        with both models the row holds the key fields, the summaries of
+        each model with the model name prefixed, for example 'M0 chi2', and
+
+            dAIC : AIC of model0 minus AIC of model1
+            dBIC : BIC of model0 minus BIC of model1
+            t_lrt : likelihood ratio test statistic, -2 (maxlogp0 - maxlogp1)
+        """
+        i = key_fields.index('model')
+        rows = []
+        for row0 in self.select(model=model0, **criteria):
+            key = tuple([row0[name] for name in key_fields])
+            key1 = key[0:i] + (model1,) + key[i + 1:]
+            if key1 not in self.rows:
+                continue
+            row1 = self.rows[key1]
+            row = dict([(name, row0[name]) for name in key_fields if name != 'model'])
+            for name in summary_fields:
+                row[model0 + ' ' + name] = row0[name]
+                row[model1 + ' ' + name] = row1[name]
+            row["dAIC"] = row0["AIC"] - row1["AIC"]
+            row["dBIC"] = row0["BIC"] - row1["BIC"]
+            row["t_lrt"] = -2 * (row0["maxlogp"] - row1["maxlogp"])
+            rows.append(row)
+        return rows
+
+
+def _matches(value, criterion):
+    if isinstance(criterion, (list, tuple, set)):
+        return value in criterion
+    return value == criterion
+
+
+def _columns(rows, columns):
+    if columns is None:
+        columns = [name for name in key_fields if name in rows[0]]
+        columns = columns + sorted([name for name in rows[0] if name not in key_fields])
+    return columns
+
+
+def _escape(text):
+    return text.replace('_', '\\_')
+
+
+def to_csv(rows, filename, columns=None):
+    """Write rows from select or compare as a CSV file"""
+    columns = _columns(rows, columns)
+    f = open(os.path.expanduser(filename), 'w')
+    writer = csv.writer(f)
+    writer.writerow(columns)
+    for row in rows:
+        writer.writerow([row[name] for name in columns])
+    f.close()
+
+
+def to_latex(rows, columns=None, formats=None, headers=None):
+    """
+    Rows from select or compare as a LaTeX tabular environment.
+
+    Parameters
+    ----------
+    columns : list of str
+        which fields, in order
+    formats : dict
+        format string of a field, for example {"dAIC": "%.1f"}.  Numbers
+        are written with '%.2f' by default.
+    headers : dict
+        column heading of a field, if different from its name
+    """
+    columns = _columns(rows, columns)
+    if formats is None:
+        formats = {}
+    if headers is None:
+        headers = {}
+    lines = ['\\begin{tabular}{' + 'l' * len(columns) + '}',
+             '\\hline',
+             ' & '.join([headers.get(name, _escape(name)) for name in columns]) + ' \\\\',
+             '\\hline']
+    for row in rows:
+        entries = []
+        for name in columns:
+            value = row[name]
+            if isinstance(value, (float, np.floating)):
+                entries.append(formats.get(name, '%.2f') % value)
+            else:
+                entries.append(_escape(str(value)))
+        lines.append(' & '.join(entries) + ' \\\\')
+    lines = lines + ['\\hline', '\\end{tabular}']
+    return '\n'.join(lines)
@@ -0,0 +1,141 @@
+"""
+Parallel, resumable Monte Carlo experiments.
+
+An experiment is a grid of cases, for example every combination of time
+series length and power law index, with a number of trials of each case.
+The trials of a case are split into units of a fixed number of trials.  A
+unit is run by a trial function that simulates and analyzes all its trials
+at once, so the work can use batched simulation and fitting.  Units are
+farmed out to a pool of worker processes, and each finished unit is written
+to disk straight away through a campaign.Campaign.  Running the experiment
+again skips the units already done, so an interrupted experiment resumes
+where it stopped.
+
+Every unit has its own stream of random numbers, spawned from one root seed
+in the order of the units in the grid.  The results are therefore the same
+however the units are scheduled, and whether or not the experiment was
+interrupted.
+"""
+
+import itertools
+import multiprocessing
+import numpy as np
+import campaign
+import rnrandom
+
+
+def _run_unit(args):
+    """Run one unit of an experiment in a worker process.  Returns the key
+    of the unit and its output."""
+    unit, function, case, trials, seed = args
+    return unit, function(case, trials, rnrandom.get_random_state(seed))
+
+
+class Experiment:
+    def __init__(self, directory, grid, function, ntrial, block=50, seed=0,
+                 config=None, verbose=True):
+        """
+        Parameters
+        ----------
+        directory : str
+            where the results of the units are stored
+        grid : list of (str, list) pairs
+            the name of each variable of the experiment and its values.
+            The cases are all the combinations of the values.
+        function : function
+            the trial function, called as function(case, trials,
+            random_state) where case is a dictionary of the values of the
+            variables and trials is an array of trial numbers.  It returns a
+            dictionary of arrays, each with one row per trial.  It must be
+            picklable, so defined at the top level of a module, for the
+            units to run in worker processes.
+        ntrial : int
+            number of trials of each case
+        block : int
+            number of trials in a unit
+        seed : int
+            root seed of the random number streams of the units
+        config : object
+            anything else that changes the results, for example the
+            settings of the simulation.  Units completed with a different
+            configuration, grid, number of trials, block or seed are run
+            again.
+        """
+        self.grid = [(name, list(values)) for name, values in grid]
+        self.names = [name for name, values in self.grid]
+        self.function = function
+        self.ntrial = ntrial
+        self.block = block
+        self.seed = seed
+        self.campaign = campaign.Campaign(directory,
+                                          config={"grid": self.grid,
+                                                  "ntrial": ntrial,
+                                                  "block": block,
+                                                  "seed": seed,
+                                                  "config": config},
+                                          verbose=False)
+        self.verbose = verbose
+
+    def cases(self):
+        """All the cases, as tuples of values in the order of the grid"""
+        return list(itertools.product(*[values for name, values in self.grid]))
+
+    def units(self):
+        """The key of every unit, (case, first trial), in a fixed order"""
+        return [(case, start) for case in self.cases()
+                for start in range(0, self.ntrial, self.block)]
+
+    def _jobs(self):
+        units = self.units()
+        seeds = rnrandom.spawn(self.seed, len(units))
+        jobs = []
+        for unit, seed in zip(units, seeds):
+            if not self.campaign.done(unit):
+                case, start = unit
+                trials = np.arange(start, min(self.ntrial, start + self.block))
+                jobs.append((unit, self.function, dict(zip(self.names, case)), trials, seed))
+        return jobs
+
+    def run(self, processes=None):
+        """
+        Run the units not yet done.  With processes the units are run by
+        that many worker processes, otherwise in this process.  Each unit
+        is stored as soon as it finishes, in whatever order the units
+        finish.
+        """
+        jobs = self._jobs()
+        if self.verbose:
+            print('Experiment: %i units to run, %i already done' %
+                  (len(jobs), len(self.units()) - len(jobs)))
+        if processes is None:
+            outputs = (_run_unit(args) for args in jobs)
+        else:
+            pool = multiprocessing.Pool(processes=processes)
+            outputs = pool.imap_unordered(_run_unit, jobs)
+        try:
+            for i, (unit, output) in enumerate(outputs):
+                self.campaign.record(unit, output)
+                if self.verbose:
+                    print('Experiment: unit %i of %i done %s' % (i + 1, len(jobs), str(unit)))
+        finally:
+            if processes is not None:
+                pool.terminate()
+                pool.join()
+        return self
+
+    def done(self):
+        """Whether every unit has been run"""
+        return all([self.campaign.done(unit) for unit in self.units()])
+
+    def results(self):
+        """
+        The results of every case, as a dictionary keyed by the case, of
+        the outputs of the trial function with the trials of all its units
+        joined in trial order.
+        """
+        answer = {}
+        for case in self.cases():
+            outputs = [self.campaign.output((case, start)) for start in range(0, self.ntrial, self.block)]
+            answer[case] = dict([(key, np.concatenate([output[key] for output in outputs]))
+                                 for key in outputs[0].keys()])
+        return answer
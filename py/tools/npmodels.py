@@ -0,0 +1,544 @@
+"""
+Plain NumPy versions of the PyMC models for the red noise study.
+
+Each model function has the same arguments as the model of the same name in
+pymcmodels2, but instead of a collection of PyMC nodes it returns a
+LogPosterior object.  This is a plain function of the vector of model
+parameters, with the parameters in the order used by rnspectralmodels.
+The priors are the uniform priors defined by the limits in rnlimits and the
+likelihood of the observed spectrum is the same normal distribution used by
+pymcmodels2.
+
+Notes
+-----
+A LogPosterior evaluates any number of parameter vectors at once: an input of
+shape [..., nparameters] returns log posterior values of shape [...].  The
+observed power may also be an array of spectra [nspectra, nfreq], in which
+case parameters of shape [nspectra, nparameters] are evaluated row by row
+against their own spectrum.
+"""
+
+import copy
+import numpy as np
+from scipy.optimize import fmin_powell
+import rnspectralmodels
+import rnprofile
+import rndensity
+from rnlimits import limits, glimits, elimits
+
+
+class LogPosterior:
+    def __init__(self, names, lower, upper, model, analysis_power, sigma,
+                 init=None, constraint=None, npixel=False, npixel_prior=None,
+                 profile=None):
+        """
+        Log posterior of a spectral model given an observed spectrum.
+
+        Parameters
+        ----------
+        names : list
+            names of the parameters, in order.  The spectral model
+            parameters come first, followed by 'npixel' if the model has a
+            noise prior.
+        lower, upper : ndarray
+            limits of the uniform prior of each parameter
+        model : rnspectralmodels.SpectralModel
+            the spectral model, bound to the analysis frequencies
+        analysis_power : ndarray
+            the observed log power spectrum
+        sigma : ndarray
+            the standard deviation of the observed log power spectrum
+        init : ndarray
+            initial values of the parameters
+        constraint : function
+            optional function of the parameters that returns False where
+            the parameters are not allowed
+        npixel : bool
+            if True the last parameter divides the precision of the
+            likelihood, as in the noise prior models of pymcmodels2
+        npixel_prior : rndensity.GriddedDensity
+            if given, the prior of the last parameter 'npixel' instead of a
+            uniform prior between its limits, which should be the bounds of
+            the density
+        profile : rnprofile.Profile
+            if given, counts the evaluations of the log posterior and the
+            model, and times the prior, the likelihood and the model
+            spectrum (the deterministic node).  May also be set later
+            through the attribute of the same name.
+        """
+        self.names = list(names)
+        self.nparameters = len(self.names)
+        self.lower = np.asarray(lower, dtype=np.float64)
+        self.upper = np.asarray(upper, dtype=np.float64)
+        self.model = model
+        self.power = np.asarray(analysis_power, dtype=np.float64)
+        self.sigma = np.asarray(sigma, dtype=np.float64)
+        self.tau = 1.0 / (self.sigma ** 2)
+        self.constraint = constraint
+        self.npixel = npixel
+        self.nmodel = self.nparameters - int(npixel)
+        if init is None:
+            self.init = 0.5 * (self.lower + self.upper)
+        else:
+            self.init = np.asarray(init, dtype=np.float64)
+        # Log density of the uniform priors inside the limits
+        self.npixel_prior = npixel_prior
+        uniform = self.nparameters - int(npixel_prior is not None)
+        self.logprior_constant = -np.sum(np.log(self.upper - self.lower)[0:uniform])
+        self.profile = profile
+
+    def __call__(self, theta):
+        return self.logp(theta)
+
+    def select(self, index):
+        """
+        The log posterior of one spectrum.  When the observed power is an
+        array of spectra [nspectra, nfreq], each row of the parameters is
+        compared with its own spectrum.  This returns the posterior of
+        spectrum index alone.
+        """
+        lp = copy.copy(self)
+        if self.power.ndim > 1:
+            lp.power = self.power[index]
+        if self.sigma.ndim > 1:
+            lp.sigma = self.sigma[index]
+            lp.tau = self.tau[index]
+        if self.init.ndim > 1:
+            lp.init = self.init[index]
+        return lp
+
+    def within_prior(self, theta):
+        """Where the parameters lie within the support of the prior"""
+        theta = np.asarray(theta)
+        inside = np.all((theta >= self.lower) & (theta <= self.upper), axis=-1)
+        if self.constraint is not None:
+            inside = inside & self.constraint(theta)
+        return inside
+
+    def logprior(self, theta):
+        """Log of the prior probability of the parameters"""
+        with rnprofile.timer(self.profile, 'prior'):
+            lp = np.where(self.within_prior(theta), self.logprior_constant, -np.inf)
+            if self.npixel_prior is not None:
+                lp = lp + self.npixel_prior.logp(np.asarray(theta)[..., -1])
+            return lp
+
+    def spectrum(self, theta):
+        """The model log power spectrum, the 'fourier_power_spectrum' node"""
+        a = np.asarray(theta, dtype=np.float64)[..., 0:self.nmodel]
+        rnprofile.count(self.profile, 'model evaluations', a.size // self.nmodel)
+        with rnprofile.timer(self.profile, 'deterministic'):
+            if a.ndim <= 2:
+                return self.model.log(a)
+            S = self.model.log(a.reshape(-1, self.nmodel))
+            return S.reshape(a.shape[:-1] + (S.shape[-1],))
+
+    def precision(self, theta):
+        """Precision of the likelihood for the given parameters"""
+        if self.npixel:
+            return self.tau / np.asarray(theta)[..., -1:]
+        return self.tau
+
+    def loglike(self, theta):
+        """Log likelihood of the observed spectrum"""
+        with np.errstate(all='ignore'):
+            mu = self.spectrum(theta)
+            with rnprofile.timer(self.profile, 'likelihood'):
+                tau = self.precision(theta)
+                return np.sum(-0.5 * tau * (self.power - mu) ** 2 +
+                              0.5 * np.log(tau / (2 * np.pi)), axis=-1)
+
+    def logp(self, theta):
+        """Log posterior of the parameters"""
+        rnprofile.count(self.profile, 'logp evaluations', np.size(theta) // self.nparameters)
+        lp = self.logprior(theta)
+        with np.errstate(all='ignore'):
+            ll = self.loglike(theta)
+        ll = np.where(np.isfinite(ll), ll, -np.inf)
+        return np.where(np.isfinite(lp), lp + ll, -np.inf)
+
+    def log_jacobian(self, theta, step=1e-6):
+        """
+        Derivative of the model log power spectrum with respect to the model
+        parameters, [..., nfreq, nmodel].  Uses the analytic jacobian of
+        the model where there is one, and central differences otherwise.
+        """
+        a = np.asarray(theta, dtype=np.float64)[..., 0:self.nmodel]
+        shape = a.shape[:-1]
+        a = a.reshape(-1, self.nmodel)
+        try:
+            J = self.model.jacobian(a)
+            J = np.rollaxis(np.asarray(J), 0, 3) / self.model.power(a)[:, :, np.newaxis]
+        except (KeyError, NotImplementedError):
+            J = np.zeros((a.shape[0], self.model.nfreq, self.nmodel))
+            for i in range(0, self.nmodel):
+                h = step * np.maximum(1.0, np.abs(a[:, i]))
+                up = a.copy()
+                down = a.copy()
+                up[:, i] = up[:, i] + h
+                down[:, i] = down[:, i] - h
+                J[:, :, i] = (self.model.log(up) - self.model.log(down)) / (2 * h[:, np.newaxis])
+        return J.reshape(shape + J.shape[1:])
+
+    def gradient(self, theta):
+        """
+        Gradient of the log posterior with respect to the parameters,
+        [..., nparameters].  The uniform priors are flat inside their
+        limits, so only the likelihood and any prior density of npixel
+        contribute.
+        """
+        theta = np.asarray(theta, dtype=np.float64)
+        with np.errstate(all='ignore'):
+            r = self.power - self.spectrum(theta)
+            tau = self.precision(theta) + np.zeros_like(r)
+            J = self.log_jacobian(theta)
+            g = np.sum((tau * r)[..., np.newaxis] * J, axis=-2)
+            if self.npixel:
+                n = theta[..., -1]
+                gn = np.sum(0.5 * tau * r ** 2 - 0.5, axis=-1) / n
+                if self.npixel_prior is not None:
+                    gn = gn + self.npixel_prior.dlogp(n)
+                g = np.concatenate((g, gn[..., np.newaxis]), axis=-1)
+        return g
+
+    def fisher(self, theta):
+        """
+        Expected Fisher information of the parameters, [..., nparameters,
+        nparameters].  This is a positive definite approximation to minus
+        the Hessian of the log posterior.
+        """
+        theta = np.asarray(theta, dtype=np.float64)
+        with np.errstate(all='ignore'):
+            J = self.log_jacobian(theta)
+            tau = self.precision(theta) + np.zeros(J.shape[:-1])
+            F = np.einsum('...f,...fi,...fj->...ij', tau, J, J)
+            if self.npixel:
+                n = theta[..., -1]
+                nfreq = J.shape[-2]
+                F = np.concatenate((F, np.zeros(F.shape[:-1] + (1,))), axis=-1)
+                F = np.concatenate((F, np.zeros(F.shape[:-2] + (1, F.shape[-1]))), axis=-2)
+                F[..., -1, -1] = 0.5 * nfreq / n ** 2
+        return F
+
+    def hessian(self, theta, step=1e-5):
+        """
+        Hessian of the log posterior, [..., nparameters, nparameters],
+        found by central differences of the analytic gradient.
+        """
+        theta = np.asarray(theta, dtype=np.float64)
+        H = np.zeros(theta.shape + (self.nparameters,))
+        for i in range(0, self.nparameters):
+            h = step * np.maximum(1.0, np.abs(theta[..., i]))
+            up = theta.copy()
+            down = theta.copy()
+            up[..., i] = up[..., i] + h
+            down[..., i] = down[..., i] - h
+            H[..., i, :] = (self.gradient(up) - self.gradient(down)) / (2 * h[..., np.newaxis])
+        # Symmetrize
+        return 0.5 * (H + np.swapaxes(H, -1, -2))
+
+    def predictive(self, theta, random_state=np.random):
+        """Draw spectra from the posterior predictive distribution, the
+        'predictive' node"""
+        mu = self.spectrum(theta)
+        sd = 1.0 / np.sqrt(self.precision(theta))
+        return mu + sd * random_state.standard_normal(size=mu.shape)
+
+
+# Status of each fit of bounded_map
+map_status = {0: 'converged',
+              1: 'maximum iterations reached',
+              2: 'damping limit reached',
+              3: 'non-finite gradient or Fisher information'}
+
+
+class Node:
+    def __init__(self, name, value):
+        """Minimal stand-in for a PyMC variable"""
+        self.__name__ = name
+        self.value = value
+
+
+def bounded_map(logposterior, start=None, maxiter=200, tol=1e-10):
+    """
+    Maximum a posteriori parameters of one or many spectra, respecting the
+    limits of the uniform priors.  The log posterior is maximized by
+    Levenberg-Marquardt damped Fisher scoring using the analytic gradient.
+    Steps that leave the limits are clipped back onto them, and steps that
+    do not increase the log posterior are rejected.
+
+    Parameters
+    ----------
+    logposterior : LogPosterior
+        the posterior.  If it holds an array of spectra, each row of start
+        is fitted to its own spectrum.
+    start : ndarray[..., nparameters]
+        starting values.  Defaults to the initial values of the posterior.
+    maxiter : int
+        maximum number of iterations
+    tol : float
+        the fit stops when the log posterior changes by less than tol
+        times its magnitude
+
+    Returns
+    -------
+    dict
+        "parameters" : MAP values of the parameters
+        "logp" : log posterior at the maximum
+        "hessian" : Hessian of the log posterior at the maximum
+        "converged" : whether the change in the log posterior fell below
+                      the tolerance before maxiter
+        "status" : why each fit stopped, a key of map_status.  Fits that
+                   stopped with non-finite values or because no step
+                   could be taken are not converged.
+        "niter" : number of iterations
+    """
+    if start is None:
+        start = logposterior.init
+    theta = np.array(start, dtype=np.float64)
+    single = theta.ndim == 1
+    theta = np.atleast_2d(theta)
+    lower = logposterior.lower
+    upper = logposterior.upper
+    nparameters = theta.shape[-1]
+
+    lp = logposterior.logp(theta)
+    lam = np.zeros(lp.shape) + 1e-3
+    done = np.zeros(lp.shape, dtype=bool)
+    status = np.ones(lp.shape, dtype=int)
+    niter = 0
+    for niter in range(1, maxiter + 1):
+        # Only work on the fits that are still running
+        active = np.nonzero(~done)[0]
+        sub = logposterior.select(active)
+        t = theta[active]
+        g = sub.gradient(t)
+        F = sub.fisher(t)
+        D = np.diagonal(F, axis1=-2, axis2=-1)
+        A = F + lam[active, np.newaxis, np.newaxis] * (D[..., np.newaxis] * np.eye(nparameters))
+        A = A + 1e-12 * np.eye(nparameters)
+        ok = np.all(np.isfinite(A), axis=(-2, -1)) & np.all(np.isfinite(g), axis=-1)
+        step = np.zeros_like(t)
+        if np.any(ok):
+            try:
+                step[ok] = np.linalg.solve(A[ok], g[ok][..., np.newaxis])[..., 0]
+            except np.linalg.LinAlgError:
+                step[ok] = np.einsum('...ij,...j->...i', np.linalg.pinv(A[ok]), g[ok])
+        proposal = np.clip(t + step, lower, upper)
+        lp_proposal = sub.logp(proposal)
+        better = ok & (lp_proposal > lp[active])
+        with np.errstate(invalid='ignore'):
+            change = np.abs(lp_proposal - lp[active])
+
+        # Converged when a lightly damped step changes the log posterior by
+        # less than the tolerance, whether or not it is accepted: at the
+        # maximum no step improves the fit.  Fits also stop, unconverged,
+        # when the damping has grown so large that no step can be taken, or
+        # when the gradient or the Fisher information is not finite.
+        converged = ok & np.isfinite(lp_proposal) & (lam[active] < 1.0) & \
+            (change <= tol * np.maximum(1.0, np.abs(lp[active])))
+        theta[active[better]] = proposal[better]
+        lp[active[better]] = lp_proposal[better]
+        lam[active] = np.where(better, lam[active] / 10.0, lam[active] * 10.0)
+        stuck = lam[active] > 1e12
+        status[active] = np.where(~ok, 3, np.where(converged, 0, np.where(stuck, 2, 1)))
+        done[active] = ~ok | converged | stuck
+        if np.all(done):
+            break
+
+    answer = {"parameters": theta,
+              "logp": lp,
+              "hessian": logposterior.hessian(theta),
+              "converged": status == 0,
+              "status": status,
+              "niter": niter}
+    if single:
+        for key in ("parameters", "logp", "hessian", "converged", "status"):
+            answer[key] = answer[key][0]
+    return answer
+
+
+class MAP:
+    def __init__(self, logposterior):
+        """
+        Maximum a posteriori estimate of a LogPosterior.  After the fit each
+        parameter is available as an attribute with a 'value', as it is for
+        a pymc.MAP object.  The Hessian of the log posterior at the maximum
+        is kept in the attribute 'hessian'.
+        """
+        self.logposterior = logposterior
+        self.values = np.array(logposterior.init, dtype=np.float64)
+        self.logp_at_max = None
+        self.hessian = None
+
+    def fit(self, method='bounded', start=None, **kwargs):
+        """
+        Find the maximum of the log posterior.  The default 'bounded' method
+        uses bounded_map.  'fmin_powell' is the derivative-free method used
+        by pymc.MAP.
+        """
+        if start is None:
+            start = self.values
+        if method == 'bounded':
+            answer = bounded_map(self.logposterior, start=start, **kwargs)
+            self.values = answer["parameters"]
+            self.hessian = answer["hessian"]
+        elif method == 'fmin_powell':
+            def f(theta):
+                lp = self.logposterior.logp(theta)
+                if np.isfinite(lp):
+                    return -lp
+                return np.inf
+
+            self.values = np.atleast_1d(fmin_powell(f, start, disp=False, **kwargs))
+            self.hessian = self.logposterior.hessian(self.values)
+        else:
+            raise ValueError('Unknown method ' + method)
+        self.logp_at_max = self.logposterior.logp(self.values)
+        for name, value in zip(self.logposterior.names, self.values):
+            setattr(self, name, Node(name, value))
+        return self
+
+
+#
+# Parameter limits in the order used by the models
+#
+def _limits(names, extra=None):
+    lower = []
+    upper = []
+    for name in names:
+        if extra is not None and name in extra:
+            lim = extra[name]
+        elif name in limits:
+            lim = limits[name]
+        elif name in glimits:
+            lim = glimits[name]
+        else:
+            lim = elimits[name]
+        lower.append(lim[0])
+        upper.append(lim[1])
+    return np.asarray(lower), np.asarray(upper)
+
+
+def _npixel_prior(npx):
+    """
+    Limits, starting value and prior density of the number of independent
+    pixels.  A number of pixels npx has a uniform prior between one and npx.
+    A noise prior dictionary has the kernel density estimate of
+    npx['npixel_model'] between one and npx['npixels'] as its prior, as in
+    pymcmodels2.
+    """
+    if np.isscalar(npx):
+        return [1.0, npx], 0.5 * (1.0 + npx), None
+    density = rndensity.kernel_density(npx['npixel_model'], lower=1.0, upper=npx['npixels'])
+    start = np.clip(np.median(npx['npixel_model']), density.lower, density.upper)
+    return [density.lower, density.upper], start, density
+
+
+def _init(init, npixel_init=None):
+    if init is None:
+        return None
+    if npixel_init is None:
+        return np.asarray(init, dtype=np.float64)
+    return np.append(np.asarray(init, dtype=np.float64), npixel_init)
+
+
+# -----------------------------------------------------------------------------
+# Model : np.log( power law plus constant )
+#
+def Log_splwc(analysis_frequencies, analysis_power, sigma, init=None):
+    """Power law with a constant.  This model assumes that the power
+    spectrum is made up of a power law and a constant background.  At high
+    frequencies the power spectrum is dominated by the constant background.
+    """
+    names = ['power_law_norm', 'power_law_index', 'background']
+    lower, upper = _limits(names)
+    return LogPosterior(names, lower, upper,
+                        rnspectralmodels.PowerLawWithConstant(analysis_frequencies),
+                        analysis_power, sigma, init=_init(init))
+
+
+def Log_splwc_noise_prior(analysis_frequencies, analysis_power, sigma, npx, init=None):
+    """Power law with a constant, with a prior on the number of independent
+    pixels in the observation, see _npixel_prior.
+    """
+    npixel_limits, npixel_init, npixel_prior = _npixel_prior(npx)
+    names = ['power_law_norm', 'power_law_index', 'background', 'npixel']
+    lower, upper = _limits(names, extra={"npixel": npixel_limits})
+    return LogPosterior(names, lower, upper,
+                        rnspectralmodels.PowerLawWithConstant(analysis_frequencies),
+                        analysis_power, sigma,
+                        init=_init(init, npixel_init=npixel_init),
+                        npixel=True, npixel_prior=npixel_prior)
+
+
+# -----------------------------------------------------------------------------
+# Model: np.log( power law plus constant + lognormal )
+#
+def _gaussian_amplitude_bound(theta):
+    """The Gaussian amplitude is less than the power law normalization"""
+    theta = np.asarray(theta)
+    return theta[..., 3] < theta[..., 0]
+
+
+def _gaussian_amplitude_bound_noise_prior(theta):
+    """The Gaussian amplitude is not more than the power law normalization"""
+    theta = np.asarray(theta)
+    return theta[..., 3] <= theta[..., 0]
+
+
+def Log_splwc_AddLognormalBump2(analysis_frequencies, analysis_power, sigma,
+                                init=None,
+                                log_bump_frequency_limits=[2.0, 6.0]):
+    """
+    Model: np.log( power law plus constant + lognormal )
+    """
+    names = ['power_law_norm', 'power_law_index', 'background',
+             'gaussian_amplitude', 'gaussian_position', 'gaussian_width']
+    lower, upper = _limits(names, extra={"gaussian_position": log_bump_frequency_limits})
+    return LogPosterior(names, lower, upper,
+                        rnspectralmodels.SplwcAddLognormalBump2(analysis_frequencies),
+                        analysis_power, sigma, init=_init(init),
+                        constraint=_gaussian_amplitude_bound)
+
+
+def Log_splwc_AddLognormalBump2_noise_prior(analysis_frequencies, analysis_power, sigma, npx,
+                                            init=None,
+                                            log_bump_frequency_limits=[2.0, 6.0]):
+    """
+    Model: np.log( power law plus constant + lognormal ), with a prior on
+    the number of independent pixels in the observation, see _npixel_prior.
+    """
+    npixel_limits, npixel_init, npixel_prior = _npixel_prior(npx)
+    names = ['power_law_norm', 'power_law_index', 'background',
+             'gaussian_amplitude', 'gaussian_position', 'gaussian_width',
+             'npixel']
+    lower, upper = _limits(names, extra={"gaussian_position": log_bump_frequency_limits,
+                                         "npixel": npixel_limits})
+    return LogPosterior(names, lower, upper,
+                        rnspectralmodels.SplwcAddLognormalBump2(analysis_frequencies),
+                        analysis_power, sigma,
+                        init=_init(init, npixel_init=npixel_init),
+                        constraint=_gaussian_amplitude_bound_noise_prior,
+                        npixel=True, npixel_prior=npixel_prior)
+
+
+# -----------------------------------------------------------------------------
+# Model: np.log( power law plus constant + exponentially decaying
+# autocorrelation )
+#
+def Log_splwc_AddExpDecayAutoCor(analysis_frequencies, analysis_power, sigma,
+                                 init=None,
+                                 normalized_frequency_limits=[10.0 ** -7.0, 10.0]):
+    """
+    Model: np.log( power law plus constant + exponentially decaying
+    autocorrelation ), see rnspectralmodels.splwc_AddExpDecayAutocor.  The
+    frequency of the autocorrelation component lies within
+    normalized_frequency_limits.
+    """
+    names = ['power_law_norm', 'power_law_index', 'background',
+             'eda_amplitude', 'eda_frequency', 'eda_index']
+    lower, upper = _limits(names, extra={"eda_frequency": normalized_frequency_limits})
+    return LogPosterior(names, lower, upper,
+                        rnspectralmodels.SplwcAddExpDecayAutocor(analysis_frequencies),
+                        analysis_power, sigma, init=_init(init))
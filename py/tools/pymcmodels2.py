@@ -20,12 +20,8 @@ from scipy.stats.kde import gaussian_kde
 
 
 # Limits on the fit
-limits = {"power_law_index": [1.0, 6.0],
-          "power_law_norm": [-10.0, np.log(100.0)],
-          "background": [-20.0, np.log(100.0)]}
-
-glimits = {"gaussian_amplitude": [-20.0*1000000, limits["power_law_norm"][1]],
-          "gaussian_width": [0.001, 3.00]}
+from rnlimits import limits, glimits
+import rndensity
 
 
 #
@@ -35,32 +31,23 @@ def calculate_kde(dataset, bw_method):
     return gaussian_kde(dataset, bw_method)
 
 
-def KernelSmoothing(name, dataset, bw_method=None, lower=-np.inf, upper=np.inf, observed=False, value=None):
-    '''Create a pymc node whose distribution comes from a kernel smoothing density estimate.'''
-    density = calculate_kde(dataset, bw_method)
-    lower_tail = 0
-    upper_tail = 0
-    if lower > -np.inf:
-        lower_tail = density.integrate_box(-np.inf, lower)
-    if upper < np.inf:
-        upper_tail = density.integrate_box(upper, np.inf)
-    factor = 1.0 / (1.0 - lower_tail - upper_tail)
+def KernelSmoothing(name, dataset, bw_method=None, lower=-np.inf, upper=np.inf, observed=False, value=None,
+                    ngrid=1024, rtol=1e-3):
+    '''Create a pymc node whose distribution comes from a kernel smoothing density estimate.
+
+    The density estimate is tabulated once on a grid between lower and upper,
+    see rndensity.kernel_density, so each evaluation of logp and each random
+    draw costs the same however large the dataset is.  Infinite bounds are
+    replaced by the range of the dataset extended by six kernel widths.
+    '''
+    table = rndensity.kernel_density(dataset, bw_method=bw_method, lower=lower,
+                                     upper=upper, ngrid=ngrid, rtol=rtol)
 
     def logp(value):
-        if value < lower or value > upper:
-            return -np.inf
-        d = density(value)
-        if d == 0.0:
-            return -np.inf
-        return np.log(factor * density(value))
+        return float(table.logp(value))
 
     def random():
-        result = None
-        while result == None:
-            result = density.resample(1)[0][0]
-            if result < lower or result > upper:
-                result = None
-        return result
+        return table.random()
 
     if value == None:
         value = random()
@@ -125,14 +112,16 @@ def Log_splwc(analysis_frequencies, analysis_power, sigma, init=None):
                                       upper=limits['background'][1],
                                       doc='background')
 
-    # Model for the power law spectrum
+    # Model for the power law spectrum, bound to the analysis frequencies
+    model = rnspectralmodels.PowerLawWithConstant(analysis_frequencies)
+
     @pymc.deterministic(plot=False)
     def fourier_power_spectrum(p=power_law_index,
                                a=power_law_norm,
                                b=background,
                                f=analysis_frequencies):
         #A pure and simple power law model#
-        out = rnspectralmodels.Log_splwc(f, [a, p, b])
+        out = model.log_at(a, p, b)
         return out
 
     spectrum = pymc.Normal('spectrum',
@@ -202,14 +191,16 @@ def Log_splwc_noise_prior(analysis_frequencies, analysis_power, sigma, npx, init
         print 'Using KDE estimate of independent pixels'
         npixel = KernelSmoothing('KDE_estimate', npx['npixel_model'], lower=1, upper=npx['npixels'])
 
-    # Model for the power law spectrum
+    # Model for the power law spectrum, bound to the analysis frequencies
+    model = rnspectralmodels.PowerLawWithConstant(analysis_frequencies)
+
     @pymc.deterministic(plot=False)
     def fourier_power_spectrum(p=power_law_index,
                                a=power_law_norm,
                                b=background,
                                f=analysis_frequencies):
         #A pure and simple power law model#
-        out = rnspectralmodels.Log_splwc(f, [a, p, b])
+        out = model.log_at(a, p, b)
         return out
 
     spectrum = pymc.Normal('spectrum',
@@ -323,7 +314,9 @@ def Log_splwc_AddLognormalBump2_noise_prior(analysis_frequencies, analysis_power
         else:
             return -np.inf
 
-    # Model for the power law spectrum
+    # Model for the power law spectrum, bound to the analysis frequencies
+    model = rnspectralmodels.SplwcAddLognormalBump2(analysis_frequencies)
+
     @pymc.deterministic(plot=False)
     def fourier_power_spectrum(p=power_law_index,
                                a=power_law_norm,
@@ -333,7 +326,7 @@ def Log_splwc_AddLognormalBump2_noise_prior(analysis_frequencies, analysis_power
                                gs=gaussian_width,
                                f=analysis_frequencies):
         #A pure and simple power law model#
-        out = rnspectralmodels.Log_splwc_AddLognormalBump2(f, [a, p, b, ga, gc, gs])
+        out = model.log_at(a, p, b, ga, gc, gs)
         return out
 
     spectrum = pymc.Normal('spectrum',
@@ -437,7 +430,9 @@ def Log_splwc_AddLognormalBump2(analysis_frequencies, analysis_power, sigma,
         else:
             return -np.inf
 
-    # Model for the power law spectrum
+    # Model for the power law spectrum, bound to the analysis frequencies
+    model = rnspectralmodels.SplwcAddLognormalBump2(analysis_frequencies)
+
     @pymc.deterministic(plot=False)
     def fourier_power_spectrum(p=power_law_index,
                                a=power_law_norm,
@@ -447,7 +442,7 @@ def Log_splwc_AddLognormalBump2(analysis_frequencies, analysis_power, sigma,
                                gs=gaussian_width,
                                f=analysis_frequencies):
         #A pure and simple power law model#
-        out = rnspectralmodels.Log_splwc_AddLognormalBump2(f, [a, p, b, ga, gc, gs])
+        out = model.log_at(a, p, b, ga, gc, gs)
         return out
 
     spectrum = pymc.Normal('spectrum',
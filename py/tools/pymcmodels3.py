@@ -65,14 +65,16 @@ def Log_splwc(analysis_frequencies, analysis_power, sigma, init=None):
     # pixels that comprise the observation
     nfactor = pymc.OneOverX('nfactor', value=1.0)
 
-    # Model for the power law spectrum
+    # Model for the power law spectrum, bound to the analysis frequencies
+    model = rnspectralmodels.PowerLawWithConstant(analysis_frequencies)
+
     @pymc.deterministic(plot=False)
     def fourier_power_spectrum(p=power_law_index,
                                a=power_law_norm,
                                b=background,
                                f=analysis_frequencies):
         #A pure and simple power law model#
-        out = rnspectralmodels.Log_splwc(f, [a, p, b])
+        out = model.log_at(a, p, b)
         return out
 
     spectrum = pymc.Normal('spectrum',
@@ -167,7 +169,9 @@ def Log_splwc_AddNormalBump2(analysis_frequencies, analysis_power, sigma,
     # pixels that comprise the observation
     nfactor = pymc.OneOverX('nfactor', value=1.0)
 
-    # Model for the power law spectrum
+    # Model for the power law spectrum, bound to the analysis frequencies
+    model = rnspectralmodels.SplwcAddNormalBump2(analysis_frequencies)
+
     @pymc.deterministic(plot=False)
     def fourier_power_spectrum(p=power_law_index,
                                a=power_law_norm,
@@ -177,7 +181,7 @@ def Log_splwc_AddNormalBump2(analysis_frequencies, analysis_power, sigma,
                                gs=gaussian_width,
                                f=analysis_frequencies):
         #A pure and simple power law model#
-        out = rnspectralmodels.Log_splwc_AddNormalBump2(f, [a, p, b, ga, gc, gs])
+        out = model.log_at(a, p, b, ga, gc, gs)
         return out
 
     spectrum = pymc.Normal('spectrum',
@@ -0,0 +1,130 @@
+"""
+One dimensional probability densities tabulated on a grid.
+
+Evaluating a kernel density estimate costs time proportional to the size of
+its dataset.  A GriddedDensity evaluates the density once on a grid, after
+which log densities and random draws cost the same however expensive the
+density is.  It is used for the noise priors of pymcmodels2 and npmodels.
+"""
+
+import numpy as np
+from scipy.stats import gaussian_kde
+
+
+class GriddedDensity:
+    def __init__(self, density, lower, upper, ngrid=1024, rtol=1e-3,
+                 max_ngrid=2 ** 20):
+        """
+        A one dimensional probability density tabulated on a regular grid
+        between lower and upper.  The density is normalized to integrate to
+        one over the grid, so it is truncated at the bounds.  Between grid
+        points the density is interpolated linearly.  Random draws invert
+        the cumulative distribution of the interpolated density exactly, so
+        they follow the same density as logp and have the same error.
+
+        Parameters
+        ----------
+        density : function
+            the density, for example a scipy.stats.gaussian_kde.  Must
+            accept an array of values.
+        lower, upper : float
+            finite bounds of the grid
+        ngrid : int
+            initial number of grid points
+        rtol : float
+            the grid is doubled until linear interpolation between grid
+            points matches the density at the midpoints to within this
+            relative error, wherever the density is more than rtol times
+            its maximum
+        max_ngrid : int
+            largest grid allowed
+        """
+        if not (np.isfinite(lower) and np.isfinite(upper) and upper > lower):
+            raise ValueError('The bounds of a gridded density must be finite.')
+        self.lower = float(lower)
+        self.upper = float(upper)
+        while True:
+            x = np.linspace(self.lower, self.upper, ngrid)
+            pdf = np.asarray(density(x), dtype=np.float64).flatten()
+            midpoints = 0.5 * (x[1:] + x[0:-1])
+            exact = np.asarray(density(midpoints), dtype=np.float64).flatten()
+            interpolated = 0.5 * (pdf[1:] + pdf[0:-1])
+            significant = exact > rtol * np.max(pdf)
+            error = np.abs(interpolated - exact)[significant] / exact[significant]
+            if error.size == 0 or np.max(error) <= rtol or 2 * ngrid - 1 > max_ngrid:
+                break
+            ngrid = 2 * ngrid - 1
+        self.ngrid = ngrid
+        self.step = (self.upper - self.lower) / (ngrid - 1.0)
+        self.error = 0.0 if error.size == 0 else np.max(error)
+
+        # Normalize and tabulate the cumulative distribution, which is exact
+        # for the interpolated density
+        cdf = np.concatenate(([0.0], np.cumsum(0.5 * (pdf[1:] + pdf[0:-1]) * self.step)))
+        self.pdf = pdf / cdf[-1]
+        self.cdf = cdf / cdf[-1]
+
+    def _lookup(self, table, start, step, value):
+        """Linear interpolation in a table defined on a regular grid"""
+        position = (np.asarray(value, dtype=np.float64) - start) / step
+        i = np.clip(np.floor(position).astype(int), 0, table.size - 2)
+        w = position - i
+        return (1.0 - w) * table[i] + w * table[i + 1]
+
+    def logp(self, value):
+        """Log density, -inf outside the bounds"""
+        value = np.asarray(value, dtype=np.float64)
+        inside = (value >= self.lower) & (value <= self.upper)
+        with np.errstate(divide='ignore'):
+            lp = np.log(self._lookup(self.pdf, self.lower, self.step, value))
+        return np.where(inside, lp, -np.inf)
+
+    def random(self, size=None, random_state=np.random):
+        """Draw values from the density by inverting its cumulative
+        distribution"""
+        u = random_state.uniform(size=size)
+        i = np.clip(np.searchsorted(self.cdf, u, side='right') - 1, 0, self.ngrid - 2)
+        # Within a grid cell the density is p0 + slope * t, so the
+        # probability up to t is p0 * t + slope * t ** 2 / 2.  This is the
+        # root of that quadratic in a form that is stable for any slope.
+        p0 = self.pdf[i]
+        slope = (self.pdf[i + 1] - p0) / self.step
+        r = u - self.cdf[i]
+        with np.errstate(all='ignore'):
+            t = 2 * r / (p0 + np.sqrt(np.maximum(p0 ** 2 + 2 * slope * r, 0.0)))
+        t = np.clip(np.where(np.isfinite(t), t, 0.0), 0.0, self.step)
+        return self.lower + i * self.step + t
+
+    def dlogp(self, value):
+        """Derivative of the log density, from the slope of the
+        interpolated density"""
+        position = (np.asarray(value, dtype=np.float64) - self.lower) / self.step
+        i = np.clip(np.floor(position).astype(int), 0, self.ngrid - 2)
+        slope = (self.pdf[i + 1] - self.pdf[i]) / self.step
+        with np.errstate(all='ignore'):
+            return slope / self._lookup(self.pdf, self.lower, self.step, value)
+
+
+def kernel_density(dataset, bw_method=None, lower=-np.inf, upper=np.inf,
+                   ngrid=1024, rtol=1e-3):
+    """
+    Gaussian kernel density estimate of a dataset, tabulated as a
+    GriddedDensity between lower and upper.  Infinite bounds are replaced by
+    the range of the dataset extended by six kernel widths.
+
+    Parameters
+    ----------
+    dataset : ndarray
+        the values the density is estimated from
+    bw_method :
+        bandwidth method of scipy.stats.gaussian_kde
+    lower, upper : float
+        bounds of the density
+    ngrid, rtol :
+        as for GriddedDensity
+    """
+    density = gaussian_kde(dataset, bw_method)
+    width = 6 * np.sqrt(density.covariance[0, 0])
+    grid_lower = max(lower, np.min(dataset) - width)
+    grid_upper = min(upper, np.max(dataset) + width)
+    return GriddedDensity(density, grid_lower, grid_upper, ngrid=ngrid, rtol=rtol)
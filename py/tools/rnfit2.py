@@ -7,6 +7,18 @@ import pickle
 import matplotlib.pyplot as plt
 import os
 from scipy.optimize import curve_fit
+import npmodels
+import rnsampler
+import tracestore
+import rnrandom
+
+
+def map_values(mp):
+    """The values of the parameters of a pymc.MAP or npmodels.MAP fit"""
+    if isinstance(mp, npmodels.MAP):
+        return dict(zip(mp.logposterior.names, mp.values))
+    return dict([(s.__name__, s.value) for s in mp.stochastics])
+
 
 class Do_MCMC:
     def __init__(self, data):
@@ -29,13 +41,40 @@ class Do_MCMC:
         self.M = None
 
     # Do the PyMC fit
-    def okgo(self, pymcmodel, locations=None, MAP_only=None, db=None, dbname=None, estimate=None, seed=None, **kwargs):
+    def okgo(self, pymcmodel, locations=None, MAP_only=None, db=None, dbname=None, estimate=None, seed=None, backend='pymc', batch=False, profile=None, **kwargs):
         """Controls the PyMC fit of the input data
 
         Parameters
         ----------
         pymcmodel : the PyMC model we are using
         locations : which elements of the input data we are analyzing
+        MAP_only : if True, only find the MAP values and skip the sampling.
+                   The MAP values of each location are stored in the
+                   results under "MAP", and are identical to those found
+                   before sampling in a full run.
+        backend : 'pymc' or 'numpy'.  With 'numpy' the model is a function
+                  of (frequencies, power, estimate) that returns an
+                  npmodels.LogPosterior, which is sampled by rnsampler
+                  instead of PyMC.  The results have the same layout,
+                  plus the convergence "diagnostics" of the chains.  The
+                  keywords nchains and processes run several chains,
+                  optionally in separate processes, and target_ess
+                  samples until a target effective sample size is reached.
+                  db='columnar' stores the parameter samples of each
+                  location in a tracestore.TraceStore under dbname.
+        batch : with the numpy backend, sample all the locations at once,
+                one chain per location.  All the locations must share the
+                same frequencies, and the model function is given the
+                power spectra as an array [nlocations, nfreq].  The chains
+                start at the initial values of the model, as no MAP fit is
+                made.
+        seed : with the pymc backend, the global NumPy random state is
+               reseeded with it before each location.  With the numpy
+               backend it is a seed, RandomState or Generator for the
+               sampler, see rnrandom.get_random_state, and the global state
+               is left alone.
+        profile : with the numpy backend, an rnprofile.Profile that
+                  collects evaluation counts and timings of the run
         **kwargs : PyMC control keywords
         """
         self.seed = seed
@@ -53,6 +92,11 @@ class Do_MCMC:
         # Parameter estimates
         self.estimate = estimate
 
+        if batch:
+            if backend != 'numpy':
+                raise ValueError('Batched sampling needs the numpy backend.')
+            return self._okgo_batch(pymcmodel, db=db, dbname=dbname, profile=profile, **kwargs)
+
         for k in self.locations:
             # Progress
             #print(' ')
@@ -61,22 +105,46 @@ class Do_MCMC:
             self.pwr = self.data[k][1]
 
             # Start at the MAP
-            pymc.numpy.random.seed(self.seed)
+            if backend != 'numpy':
+                pymc.numpy.random.seed(self.seed)
             self.pymcmodel = pymcmodel(self.fpos, self.pwr, self.estimate)
-            mp = pymc.MAP(self.pymcmodel)
-            mp.fit(method='fmin_powell')
+            if backend == 'numpy':
+                mp = npmodels.MAP(self.pymcmodel)
+                mp.fit()
+            else:
+                mp = pymc.MAP(self.pymcmodel)
+                mp.fit(method='fmin_powell')
             #print mp.power_law_norm.value, mp.power_law_index.value, mp.background.value
-            #if MAP_only:
-            #    return mp
+            self.mp = mp
 
-            # Set up the MCMC model
-            if (db is not None) and (dbname is not None):
-                self.M = pymc.MCMC(mp.variables, db=db, dbname=dbname)
+            # Only the MAP values are wanted, so skip the sampling
+            if MAP_only:
+                self.results.append({"power": self.pwr,
+                                     "frequencies": self.fpos,
+                                     "location": k,
+                                     "MAP": map_values(mp)})
+                continue
+
+            if backend == 'numpy':
+                # Sample the plain NumPy posterior, with the chains starting
+                # about the MAP
+                self.M = rnsampler.MCMC(self.pymcmodel,
+                                        random_state=rnrandom.get_random_state(self.seed),
+                                        profile=profile)
+                self.M.sample(start=mp.values, **kwargs)
+
+                # Keep only the free parameters on disk
+                if (db == 'columnar') and (dbname is not None):
+                    tracestore.save(self.M, os.path.join(dbname, 'location%05i' % k))
             else:
-                self.M = pymc.MCMC(mp.variables)
+                # Set up the MCMC model
+                if (db is not None) and (dbname is not None):
+                    self.M = pymc.MCMC(mp.variables, db=db, dbname=dbname)
+                else:
+                    self.M = pymc.MCMC(mp.variables)
 
-            # Do the MCMC calculation
-            self.M.sample(**kwargs)
+                # Do the MCMC calculation
+                self.M.sample(**kwargs)
             #print mp.power_law_norm.value, mp.power_law_index.value, mp.background.value
 
             # Get the samples
@@ -86,15 +154,46 @@ class Do_MCMC:
                 if key not in ('fourier_power_spectrum', 'predictive'):
                     samples[key] = self.M.trace(key)[:]
 
-            #TODO: Get the MAP values and explicitly save them
-            self.mp = mp
-
             # Append the stats results and the samples
             self.results.append({"power": self.pwr,
                                  "frequencies": self.fpos,
                                  "location": k,
                                  "stats": self.M.stats(),
                                  "samples": samples})
+            if backend == 'numpy':
+                # Convergence of the chains
+                self.results[-1]["diagnostics"] = self.M.diagnostics()
+        return self
+
+    def _okgo_batch(self, pymcmodel, db=None, dbname=None, profile=None, **kwargs):
+        """Sample all the locations in lock-step with the numpy backend"""
+        self.fpos = self.data[self.locations[0]][0]
+        for k in self.locations:
+            if not np.array_equal(self.data[k][0], self.fpos):
+                raise ValueError('Batched sampling needs the same frequencies at every location.')
+        self.pwr = np.asarray([self.data[k][1] for k in self.locations])
+
+        # One chain per location, all evaluated with a single call
+        self.pymcmodel = pymcmodel(self.fpos, self.pwr, self.estimate)
+        self.M = rnsampler.MCMC(self.pymcmodel,
+                                random_state=rnrandom.get_random_state(self.seed),
+                                profile=profile)
+        self.M.sample(**kwargs)
+        self.mp = None
+
+        for i, k in enumerate(self.locations):
+            Mk = self.M.select(i)
+            samples = {}
+            for key in Mk.names:
+                samples[key] = Mk.trace(key)
+            if (db == 'columnar') and (dbname is not None):
+                tracestore.save(Mk, os.path.join(dbname, 'location%05i' % k))
+            self.results.append({"power": self.pwr[i],
+                                 "frequencies": self.fpos,
+                                 "location": k,
+                                 "stats": Mk.stats(),
+                                 "samples": samples,
+                                 "diagnostics": Mk.diagnostics()})
         return self
 
     def save(self, filename='Do_MCMC_output.pickle'):
@@ -0,0 +1,141 @@
+"""
+Laplace approximation to the posterior of many spectra at once.
+
+The posterior of each spectrum is approximated by a normal distribution
+centred on the MAP values with covariance given by the inverse of minus the
+Hessian of the log posterior at the maximum.  The approximation is cheap
+enough to apply to every pixel in a region, and it gives credible intervals
+that least-squares fits do not.  Spectra for which the approximation is
+likely to be poor are flagged so that only they need to be sampled with
+MCMC.
+"""
+
+import numpy as np
+import npmodels
+import rnsampler
+import rnrandom
+
+
+class Laplace:
+    def __init__(self, logposterior, start=None, nsamples=1000,
+                 boundary=3.0, outside=0.01, random_state=np.random):
+        """
+        Find the MAP values and the Laplace approximation to the posterior
+        of one spectrum or an array of spectra, and draw samples from it.
+
+        Parameters
+        ----------
+        logposterior : npmodels.LogPosterior
+            the posterior.  May hold an array of spectra [nspectra, nfreq].
+        start : ndarray
+            starting values of the MAP fit
+        nsamples : int
+            number of samples drawn from each approximate posterior
+        boundary : float
+            flag spectra whose MAP values lie within this many standard
+            deviations of a prior limit
+        outside : float
+            flag spectra for which more than this fraction of the
+            approximate posterior lies outside the prior
+        random_state : seed, numpy.random.RandomState or Generator
+            source of random numbers, see rnrandom.get_random_state
+
+        Attributes
+        ----------
+        parameters : ndarray[..., nparameters]
+            MAP values
+        covariance : ndarray[..., nparameters, nparameters]
+            covariance of the approximate posterior
+        logp : ndarray
+            log posterior at the maximum
+        converged : ndarray of bool
+            where the MAP fit converged
+        status : ndarray of int
+            why each MAP fit stopped, see npmodels.map_status
+        samples : ndarray[..., nsamples, nparameters]
+            draws from the approximate posterior
+        flagged : ndarray of bool
+            where the approximation is poor
+        reasons : dict
+            the individual tests behind flagged
+        """
+        self.logposterior = logposterior
+        self.names = logposterior.names
+        random_state = rnrandom.get_random_state(random_state)
+        self.random_state = random_state
+        answer = npmodels.bounded_map(logposterior, start=start)
+        self.parameters = answer["parameters"]
+        self.logp = answer["logp"]
+        self.converged = answer["converged"]
+        self.status = answer["status"]
+        nparameters = self.parameters.shape[-1]
+
+        # Covariance from the curvature at the maximum.  Where minus the
+        # Hessian is not positive definite there is no normal approximation.
+        with np.errstate(all='ignore'):
+            precision = -answer["hessian"]
+            finite = np.all(np.isfinite(precision), axis=(-2, -1))
+            eigenvalues = np.linalg.eigvalsh(np.where(finite[..., np.newaxis, np.newaxis], precision, -np.eye(nparameters)))
+            definite = np.all(eigenvalues > 0, axis=-1) & finite
+            safe = np.where(definite[..., np.newaxis, np.newaxis], precision, np.eye(nparameters))
+            self.covariance = np.linalg.inv(safe)
+            self.covariance[~definite] = np.nan
+            sd = np.sqrt(np.diagonal(self.covariance, axis1=-2, axis2=-1))
+
+        # Samples from the approximate posterior
+        z = random_state.standard_normal(size=self.parameters.shape[:-1] + (nsamples, nparameters))
+        chol = np.linalg.cholesky(np.where(definite[..., np.newaxis, np.newaxis], self.covariance, np.eye(nparameters)))
+        self.samples = self.parameters[..., np.newaxis, :] + np.einsum('...ij,...sj->...si', chol, z)
+        self.samples[~definite] = np.nan
+
+        # Tests of the approximation
+        with np.errstate(invalid='ignore'):
+            near_limit = np.any((self.parameters - logposterior.lower < boundary * sd) |
+                                (logposterior.upper - self.parameters < boundary * sd), axis=-1)
+        fraction_outside = 1.0 - np.mean(logposterior.within_prior(self.samples), axis=-1)
+        self.reasons = {"not converged": ~self.converged,
+                        "not positive definite": ~definite,
+                        "near prior limit": near_limit,
+                        "outside prior": fraction_outside > outside}
+        self.fraction_outside = fraction_outside
+        self.flagged = (~self.converged) | (~definite) | near_limit | (fraction_outside > outside)
+
+    def trace(self, name):
+        """
+        Samples of a parameter or derived node, [nsamples] for one spectrum
+        or [nsamples, nspectra] for an array of spectra.
+        """
+        if name in self.names:
+            x = self.samples[..., self.names.index(name)]
+        elif name == 'fourier_power_spectrum':
+            x = self.logposterior.spectrum(self.samples)
+        elif name == 'predictive':
+            x = self._predictive()
+        else:
+            raise KeyError(name)
+        if self.samples.ndim > 2:
+            # Samples first, as for the traces of a single spectrum
+            x = np.swapaxes(x, 0, 1)
+        return x
+
+    def _predictive(self):
+        if self.samples.ndim > 2:
+            # Each spectrum has its own observed power and uncertainty
+            theta = np.swapaxes(self.samples, 0, 1)
+            return np.swapaxes(self.logposterior.predictive(theta, random_state=self.random_state), 0, 1)
+        return self.logposterior.predictive(self.samples, random_state=self.random_state)
+
+    def stats(self, deterministic=False):
+        """
+        Summary statistics of the approximate posterior, with the same
+        fields as pymc.MCMC.stats().  For an array of spectra each field
+        holds the values for every spectrum.  The model spectrum and the
+        posterior predictive spectra are included if deterministic is True.
+        """
+        names = list(self.names)
+        if deterministic:
+            names = names + ['fourier_power_spectrum', 'predictive']
+        s = {}
+        for name in names:
+            s[name] = rnsampler.trace_stats(self.trace(name))
+        return s
@@ -0,0 +1,20 @@
+"""
+Limits on the parameters of the red noise models.
+
+These are the limits of the uniform priors shared by the PyMC models in
+pymcmodels2 and their NumPy versions in npmodels.
+"""
+
+import numpy as np
+
+
+# Limits on the fit
+limits = {"power_law_index": [1.0, 6.0],
+          "power_law_norm": [-10.0, np.log(100.0)],
+          "background": [-20.0, np.log(100.0)]}
+
+glimits = {"gaussian_amplitude": [-20.0*1000000, limits["power_law_norm"][1]],
+          "gaussian_width": [0.001, 3.00]}
+
+elimits = {"eda_amplitude": [-20.0, limits["power_law_norm"][1]],
+           "eda_index": [0.0, 10.0]}
@@ -0,0 +1,101 @@
+"""
+Optimizers for fitting the spectral models
+"""
+
+import numpy as np
+import rnrandom
+from scipy.optimize import curve_fit
+
+
+def multistart_curve_fit(model, x, y, p0, sigma=None, ncandidates=100,
+                         nrefine=10, scale=0.1, rtol=1e-6, max_error=10.0,
+                         random_state=np.random):
+    """
+    Least-squares fit of a model started from many places at once.  Fits of
+    models with a bump can fail or find a local minimum depending on where
+    they start.  This function scores a batch of candidate starting points
+    around p0 with a single vectorized evaluation of the model, and then
+    refines the candidates with curve_fit, best scoring first.  The first
+    refinement that converges to a chi-squared no worse than the score of
+    the best candidate, with every parameter determined by the data, is
+    accepted, so in the common case curve_fit is called once.  Otherwise
+    the best of the refinements is returned, preferring those with every
+    parameter determined.
+
+    Parameters
+    ----------
+    model : function
+        model(x, a) from rnspectralmodels.  Must accept an array of
+        parameter sets of shape (ncandidates, nparameters).
+    x, y : ndarray
+        data to fit
+    p0 : ndarray
+        initial estimate of the parameters.  Always the first candidate.
+    sigma : ndarray
+        uncertainty in y
+    ncandidates : int
+        number of candidate starting points
+    nrefine : int
+        maximum number of candidates refined with curve_fit
+    scale : float
+        candidates are drawn uniformly within +/- scale of p0
+    rtol : float
+        relative tolerance on the chi-squared of an accepted refinement
+    max_error : float
+        a parameter whose standard error from the covariance of curve_fit
+        is larger than this is not determined by the data.  Fits with such
+        a parameter have usually run off to where it no longer changes the
+        model, for example a component far below the others, and are
+        local minima.
+    random_state : seed, numpy.random.RandomState or Generator
+        source of the random candidates, see rnrandom.get_random_state
+
+    Returns
+    -------
+    popt, pcov : ndarray
+        as returned by curve_fit for the best fit found
+    """
+    p0 = np.asarray(p0, dtype=np.float64)
+    if sigma is None:
+        sigma = np.ones_like(y)
+
+    # Candidate starting points
+    candidates = p0 + rnrandom.get_random_state(random_state).uniform(-scale, scale, size=(ncandidates, p0.size))
+    candidates[0, :] = p0
+
+    # Score all the candidates with one vectorized call
+    with np.errstate(all='ignore'):
+        chi2 = np.sum(((y - model(x, candidates)) / sigma) ** 2, axis=1)
+    chi2[~np.isfinite(chi2)] = np.inf
+
+    def f(xx, *a):
+        return model(xx, np.asarray(a))
+
+    order = np.argsort(chi2, kind='mergesort')
+    target = chi2[order[0]] * (1.0 + rtol)
+    best = None
+    best_key = (False, np.inf)
+    for i in order[0:nrefine]:
+        if not np.isfinite(chi2[i]):
+            break
+        try:
+            answer = curve_fit(f, x, y, p0=candidates[i], sigma=sigma)
+        except RuntimeError:
+            continue
+        with np.errstate(all='ignore'):
+            this_chi2 = np.sum(((y - f(x, *answer[0])) / sigma) ** 2)
+        if not np.isfinite(this_chi2):
+            continue
+        with np.errstate(invalid='ignore'):
+            error = np.sqrt(np.diagonal(answer[1]))
+        determined = bool(np.all(error <= max_error))
+        if determined and this_chi2 <= target:
+            return answer
+        if (not best_key[0] and determined) or \
+                (best_key[0] == determined and this_chi2 < best_key[1]):
+            best = answer
+            best_key = (determined, this_chi2)
+
+    if best is None:
+        raise RuntimeError('No fit found from %i starting points.' % (min(nrefine, ncandidates)))
+    return best
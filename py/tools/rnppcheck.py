@@ -0,0 +1,156 @@
+"""
+Posterior predictive calibration of the likelihood ratio test statistic.
+
+To decide between a simple model M0 and a more complex model M1 the
+observed value of the likelihood ratio test statistic T_LRT is compared with
+its distribution when M0 is true.  That distribution is found by drawing
+spectra from the posterior predictive distribution of M0, and fitting both
+models to every draw.  Here all the draws are made with one batched call,
+and the fits are batched and spread over a pool of worker processes.
+"""
+
+import multiprocessing
+import numpy as np
+import npmodels
+import rnstatistics
+import rnrandom
+from rnstatistics import T_LRT
+
+
+def _refit_chunk(args):
+    """Fit a model to a chunk of spectra in a worker process"""
+    model, model_kwargs, f, power, sigma, start = args
+    init = np.tile(np.asarray(start, dtype=np.float64), (power.shape[0], 1))
+    lp = model(f, power, sigma, init=init, **model_kwargs)
+    answer = npmodels.bounded_map(lp)
+    with np.errstate(all='ignore'):
+        loglike = lp.loglike(answer["parameters"])
+    return answer["parameters"], loglike, answer["converged"]
+
+
+def refit(model, f, power, sigma, start, model_kwargs=None, chunk=250,
+          processes=None):
+    """
+    Fit a model to many spectra with the bounded MAP fit of npmodels.
+
+    Parameters
+    ----------
+    model : function
+        npmodels model, called as model(f, power, sigma, init=...,
+        **model_kwargs).  Must be picklable if processes is given.
+    f : ndarray[nfreq]
+        frequencies
+    power : ndarray[nspectra, nfreq]
+        the spectra to fit
+    sigma : ndarray
+        standard deviation of the spectra
+    start : ndarray[nparameters]
+        starting values for every fit
+    chunk : int
+        number of spectra fitted together
+    processes : int
+        if given, the chunks are fitted by this many worker processes
+
+    Returns
+    -------
+    parameters : ndarray[nspectra, nparameters]
+        best fit parameters
+    loglike : ndarray[nspectra]
+        log likelihood at the best fit
+    converged : ndarray[nspectra] of bool
+        whether each fit converged, see npmodels.bounded_map
+    """
+    if model_kwargs is None:
+        model_kwargs = {}
+    power = np.atleast_2d(power)
+    jobs = [(model, model_kwargs, f, power[i:i + chunk], sigma, start)
+            for i in range(0, power.shape[0], chunk)]
+    if processes is None:
+        fits = [_refit_chunk(job) for job in jobs]
+    else:
+        pool = multiprocessing.Pool(processes=processes)
+        try:
+            fits = pool.map(_refit_chunk, jobs)
+        finally:
+            pool.close()
+            pool.join()
+    return (np.concatenate([fit[0] for fit in fits]),
+            np.concatenate([fit[1] for fit in fits]),
+            np.concatenate([fit[2] for fit in fits]))
+
+
+def t_lrt_distribution(logposterior0, samples0, model0, model1, start0, start1,
+                       nsample=5000, observed=None, model0_kwargs=None,
+                       model1_kwargs=None, chunk=250, processes=None,
+                       random_state=np.random):
+    """
+    Posterior predictive distribution of T_LRT under the model M0.
+
+    Parameters
+    ----------
+    logposterior0 : npmodels.LogPosterior
+        posterior of M0 given the observed spectrum
+    samples0 : ndarray[ntrace, nparameters]
+        samples from the posterior of M0, for example from
+        rnsampler.MCMC.samples()
+    model0, model1 : function
+        the npmodels models refitted to each predictive spectrum
+    start0, start1 : ndarray
+        starting values of the fits, typically the fits to the data
+    nsample : int
+        number of predictive spectra.  Each posterior sample is used at
+        most once.
+    observed : float
+        the value of T_LRT for the data
+    model0_kwargs, model1_kwargs : dict
+        extra keywords of the models
+    chunk, processes :
+        as for refit
+    random_state : seed, numpy.random.RandomState or Generator
+        source of random numbers, see rnrandom.get_random_state
+
+    Returns
+    -------
+    dict
+        "index" : which posterior samples were used
+        "l0", "l1" : maximum log likelihoods of the fits to each spectrum
+        "converged0", "converged1" : whether the fits to each spectrum
+                                     converged
+        "t_lrt" : T_LRT of each spectrum
+        "good" : where both fits converged and T_LRT is finite and not
+                 negative.  A negative T_LRT means the fit of M1 did not
+                 find the best fit, as M1 contains M0.
+        "p_value" : fraction of the good T_LRT values at least as large
+                    as the observed value, if given
+    """
+    random_state = rnrandom.get_random_state(random_state)
+    samples0 = np.asarray(samples0)
+    nsample = min(nsample, samples0.shape[0])
+    index = random_state.choice(samples0.shape[0], size=nsample, replace=False)
+
+    # All the predictive spectra at once
+    predictive = logposterior0.predictive(samples0[index], random_state=random_state)
+
+    f = logposterior0.model.f
+    sigma = logposterior0.sigma
+    _, l0, converged0 = refit(model0, f, predictive, sigma, start0,
+                              model_kwargs=model0_kwargs, chunk=chunk,
+                              processes=processes)
+    _, l1, converged1 = refit(model1, f, predictive, sigma, start1,
+                              model_kwargs=model1_kwargs, chunk=chunk,
+                              processes=processes)
+    t_lrt = T_LRT(l0, l1)
+    with np.errstate(invalid='ignore'):
+        good = converged0 & converged1 & np.isfinite(t_lrt) & (t_lrt >= 0.0)
+
+    answer = {"index": index,
+              "l0": l0,
+              "l1": l1,
+              "converged0": converged0,
+              "converged1": converged1,
+              "t_lrt": t_lrt,
+              "good": good,
+              "p_value": None}
+    if observed is not None and np.any(good):
+        answer["p_value"] = rnstatistics.p_value(observed, t_lrt[good])
+    return answer
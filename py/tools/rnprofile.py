@@ -0,0 +1,96 @@
+"""
+Instrumentation of the samplers and the log posteriors.
+
+A Profile counts evaluations, accumulates the time spent in named parts of
+a calculation and records events such as the acceptance rate of the sampler
+at each tuning step.  Objects that accept a profile do nothing extra when
+they are not given one.  A profile is written out as JSON so that runs on
+different regions, models or versions of the code can be compared.
+"""
+
+import json
+import time
+import platform
+from contextlib import contextmanager
+import numpy as np
+
+
+class Profile:
+    def __init__(self, description=None):
+        """
+        Parameters
+        ----------
+        description : dict
+            what was run, for example the model, region and wavelength
+        """
+        self.description = description
+        self.counts = {}
+        self.times = {}
+        self.events = []
+        self.start = time.time()
+
+    def count(self, name, n=1):
+        """Add n to the counter name"""
+        self.counts[name] = self.counts.get(name, 0) + n
+
+    @contextmanager
+    def timer(self, name):
+        """Time a block of code and count how often it runs"""
+        t0 = time.time()
+        try:
+            yield
+        finally:
+            self.times[name] = self.times.get(name, 0.0) + (time.time() - t0)
+            self.count(name + ' calls')
+
+    def record(self, name, **values):
+        """Record an event with some values"""
+        event = {"name": name, "time": time.time() - self.start}
+        event.update(values)
+        self.events.append(event)
+
+    def summary(self):
+        """Everything recorded, as a dictionary"""
+        return {"description": self.description,
+                "python": platform.python_version(),
+                "numpy": np.__version__,
+                "elapsed": time.time() - self.start,
+                "counts": self.counts,
+                "times": self.times,
+                "events": self.events}
+
+    def save(self, filename):
+        """Write the profile as JSON"""
+        f = open(filename, 'w')
+        json.dump(self.summary(), f, indent=1, sort_keys=True, default=_jsonable)
+        f.close()
+        return self
+
+
+def _jsonable(obj):
+    """Convert numpy values for JSON"""
+    if hasattr(obj, 'tolist'):
+        return obj.tolist()
+    return str(obj)
+
+
+@contextmanager
+def timer(profile, name):
+    """Time a block of code if there is a profile, otherwise do nothing"""
+    if profile is None:
+        yield
+    else:
+        with profile.timer(name):
+            yield
+
+
+def count(profile, name, n=1):
+    """Add to a counter if there is a profile"""
+    if profile is not None:
+        profile.count(name, n)
+
+
+def record(profile, name, **values):
+    """Record an event if there is a profile"""
+    if profile is not None:
+        profile.record(name, **values)
@@ -0,0 +1,108 @@
+"""
+Random number streams for the simulations, samplers and predictive checks.
+
+Everything that draws random numbers takes a random_state argument.  It can
+be a seed, a numpy.random.RandomState, a numpy.random.Generator, or
+numpy.random itself (the global state, the default).  get_random_state turns
+any of these into something with the RandomState methods used here.
+
+Work that is split between processes must not share a stream.  spawn makes
+independent child seeds from one root, so that each worker has its own
+stream and a parallel run can be reproduced exactly from the root seed.
+Where numpy.random.SeedSequence is available the children are spawned from
+it, which guarantees that the streams do not overlap.  With older versions
+of NumPy the child seeds are drawn from a RandomState seeded with the root.
+"""
+
+import numpy as np
+
+# numpy.random.SeedSequence and the bit generators are in NumPy >= 1.17
+_seed_sequence = hasattr(np.random, 'SeedSequence')
+
+# Largest seed accepted by numpy.random.RandomState
+_max_seed = 2 ** 32 - 1
+
+
+def get_random_state(seed=None):
+    """
+    A source of random numbers.
+
+    Parameters
+    ----------
+    seed : None, int, array of int, numpy.random.SeedSequence,
+           numpy.random.RandomState, numpy.random.Generator or numpy.random
+        None and numpy.random give the global state of numpy.random.
+        Seeds give a new RandomState.  RandomState and Generator objects
+        are returned as they are.
+
+    Returns
+    -------
+    an object with the methods of numpy.random.RandomState, or a
+    numpy.random.Generator
+    """
+    if seed is None or seed is np.random:
+        return np.random
+    if isinstance(seed, np.random.RandomState):
+        return seed
+    if _seed_sequence:
+        if isinstance(seed, np.random.Generator):
+            return seed
+        if isinstance(seed, np.random.SeedSequence):
+            return np.random.RandomState(np.random.MT19937(seed))
+    return np.random.RandomState(seed)
+
+
+def spawn(seed, n):
+    """
+    Independent child seeds of a root, one for each of n workers.  Pass
+    each child to get_random_state in the worker.
+
+    Parameters
+    ----------
+    seed : as for get_random_state
+        the root.  If it is a RandomState or a Generator the root seed is
+        drawn from it, so the children depend on its state.
+    n : int
+        number of children
+
+    Returns
+    -------
+    list
+        n picklable seeds
+    """
+    if not isinstance(seed, (int, np.integer, list, tuple, np.ndarray)) and \
+            not (_seed_sequence and isinstance(seed, np.random.SeedSequence)):
+        seed = integers(get_random_state(seed), 0, _max_seed, size=4).tolist()
+    if _seed_sequence:
+        if not isinstance(seed, np.random.SeedSequence):
+            seed = np.random.SeedSequence(seed)
+        return seed.spawn(n)
+    return list(np.random.RandomState(seed).randint(0, _max_seed, size=n))
+
+
+def spawn_random_states(seed, n):
+    """n independent sources of random numbers from one root seed"""
+    return [get_random_state(child) for child in spawn(seed, n)]
+
+
+def integers(random_state, low, high, size=None):
+    """Random integers from low (inclusive) to high (exclusive), for both a
+    RandomState and a Generator"""
+    if hasattr(random_state, 'integers'):
+        return random_state.integers(low, high, size=size)
+    return random_state.randint(low, high, size=size)
+
+
+def get_state(random_state):
+    """The state of a source of random numbers, to save in a checkpoint"""
+    if _seed_sequence and isinstance(random_state, np.random.Generator):
+        return random_state.bit_generator.state
+    return random_state.get_state()
+
+
+def set_state(random_state, state):
+    """Restore the state saved by get_state"""
+    if _seed_sequence and isinstance(random_state, np.random.Generator):
+        random_state.bit_generator.state = state
+    else:
+        random_state.set_state(state)
@@ -0,0 +1,672 @@
+"""
+A lightweight Metropolis sampler for the NumPy log posteriors in npmodels.
+
+The sampler runs any number of independent chains in lock-step.  The log
+posterior is evaluated for all the chains with a single call, so the cost of
+each step is a handful of array operations.  Chains can also be spread over
+separate processes, and their convergence checked with the Gelman-Rubin
+statistic and the effective sample size.
+"""
+
+import time
+import multiprocessing
+import numpy as np
+import rnprofile
+import rnrandom
+
+# Quantiles reported in the summary statistics, as in PyMC
+_quantiles = (2.5, 25, 50, 75, 97.5)
+
+
+def metropolis(logp, start, iter, burn=0, thin=1, cov=None,
+               tune_interval=1000, profile=None, random_state=np.random):
+    """
+    Sample a log posterior using the Metropolis algorithm.  The proposal
+    distribution is a multivariate normal distribution.  During the burn-in
+    its covariance is adapted every tune_interval steps to the covariance of
+    the samples so far, and its scale is tuned to the acceptance rate.  The
+    proposal distribution is fixed after the burn-in.
+
+    Parameters
+    ----------
+    logp : function
+        log posterior.  Takes an array of parameters [nchains, nparameters]
+        and returns log posterior values [nchains].
+    start : ndarray[nchains, nparameters]
+        starting position of each chain
+    iter : int
+        total number of iterations, including the burn-in
+    burn : int
+        number of iterations to discard
+    thin : int
+        keep one in every thin iterations after the burn-in
+    cov : ndarray
+        initial covariance of the proposal distribution, either one matrix
+        for all chains or one matrix per chain
+    tune_interval : int
+        number of iterations between adaptations of the proposal
+    profile : rnprofile.Profile
+        if given, the run is timed and the acceptance rate and proposal
+        scale are recorded at every tuning step and at the end of the run
+
+    Returns
+    -------
+    dict
+        "trace" : ndarray[nkept, nchains, nparameters] kept samples
+        "logp" : ndarray[nkept, nchains] log posterior of the kept samples
+        "acceptance" : ndarray[nchains] acceptance rate after the burn-in
+        "cov" : ndarray[nchains, nparameters, nparameters] covariance of the
+                proposal distribution
+        "scale" : ndarray[nchains] scale factor of the proposal distribution
+    """
+    t0 = time.time()
+    x = np.array(start, dtype=np.float64)
+    nchains, nparameters = x.shape
+    if cov is None:
+        cov = np.diag((0.1 * np.maximum(np.abs(x).mean(axis=0), 0.1)) ** 2)
+    cov = np.array(np.broadcast_to(cov, (nchains, nparameters, nparameters)))
+    chol = np.linalg.cholesky(cov)
+    scale = np.ones(nchains)
+
+    lp = logp(x)
+    nkept = max(0, (iter - burn + thin - 1) // thin)
+    trace = np.zeros((nkept, nchains, nparameters))
+    trace_logp = np.zeros((nkept, nchains))
+    burn_trace = np.zeros((burn, nchains, nparameters))
+    accepted = np.zeros(nchains)
+    tune_accepted = np.zeros(nchains)
+
+    k = 0
+    for i in range(0, iter):
+        # Propose and accept or reject for all the chains at once
+        z = random_state.standard_normal(size=(nchains, nparameters))
+        proposal = x + scale[:, np.newaxis] * np.einsum('cij,cj->ci', chol, z)
+        lp_proposal = logp(proposal)
+        u = np.log(random_state.uniform(size=nchains))
+        accept = u < lp_proposal - lp
+        x[accept] = proposal[accept]
+        lp[accept] = lp_proposal[accept]
+
+        if i < burn:
+            burn_trace[i] = x
+            tune_accepted = tune_accepted + accept
+            if (i + 1) % tune_interval == 0:
+                rate = tune_accepted / (1.0 * tune_interval)
+                scale = scale * _tuning_factor(rate)
+                rnprofile.record(profile, 'tune', iteration=i + 1,
+                                 acceptance=rate, scale=scale.copy())
+                tune_accepted[:] = 0.0
+                # Adapt to the covariance of the second half of the samples
+                # so far
+                recent = burn_trace[(i + 1) // 2:i + 1]
+                if recent.shape[0] > 2 * nparameters:
+                    chol = _adapted_cholesky(recent, chol)
+                    scale[:] = 1.0
+        else:
+            accepted = accepted + accept
+            if (i - burn) % thin == 0:
+                trace[k] = x
+                trace_logp[k] = lp
+                k = k + 1
+
+    nafter = max(1, iter - burn)
+    if profile is not None:
+        elapsed = time.time() - t0
+        profile.times['sampler'] = profile.times.get('sampler', 0.0) + elapsed
+        profile.count('sampler iterations', iter)
+        profile.record('block', iterations=iter, burn=burn, seconds=elapsed,
+                       acceptance=accepted / (1.0 * nafter), scale=scale.copy())
+    return {"trace": trace,
+            "logp": trace_logp,
+            "acceptance": accepted / (1.0 * nafter),
+            "cov": np.einsum('cij,ckj->cik', chol, chol) * (scale ** 2)[:, np.newaxis, np.newaxis],
+            "scale": scale}
+
+
+def _tuning_factor(rate):
+    """Change in the proposal scale given the acceptance rate, following the
+    tuning rules of PyMC's Metropolis step method"""
+    factor = np.ones_like(rate)
+    factor[rate < 0.001] = 0.1
+    factor[(rate >= 0.001) & (rate < 0.05)] = 0.5
+    factor[(rate >= 0.05) & (rate < 0.2)] = 0.9
+    factor[(rate > 0.5) & (rate <= 0.75)] = 1.1
+    factor[(rate > 0.75) & (rate <= 0.95)] = 2.0
+    factor[rate > 0.95] = 10.0
+    return factor
+
+
+def _adapted_cholesky(samples, chol):
+    """Cholesky factor of the optimal proposal covariance estimated from
+    samples[nsamples, nchains, nparameters]"""
+    nparameters = samples.shape[2]
+    centred = samples - samples.mean(axis=0)
+    cov = np.einsum('sci,scj->cij', centred, centred) / (samples.shape[0] - 1.0)
+    cov = cov * (2.38 ** 2) / nparameters
+    cov = cov + 1e-10 * np.eye(nparameters)
+    new_chol = chol.copy()
+    for c in range(0, cov.shape[0]):
+        try:
+            new_chol[c] = np.linalg.cholesky(cov[c])
+        except np.linalg.LinAlgError:
+            # Keep the existing proposal for this chain
+            pass
+    return new_chol
+
+
+def hpd(x, alpha=0.05):
+    """
+    Highest posterior density interval of samples x[nsamples, ...], the
+    narrowest interval that contains a fraction 1 - alpha of the samples.
+    """
+    x = np.sort(np.asarray(x), axis=0)
+    n = x.shape[0]
+    nin = int(np.floor((1.0 - alpha) * n))
+    if nin >= n:
+        return np.asarray([x[0], x[-1]])
+    widths = x[nin:] - x[0:n - nin]
+    imin = np.argmin(widths, axis=0)
+    index = np.indices(imin.shape)
+    return np.asarray([x[(imin,) + tuple(index)],
+                       x[(imin + nin,) + tuple(index)]])
+
+
+def mc_error(x, batches=100):
+    """Monte Carlo standard error of the mean estimated by batch means"""
+    x = np.asarray(x)
+    nbatch = x.shape[0] // batches
+    if nbatch < 1:
+        return np.std(x, axis=0) / np.sqrt(x.shape[0])
+    means = x[0:nbatch * batches].reshape((batches, nbatch) + x.shape[1:]).mean(axis=1)
+    return np.std(means, axis=0) / np.sqrt(batches)
+
+
+def _chain_worker(args):
+    """Run one chain in a worker process"""
+    logposterior, start, iter, burn, thin, cov, tune_interval, seed = args
+    return metropolis(logposterior.logp, np.atleast_2d(start), iter,
+                      burn=burn, thin=thin, cov=cov,
+                      tune_interval=tune_interval,
+                      random_state=rnrandom.get_random_state(seed))
+
+
+def parallel_metropolis(logposterior, start, iter, burn=0, thin=1, cov=None,
+                        tune_interval=1000, seeds=None, processes=None):
+    """
+    Run independent chains of the Metropolis sampler in separate processes
+    and merge the results.  Each chain has its own stream of random numbers.
+
+    Parameters
+    ----------
+    logposterior : npmodels.LogPosterior
+        the posterior to sample.  Must be picklable.
+    start : ndarray[nchains, nparameters]
+        starting position of each chain
+    seeds : list
+        one random seed per chain.  By default independent seeds are
+        spawned from the root seed 0, see rnrandom.spawn.
+    processes : int
+        number of worker processes.  Defaults to the number of CPUs.
+
+    The other keywords are as for metropolis.
+
+    Returns
+    -------
+    dict
+        as for metropolis, with the chains in the same order as start
+    """
+    start = np.atleast_2d(start)
+    nchains = start.shape[0]
+    if seeds is None:
+        seeds = rnrandom.spawn(0, nchains)
+    jobs = [(logposterior, start[c], iter, burn, thin, cov, tune_interval, seeds[c])
+            for c in range(0, nchains)]
+    pool = multiprocessing.Pool(processes=processes)
+    try:
+        chains = pool.map(_chain_worker, jobs)
+    finally:
+        pool.close()
+        pool.join()
+    return {"trace": np.concatenate([c["trace"] for c in chains], axis=1),
+            "logp": np.concatenate([c["logp"] for c in chains], axis=1),
+            "acceptance": np.concatenate([c["acceptance"] for c in chains]),
+            "cov": np.concatenate([c["cov"] for c in chains]),
+            "scale": np.concatenate([c["scale"] for c in chains])}
+
+
+def overdispersed_start(logposterior, start, seeds, dispersion=0.05, tries=100):
+    """
+    Starting positions scattered about a single position, one per chain, so
+    that the convergence diagnostics can detect chains that have not
+    forgotten where they started.  Each chain starts at the position plus a
+    normal draw from a stream spawned from its seed, with a standard deviation of
+    dispersion times the width of the prior of each parameter, clipped to
+    the prior limits.  Draws outside the support of the posterior are
+    repeated up to tries times, after which the chain starts at the
+    position itself.
+
+    Parameters
+    ----------
+    logposterior : npmodels.LogPosterior
+        the posterior to be sampled
+    start : ndarray[nparameters]
+        the position, for example the MAP values
+    seeds : list
+        one seed per chain, see rnrandom.spawn
+    dispersion : float
+        standard deviation of the scatter as a fraction of the prior width
+
+    Returns
+    -------
+    ndarray[nchains, nparameters]
+    """
+    start = np.asarray(start, dtype=np.float64)
+    width = logposterior.upper - logposterior.lower
+    sd = np.where(np.isfinite(width), dispersion * width,
+                  0.1 * np.maximum(np.abs(start), 0.1))
+    answer = np.tile(start, (len(seeds), 1))
+    for c, seed in enumerate(seeds):
+        # A child of the chain's stream, so that the chain does not reuse
+        # the numbers that placed it
+        random_state = rnrandom.get_random_state(rnrandom.spawn(seed, 1)[0])
+        for i in range(0, tries):
+            x = np.clip(start + sd * random_state.standard_normal(size=start.shape),
+                        logposterior.lower, logposterior.upper)
+            if np.isfinite(logposterior.logp(x[np.newaxis, :])[0]):
+                answer[c] = x
+                break
+    return answer
+
+
+#
+# Convergence diagnostics
+#
+def _split_chains(trace):
+    """Split each chain in half, trace[nsamples, nchains, ...]"""
+    n = trace.shape[0] // 2
+    return np.concatenate((trace[0:n], trace[n:2 * n]), axis=1)
+
+
+def gelman_rubin(trace):
+    """
+    Gelman-Rubin potential scale reduction factor R-hat of each parameter,
+    calculated with split chains.  Values close to 1 indicate that the
+    chains have converged to the same distribution.
+
+    Parameters
+    ----------
+    trace : ndarray[nsamples, nchains, nparameters]
+        samples from one or more chains
+
+    Returns
+    -------
+    ndarray[nparameters]
+    """
+    x = _split_chains(np.asarray(trace))
+    n = x.shape[0]
+    chain_means = x.mean(axis=0)
+    B = n * np.var(chain_means, axis=0, ddof=1)
+    W = np.mean(np.var(x, axis=0, ddof=1), axis=0)
+    var_plus = (n - 1.0) / n * W + B / n
+    with np.errstate(all='ignore'):
+        return np.sqrt(var_plus / W)
+
+
+def effective_sample_size(trace):
+    """
+    Effective sample size of each parameter, combining the autocorrelation
+    of all the chains and truncating the sum of autocorrelations with
+    Geyer's initial positive sequence.
+
+    Parameters
+    ----------
+    trace : ndarray[nsamples, nchains, nparameters]
+        samples from one or more chains
+
+    Returns
+    -------
+    ndarray[nparameters]
+    """
+    x = np.asarray(trace)
+    n, m, nparameters = x.shape
+    centred = x - x.mean(axis=0)
+
+    # Autocovariance of each chain from the FFT
+    nfft = 2 ** int(np.ceil(np.log2(2 * n)))
+    F = np.fft.rfft(centred, n=nfft, axis=0)
+    acov = np.fft.irfft(F * np.conj(F), n=nfft, axis=0)[0:n] / n
+
+    chain_var = acov[0] * n / (n - 1.0)
+    W = chain_var.mean(axis=0)
+    var_plus = W * (n - 1.0) / n
+    if m > 1:
+        var_plus = var_plus + np.var(x.mean(axis=0), axis=0, ddof=1)
+
+    ess = np.zeros(nparameters)
+    for j in range(0, nparameters):
+        if not var_plus[j] > 0:
+            ess[j] = np.nan
+            continue
+        rho = 1.0 - (W[j] - acov[:, :, j].mean(axis=1)) / var_plus[j]
+        # Sum adjacent pairs of autocorrelations while they are positive
+        npairs = (n - 1) // 2
+        pairs = rho[0:2 * npairs:2] + rho[1:2 * npairs:2]
+        negative = np.nonzero(pairs < 0)[0]
+        if negative.size > 0:
+            pairs = pairs[0:negative[0]]
+        tau = -1.0 + 2.0 * np.sum(pairs)
+        ess[j] = m * n / max(tau, 1.0 / np.log10(m * n + 10.0))
+    return ess
+
+
+def _burned_in(block_logp):
+    """
+    Which chains have stopped climbing towards the bulk of the posterior.
+    The mean log posterior of the second half of the block must not exceed
+    that of the first half by more than half the spread of the log
+    posterior in the second half.
+    """
+    n = block_logp.shape[0] // 2
+    first = block_logp[0:n]
+    second = block_logp[n:2 * n]
+    rise = np.mean(second, axis=0) - np.mean(first, axis=0)
+    return rise < 0.5 * np.std(second, axis=0)
+
+
+def ess_targeted_metropolis(logp, start, target_ess, max_iter, block=5000,
+                            thin=1, cov=None, tune_interval=1000,
+                            independent=False, checkpoint=None,
+                            profile=None, random_state=np.random):
+    """
+    Run the Metropolis sampler until every parameter reaches a target
+    effective sample size.  The sampler runs in blocks of iterations.  The
+    proposal is adapted during the burn-in, which ends at the first block in
+    which the log posterior no longer rises.  After the burn-in the proposal
+    is fixed and blocks are added until the effective sample size of every
+    parameter reaches the target, or the budget of iterations is spent.
+
+    Parameters
+    ----------
+    logp : function
+        log posterior, as for metropolis
+    start : ndarray[nchains, nparameters]
+        starting position of each chain
+    target_ess : float
+        effective sample size required for every parameter
+    max_iter : int
+        maximum number of iterations, including the burn-in, which uses at
+        most half of them.  A ValueError is raised if that half, or block,
+        is less than twice tune_interval.
+    block : int
+        number of iterations in each block.  Should be at least twice
+        tune_interval.
+    thin : int
+        keep one in every thin iterations after the burn-in
+    independent : bool
+        if True each chain samples a different posterior, and every chain
+        must reach the target on its own
+    checkpoint : campaign.Checkpoint
+        if given, the state of the sampler is saved after every block, and
+        a run that was interrupted continues from its last saved block
+    profile : rnprofile.Profile
+        if given, each block is profiled and the effective sample size is
+        recorded after each block
+
+    The other keywords are as for metropolis.
+
+    Returns
+    -------
+    dict
+        as for metropolis, plus
+        "burn" : number of iterations in the burn-in
+        "iter" : total number of iterations
+        "ess" : ndarray[nparameters] effective sample size reached
+        "converged" : True if the target was reached within the budget
+    """
+    # The burn-in has half the budget, and adapts the proposal in the first
+    # half of each of its blocks
+    burn_budget = max_iter // 2
+    if min(block, burn_budget) // 2 < tune_interval:
+        raise ValueError('A burn-in block of %i iterations cannot cover one tuning interval of %i iterations; increase max_iter or block.' % (min(block, burn_budget), tune_interval))
+
+    x = np.atleast_2d(start)
+    state = {"x": x,
+             "cov": cov,
+             "niter": 0,
+             "settled": np.zeros(x.shape[0], dtype=bool),
+             "burn": None,
+             "traces": [],
+             "logps": [],
+             "accepted": 0.0,
+             "ess": np.zeros(x.shape[1])}
+    if checkpoint is not None:
+        saved = checkpoint.load()
+        if saved is not None:
+            state = saved
+            rnrandom.set_state(random_state, state["random_state"])
+
+    def save():
+        if checkpoint is not None:
+            state["random_state"] = rnrandom.get_state(random_state)
+            checkpoint.save(state)
+
+    # Burn-in.  The proposal is adapted in the first half of each block and
+    # the second half is used to judge if the chains have settled.  A chain
+    # that has settled once stays settled.  At most half the budget is used,
+    # and the burn-in ends when what is left cannot cover a tuning interval.
+    while state["burn"] is None:
+        n = min(block, burn_budget - state["niter"])
+        run = metropolis(logp, state["x"], n, burn=n // 2, thin=1,
+                         cov=state["cov"], tune_interval=tune_interval,
+                         profile=profile, random_state=random_state)
+        state["niter"] = state["niter"] + n
+        state["x"] = run["trace"][-1]
+        state["cov"] = run["cov"]
+        state["settled"] = state["settled"] | _burned_in(run["logp"])
+        if np.all(state["settled"]) or \
+                (burn_budget - state["niter"]) // 2 < tune_interval:
+            state["burn"] = state["niter"]
+        save()
+
+    # Sample with the proposal fixed until the target is reached
+    while state["niter"] < max_iter and not np.all(state["ess"] >= target_ess):
+        n = min(block, max_iter - state["niter"])
+        run = metropolis(logp, state["x"], n, burn=0, thin=thin,
+                         cov=state["cov"], profile=profile,
+                         random_state=random_state)
+        state["niter"] = state["niter"] + n
+        state["x"] = run["trace"][-1]
+        state["traces"].append(run["trace"])
+        state["logps"].append(run["logp"])
+        state["accepted"] = state["accepted"] + run["acceptance"] * n
+        trace = np.concatenate(state["traces"])
+        if independent:
+            state["ess"] = np.min([effective_sample_size(trace[:, c:c + 1, :])
+                                   for c in range(0, trace.shape[1])], axis=0)
+        else:
+            state["ess"] = effective_sample_size(trace)
+        rnprofile.record(profile, 'ess', iteration=state["niter"], ess=state["ess"])
+        save()
+
+    x = state["x"]
+    traces = state["traces"]
+    logps = state["logps"]
+    if len(traces) == 0:
+        traces = [np.zeros((0,) + x.shape)]
+        logps = [np.zeros((0, x.shape[0]))]
+    return {"trace": np.concatenate(traces),
+            "logp": np.concatenate(logps),
+            "acceptance": state["accepted"] / max(1.0, state["niter"] - state["burn"]),
+            "cov": state["cov"],
+            "scale": np.ones(x.shape[0]),
+            "burn": state["burn"],
+            "iter": state["niter"],
+            "ess": state["ess"],
+            "converged": bool(np.all(state["ess"] >= target_ess))}
+
+
+def trace_stats(x, alpha=0.05):
+    """
+    Summary statistics of a trace x[nsamples, ...] in the same layout as
+    PyMC's stats().
+    """
+    x = np.asarray(x)
+    interval = hpd(x, alpha=alpha)
+    if interval.ndim > 1:
+        # One row per element, as for a PyMC vector node
+        interval = np.rollaxis(interval, 0, interval.ndim)
+    q = np.percentile(x, _quantiles, axis=0)
+    return {"n": x.shape[0],
+            "standard deviation": np.std(x, axis=0),
+            "mean": np.mean(x, axis=0),
+            "%s%s HPD interval" % (int(100 * (1 - alpha)), '%'): interval,
+            "mc error": mc_error(x),
+            "quantiles": dict(zip(_quantiles, q))}
+
+
+class MCMC:
+    def __init__(self, logposterior, random_state=np.random, profile=None):
+        """
+        Sample an npmodels.LogPosterior with the Metropolis algorithm.  The
+        results are accessed through trace() and stats() as they are for a
+        pymc.MCMC object.  The 'fourier_power_spectrum' and 'predictive'
+        nodes are calculated from the parameter samples when requested.
+
+        Parameters
+        ----------
+        logposterior : npmodels.LogPosterior
+            the posterior to sample
+        random_state : seed, numpy.random.RandomState or Generator
+            source of random numbers, see rnrandom.get_random_state.  Chains
+            run in separate processes get streams spawned from it.
+        profile : rnprofile.Profile
+            if given, the sampler and the log posterior are profiled.
+            Chains run in separate processes are not profiled.
+        """
+        self.logposterior = logposterior
+        self.random_state = rnrandom.get_random_state(random_state)
+        self.profile = profile
+        if profile is not None:
+            logposterior.profile = profile
+        self.names = logposterior.names
+        self.results = None
+        self._predictive = None
+
+    def sample(self, iter, burn=0, thin=1, start=None, cov=None,
+               tune_interval=1000, progress_bar=False, verbose=0,
+               nchains=None, processes=None, target_ess=None, block=5000,
+               checkpoint=None, dispersion=0.05):
+        """
+        Run the sampler.  The keywords are the same as those of
+        pymc.MCMC.sample, plus
+
+        nchains : int
+            number of chains.  Chains given a single starting position
+            start scattered about it, see overdispersed_start.
+        processes : int
+            if given, run each chain in a separate process using this many
+            worker processes.  Otherwise the chains run in lock-step in
+            this process.
+        target_ess : float
+            if given, sample until every parameter reaches this effective
+            sample size.  iter is then the maximum number of iterations,
+            and burn is ignored as the burn-in is detected automatically.
+            See ess_targeted_metropolis.
+        block : int
+            number of iterations per block when target_ess is given
+        checkpoint : campaign.Checkpoint
+            where the sampler state is saved after each block when
+            target_ess is given, so an interrupted run can be resumed
+        dispersion : float
+            scatter of the starting positions of the chains, as a fraction
+            of the prior width of each parameter
+        """
+        if start is None:
+            start = self.logposterior.init
+        start = np.atleast_2d(start)
+        seeds = None
+        if nchains is not None and start.shape[0] != nchains:
+            # Each chain has its own stream, used for its starting position
+            # and, in a separate process, for its samples
+            seeds = rnrandom.spawn(self.random_state, nchains)
+            start = overdispersed_start(self.logposterior, start[0], seeds,
+                                        dispersion=dispersion)
+        if progress_bar:
+            print('Sampling %i iterations, %i chain(s)' % (iter, start.shape[0]))
+        if target_ess is not None:
+            if processes is not None:
+                raise ValueError('target_ess runs the chains in lock-step and cannot be combined with processes.')
+            self.results = ess_targeted_metropolis(self.logposterior.logp, start,
+                                                   target_ess, iter, block=block,
+                                                   thin=thin, cov=cov,
+                                                   tune_interval=tune_interval,
+                                                   independent=self.logposterior.power.ndim > 1,
+                                                   checkpoint=checkpoint,
+                                                   profile=self.profile,
+                                                   random_state=self.random_state)
+        elif processes is None:
+            self.results = metropolis(self.logposterior.logp, start, iter,
+                                      burn=burn, thin=thin, cov=cov,
+                                      tune_interval=tune_interval,
+                                      profile=self.profile,
+                                      random_state=self.random_state)
+        else:
+            if seeds is None:
+                seeds = rnrandom.spawn(self.random_state, start.shape[0])
+            self.results = parallel_metropolis(self.logposterior, start, iter,
+                                               burn=burn, thin=thin, cov=cov,
+                                               tune_interval=tune_interval,
+                                               seeds=seeds, processes=processes)
+        self._predictive = None
+        return self
+
+    def select(self, chain):
+        """
+        The results of one chain.  When each chain samples a different
+        spectrum, the log posterior is restricted to that spectrum.
+        """
+        M = MCMC(self.logposterior.select(chain), random_state=self.random_state)
+        M.results = dict(self.results)
+        for key in ("trace", "logp"):
+            M.results[key] = self.results[key][:, chain:chain + 1]
+        for key in ("acceptance", "cov", "scale"):
+            M.results[key] = self.results[key][chain:chain + 1]
+        return M
+
+    def samples(self):
+        """All the parameter samples, chains concatenated, [nkept, nparameters]"""
+        trace = self.results["trace"]
+        return np.swapaxes(trace, 0, 1).reshape(-1, trace.shape[2])
+
+    def trace(self, name):
+        """Samples of a parameter or derived node"""
+        theta = self.samples()
+        if name in self.names:
+            return theta[:, self.names.index(name)]
+        if name == 'fourier_power_spectrum':
+            return self.logposterior.spectrum(theta)
+        if name == 'predictive':
+            if self._predictive is None:
+                self._predictive = self.logposterior.predictive(theta, random_state=self.random_state)
+            return self._predictive
+        raise KeyError(name)
+
+    def stats(self):
+        """Summary statistics of all the parameters and derived nodes"""
+        s = {}
+        for name in self.names + ['fourier_power_spectrum', 'predictive']:
+            s[name] = trace_stats(self.trace(name))
+        return s
+
+    def diagnostics(self):
+        """
+        Convergence diagnostics of each parameter: the Gelman-Rubin "R-hat"
+        over the chains and the effective sample size "ESS" of the merged
+        trace.
+        """
+        rhat = gelman_rubin(self.results["trace"])
+        ess = effective_sample_size(self.results["trace"])
+        d = {}
+        for i, name in enumerate(self.names):
+            d[name] = {"R-hat": rhat[i], "ESS": ess[i]}
+        return d
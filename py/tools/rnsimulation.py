@@ -5,7 +5,7 @@ Red noise simulation functions
 import numpy as np
 import rnspectralmodels
 import copy
-from scipy.stats import chi2, uniform
+import rnrandom
 from matplotlib import pyplot as plt
 
 
@@ -38,12 +38,12 @@ class PowerLawPowerSpectrum:
         """
         return None
 
-    def sample(self):
+    def sample(self, random_state=np.random):
         """
         Return a noisy power spectrum sampled from the probability distribution
         of the noisy spectra
         """
-        return noisy_power_spectrum(self.power())
+        return noisy_power_spectrum(self.power(), random_state=rnrandom.get_random_state(random_state))
 
 
 class ConstantSpectrum(PowerLawPowerSpectrum):
@@ -67,7 +67,8 @@ class BrokenPowerLaw(PowerLawPowerSpectrum):
 
 
 class TimeSeriesFromPowerSpectrum():
-    def __init__(self, powerspectrum, V=10, W=10, fft_zero=0.0, **kwargs):
+    def __init__(self, powerspectrum, V=10, W=10, fft_zero=0.0, folded=False,
+                 full_circle=False, random_state=np.random, **kwargs):
         """
         Create a time series with a given type of power spectrum.  This object
         can be used to generate time series that have a given power spectrum.
@@ -95,7 +96,23 @@ class TimeSeriesFromPowerSpectrum():
         fft_zero : scalar number
             The value at the zero Fourier frequency.
 
+        folded : bool
+            if True the time series of length nt is made directly from the
+            oversampled power spectrum folded onto its Fourier frequencies,
+            see folded_power_spectrum.  The oversampled time series is not
+            made, so the cost scales with nt rather than V*W*nt.  The folded
+            time series are distributed as those made with full_circle=True,
+            which must be given.
+
+        full_circle : bool
+            if True the random phases are uniform over the whole circle,
+            otherwise over half of it, see noisy_fourier_transform.
+
+        random_state : seed, numpy.random.RandomState or Generator
+            source of random numbers, see rnrandom.get_random_state
         """
+        check_folded(folded, full_circle)
+        random_state = rnrandom.get_random_state(random_state)
         self.powerspectrum = copy.deepcopy(powerspectrum)
         self.nt = self.powerspectrum.nt
         self.fft_zero = fft_zero
@@ -105,7 +122,7 @@ class TimeSeriesFromPowerSpectrum():
         self.W = W
 
         #
-        self.K = self.V * self.W * self.nt / 2
+        self.K = self.V * self.W * self.nt // 2
         self.dt = self.powerspectrum.dt
 
         # Frequencies that we are calculating the power spectrum at
@@ -113,16 +130,126 @@ class TimeSeriesFromPowerSpectrum():
         self.powerspectrum.frequencies = self.frequencies
         self.inputpower = self.powerspectrum.power()
 
+        if folded:
+            self.oversampled = None
+            self.longtimeseries = None
+            self.foldedpower = folded_power_spectrum(self.inputpower, self.nt, self.V, self.W)
+            self.sample = folded_realizations(self.foldedpower, self.nt, 1, 2 * self.K,
+                                              fft_zero=self.fft_zero,
+                                              random_state=random_state, **kwargs)[0]
+            return
+
         # the fully over-sampled timeseries, with a sampling cadence of dt/W, with a
         # duration of V*N*dt
-        self.oversampled = time_series_from_power_spectrum(self.inputpower, fft_zero=self.fft_zero, **kwargs)
+        self.oversampled = time_series_from_power_spectrum(self.inputpower, fft_zero=self.fft_zero,
+                                                           full_circle=full_circle,
+                                                           random_state=random_state, **kwargs)
 
         # Subsample the time-series back down to the requested cadence of dt
         self.longtimeseries = self.oversampled[0:len(self.oversampled):self.W]
         nlts = len(self.longtimeseries)
 
         # get a sample of the desired length nt from the middle of the long time series
-        self.sample = self.longtimeseries[nlts / 2 - self.nt / 2: nlts / 2 - self.nt / 2 + self.nt]
+        self.sample = self.longtimeseries[nlts // 2 - self.nt // 2: nlts // 2 - self.nt // 2 + self.nt]
+
+
+class TimeSeriesRealizations():
+    def __init__(self, powerspectrum, nrealizations, V=10, W=10, fft_zero=0.0,
+                 chunk=None, out=None, folded=False, full_circle=False,
+                 random_state=np.random, **kwargs):
+        """
+        Create many time series with a given type of power spectrum at once.
+        Each realization is made as in TimeSeriesFromPowerSpectrum, but the
+        noise for a block of realizations is drawn in one go, and the
+        oversampled time series of the block are made with one inverse real
+        FFT.  The blocks are small enough that very large ensembles can be
+        made in bounded memory.
+
+        Parameters
+        ----------
+        powerspectrum : PowerLawPowerSpectrum object
+            defines the properties of the power spectrum
+        nrealizations : int
+            number of time series
+        V, W, fft_zero :
+            as for TimeSeriesFromPowerSpectrum
+        chunk : int
+            number of realizations made at once.  By default as many as keep
+            the oversampled time series of a block below max_block_size
+            values.
+        out : ndarray[nrealizations, nt]
+            where the realizations are stored, for example a numpy.memmap.
+            By default a new array.
+        folded, full_circle : bool
+            as for TimeSeriesFromPowerSpectrum
+        random_state : seed, numpy.random.RandomState or Generator
+            source of random numbers, see rnrandom.get_random_state
+        **kwargs : phase_noise and power_noise, as for
+            time_series_from_power_spectrum
+        """
+        check_folded(folded, full_circle)
+        random_state = rnrandom.get_random_state(random_state)
+        self.powerspectrum = copy.deepcopy(powerspectrum)
+        self.nt = self.powerspectrum.nt
+        self.fft_zero = fft_zero
+        self.nrealizations = nrealizations
+
+        # Vaughan (2010)
+        self.V = V
+        self.W = W
+        self.K = self.V * self.W * self.nt // 2
+        self.dt = self.powerspectrum.dt
+
+        # Frequencies that we are calculating the power spectrum at
+        self.frequencies = np.arange(1, self.K + 1) / (1.0*(self.V * self.nt * self.dt))
+        self.powerspectrum.frequencies = self.frequencies
+        self.inputpower = self.powerspectrum.power()
+
+        if folded:
+            self.foldedpower = folded_power_spectrum(self.inputpower, self.nt, self.V, self.W)
+            size = self.nt
+        else:
+            size = 2 * self.K
+        if chunk is None:
+            chunk = max(1, max_block_size // size)
+        self.chunk = chunk
+
+        if out is None:
+            out = np.empty((nrealizations, self.nt))
+        if folded:
+            for start in range(0, nrealizations, self.chunk):
+                n = min(self.chunk, nrealizations - start)
+                out[start:start + n, :] = folded_realizations(self.foldedpower, self.nt, n,
+                                                              2 * self.K,
+                                                              fft_zero=self.fft_zero,
+                                                              random_state=random_state,
+                                                              **kwargs)
+        else:
+            for start, block in realization_blocks(self.inputpower, nrealizations,
+                                                   self.nt, W=self.W, chunk=self.chunk,
+                                                   fft_zero=self.fft_zero,
+                                                   full_circle=full_circle,
+                                                   random_state=random_state,
+                                                   **kwargs):
+                out[start:start + block.shape[0], :] = block
+        self.sample = out
+
+
+# Largest number of values in the oversampled time series of one block of
+# TimeSeriesRealizations
+max_block_size = 2 ** 25
+
+
+def check_folded(folded, full_circle):
+    """
+    The folded time series have phases over the whole circle.  Asking for
+    them with the half circle phases of the oversampled recipe would
+    silently change the power of the time series.
+    """
+    if folded and not full_circle:
+        raise ValueError('folded time series have phases over the whole circle; '
+                         'set full_circle=True, and use it for the oversampled '
+                         'time series they are compared with')
 
 
 def equally_spaced_nonzero_frequencies(n, dt):
@@ -133,7 +260,7 @@ def equally_spaced_nonzero_frequencies(n, dt):
     return all_fft[all_fft > 0]
 
 
-def noisy_power_spectrum(S):
+def noisy_power_spectrum(S, random_state=np.random):
     """
     Create a noisy power spectrum, given some input power spectrum S, following
     the recipe of Vaughan (2010), MNRAS, 402, 307, appendix B
@@ -144,23 +271,42 @@ def noisy_power_spectrum(S):
         Theoretical fourier power spectrum, from the first non-zero frequency
         up to the Nyquist frequency.
 
+    random_state : numpy.random.RandomState or Generator
+        source of random numbers
     """
     # Number of positive frequencies to calculate.
     K = len(S)
 
     # chi-squared(2) random numbers for all frequencies except the nyquist
     # frequency
-    X = np.concatenate((chi2.rvs(2, size=K - 1),
-                        chi2.rvs(1, size=1)))
+    X = np.concatenate((random_state.chisquare(2, size=K - 1),
+                        random_state.chisquare(1, size=1)))
     # power spectrum
     return S * X / 2.0
 
 
-def noisy_fourier_transform(I, fft_zero=0.0, phase_noise=True):
+def noisy_fourier_transform(I, fft_zero=0.0, phase_noise=True, full_circle=False,
+                            random_state=np.random):
     """
-    Take an input power spectrum I and create a full Fourier transform over all
-    positive and negative frequencies and has random phases such that the time
-    series it describes is purely real valued
+    Take an input power spectrum I and create the Fourier transform at the
+    zero and positive frequencies, with random phases.  The negative
+    frequencies are the complex conjugates of the positive ones, so the
+    time series it describes is purely real valued, and it is made with an
+    inverse real FFT of length 2 * len(I).
+
+    By default the phases are uniform over half of the circle, and the term
+    at the Nyquist frequency is positive.  The Fourier terms then have a
+    non-zero mean, which puts some of the power in a fixed pulse at the
+    start of the time series.  With full_circle the phases are uniform over
+    the whole circle and the Nyquist term has a random sign, so the Fourier
+    terms have zero mean and the time series is stationary.
+
+    Returns
+    -------
+    F_half : ndarray
+        the Fourier transform from the zero to the Nyquist frequency
+    F : ndarray
+        the positive frequency part of F_half
     """
     # Number of positive frequencies to calculate.  This fills in the Fourier
     # frequency a[1:n/2+1].  Since we are working with the power spectrum to
@@ -168,10 +314,7 @@ def noisy_fourier_transform(I, fft_zero=0.0, phase_noise=True):
     K = len(I)
 
     # random phases, except for the nyquist frequency.
-    ph = uniform.rvs(loc=-np.pi / 2.0, scale=np.pi, size=K)
-    if not phase_noise:
-        ph[:] = 0.0
-    ph[-1] = 0.0
+    ph = random_phases(K, phase_noise, full_circle, random_state)
 
     # Amplitudes
     A = np.sqrt(I / 2.0)
@@ -182,19 +325,16 @@ def noisy_fourier_transform(I, fft_zero=0.0, phase_noise=True):
     # MULTIPLICATION FACTOR BELOW
     A = A * np.sqrt(2.0)
 
-    # Complex vector
-    F = A * np.exp(-np.complex(0, 1) * ph)
-
-    # Form the negative frequency part
-    F_negative = np.conjugate(F)[::-1][1:]
+    # Fourier transform from the zero to the nyquist frequency
+    F_half = np.empty(K + 1, dtype=np.complex128)
+    F_half[0] = fft_zero
+    F_half[1:] = A * np.exp(-1j * ph)
 
-    # Form the fourier transform
-    F_complete = np.concatenate((np.asarray([fft_zero]), F, F_negative))
+    return F_half, F_half[1:]
 
-    return F_complete, F
-    
 
-def time_series_from_power_spectrum(S, fft_zero=0.0, phase_noise=True, power_noise=True):
+def time_series_from_power_spectrum(S, fft_zero=0.0, phase_noise=True, power_noise=True,
+                                    full_circle=False, random_state=np.random):
     """Create a time series with power law noise, following the recipe
     of Vaughan (2010), MNRAS, 402, 307, appendix B
 
@@ -206,25 +346,269 @@ def time_series_from_power_spectrum(S, fft_zero=0.0, phase_noise=True, power_noi
 
     fft_zero : scalar number
         The value at the zero Fourier frequency.
+
+    full_circle : bool
+        random phases over the whole circle, see noisy_fourier_transform
+
+    random_state : numpy.random.RandomState or Generator
+        source of random numbers
+
+    Returns
+    -------
+    ndarray
+        the real valued time series, of length 2 * len(S)
     """
 
     # noisy power spectrum
     if power_noise:
-        I = noisy_power_spectrum(S)
+        I = noisy_power_spectrum(S, random_state=random_state)
     else:
         I = S
 
     #print np.sqrt(I)
 
     # Get noisy Fourier transform
-    F_complete, F = noisy_fourier_transform(I,
-                                            fft_zero=fft_zero,
-                                            phase_noise=phase_noise)
+    F_half, F = noisy_fourier_transform(I,
+                                        fft_zero=fft_zero,
+                                        phase_noise=phase_noise,
+                                        full_circle=full_circle,
+                                        random_state=random_state)
+
+    # create the time-series.  The negative frequencies are implied, so the
+    # time series is real.
+    return np.fft.irfft(F_half, n=2 * len(S))
+
+
+def noisy_power_spectra(S, size, random_state=np.random):
+    """
+    Create many noisy power spectra at once, as in noisy_power_spectrum.
+
+    Parameters
+    ----------
+    S : numpy array
+        Theoretical fourier power spectrum, from the first non-zero frequency
+        up to the Nyquist frequency.
+    size : int
+        number of noisy spectra
+    random_state : numpy.random.RandomState or Generator
+        source of random numbers
+
+    Returns
+    -------
+    ndarray[size, len(S)]
+    """
+    K = len(S)
+    X = np.empty((size, K))
+    X[:, 0:K - 1] = random_state.chisquare(2, size=(size, K - 1))
+    X[:, K - 1] = random_state.chisquare(1, size=size)
+    return S * X / 2.0
 
-    # create the time-series.  The complex part should be tiny.
-    T_sim = np.fft.ifft(F_complete)
-    #T_sim = np.fft.irfft(np.concatenate((np.asarray([fft_zero]), F)))
 
-    # The time series is formally complex.  Return the real part only.
-    #return np.real(T_sim)
-    return T_sim
+def time_series_realizations(S, size, fft_zero=0.0, phase_noise=True,
+                             power_noise=True, full_circle=False,
+                             random_state=np.random):
+    """
+    Create many time series with power law noise at once, following the
+    recipe of Vaughan (2010), MNRAS, 402, 307, appendix B.  Each row is
+    distributed as the real part of time_series_from_power_spectrum.
+
+    Parameters
+    ----------
+    S : numpy array
+        Theoretical fourier power spectrum, from the first non-zero frequency
+        up to the Nyquist frequency.
+    size : int
+        number of time series
+    fft_zero : scalar number
+        The value at the zero Fourier frequency.
+    full_circle : bool
+        random phases over the whole circle, see noisy_fourier_transform
+    random_state : numpy.random.RandomState or Generator
+        source of random numbers
+
+    Returns
+    -------
+    ndarray[size, 2 * len(S)]
+    """
+    K = len(S)
+
+    # noisy power spectra
+    if power_noise:
+        I = noisy_power_spectra(S, size, random_state=random_state)
+    else:
+        I = np.tile(S, (size, 1))
+
+    # random phases, except for the nyquist frequency
+    ph = random_phases((size, K), phase_noise, full_circle, random_state)
+
+    # Positive half of the Fourier transform.  The negative frequencies are
+    # the complex conjugates, so the inverse real FFT gives the time series.
+    F = np.empty((size, K + 1), dtype=np.complex128)
+    F[:, 0] = fft_zero
+    F[:, 1:] = np.sqrt(I) * np.exp(-1j * ph)
+    return np.fft.irfft(F, n=2 * K, axis=-1)
+
+
+def random_phases(size, phase_noise=True, full_circle=False, random_state=np.random):
+    """
+    Phases of the Fourier terms from the first non-zero frequency up to the
+    Nyquist frequency, along the last dimension of size.  The phases are
+    uniform over half the circle, or over the whole circle with
+    full_circle.  The Nyquist term is real: its phase is zero, or with
+    full_circle zero or pi with equal probability.
+    """
+    if not phase_noise:
+        return np.zeros(size)
+    if full_circle:
+        ph = random_state.uniform(low=-np.pi, high=np.pi, size=size)
+        ph[..., -1] = np.where(random_state.uniform(size=ph[..., -1].shape) < 0.5, 0.0, np.pi)
+    else:
+        ph = random_state.uniform(low=-np.pi / 2.0, high=np.pi / 2.0, size=size)
+        ph[..., -1] = 0.0
+    return ph
+
+
+def realization_blocks(S, size, nt, W=1, chunk=1000, fft_zero=0.0,
+                       random_state=np.random, **kwargs):
+    """
+    Generate the realizations of TimeSeriesRealizations in blocks of at most
+    chunk time series.  Each oversampled time series is subsampled to every
+    W-th value, and nt values are taken from its middle.
+
+    Yields
+    ------
+    start : int
+        index of the first realization in the block
+    block : ndarray[n, nt]
+        the realizations
+    """
+    nlts = len(range(0, 2 * len(S), W))
+    index = W * (nlts // 2 - nt // 2 + np.arange(0, nt))
+    for start in range(0, size, chunk):
+        n = min(chunk, size - start)
+        oversampled = time_series_realizations(S, n, fft_zero=fft_zero,
+                                               random_state=random_state,
+                                               **kwargs)
+        yield start, oversampled[:, index]
+
+
+def folded_power_spectrum(S, nt, V, W):
+    """
+    Expected power of a time series made by TimeSeriesFromPowerSpectrum, at
+    the Fourier frequencies of the time series.
+
+    The oversampled time series has N = V*W*nt values at a cadence dt/W.
+    Keeping every W-th value aliases the power at frequency index k onto
+    index k modulo V*nt, so the power spectrum is folded onto a circle of
+    M = V*nt frequencies.  Taking nt consecutive values of the folded time
+    series leaks the power at each of these frequencies into its
+    neighbours with the Fejer kernel
+
+        F(q) = sin^2(pi nt q / M) / sin^2(pi q / M)
+
+    The expected power at Fourier frequency p of the time series is the
+    circular convolution of the folded power with the kernel, at the point
+    q = p V, divided by N^2.
+
+    Parameters
+    ----------
+    S : numpy array
+        Theoretical fourier power spectrum of the oversampled time series,
+        from the first non-zero frequency up to its Nyquist frequency,
+        V*W*nt/2 values
+    nt, V, W :
+        as for TimeSeriesFromPowerSpectrum
+
+    Returns
+    -------
+    ndarray[nt // 2 + 1]
+        expected power at the frequencies 0, 1/(nt dt) ... of the time
+        series, as the squared modulus of its discrete Fourier transform
+    """
+    K = len(S)
+    N = 2 * K
+    M = V * nt
+
+    # Expected power at all the frequency indices of the oversampled time
+    # series.  The zero frequency is fixed, and the Nyquist frequency has
+    # half the power.
+    P = np.zeros(N)
+    P[1:K + 1] = S
+    P[K] = 0.5 * S[-1]
+    P[K + 1:] = S[-2::-1]
+
+    # Aliasing folds the power onto M frequencies
+    if N % M != 0:
+        raise ValueError('The oversampled time series cannot be folded; V * W * nt must be even.')
+    folded = P.reshape((N // M, M)).sum(axis=0)
+
+    # Leakage from taking nt values
+    q = np.arange(0, M)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        fejer = (np.sin(np.pi * nt * q / (1.0 * M)) / np.sin(np.pi * q / (1.0 * M))) ** 2
+    fejer[0] = nt ** 2
+    convolved = np.real(np.fft.ifft(np.fft.fft(folded) * np.fft.fft(fejer)))
+    return convolved[0:(nt // 2 + 1) * V:V] / (1.0 * N) ** 2
+
+
+def folded_realizations(Q, nt, size, N, fft_zero=0.0, phase_noise=True,
+                        power_noise=True, random_state=np.random):
+    """
+    Create time series of length nt directly from the folded power
+    spectrum Q of folded_power_spectrum.  The Fourier transform of each time
+    series has the expected power Q, with the noise of Vaughan (2010),
+    MNRAS, 402, 307, appendix B.  The expected power spectrum, including the
+    aliasing and the leakage of the oversampled time series, is reproduced,
+    but the small correlations between neighbouring frequencies caused by
+    the leakage are not.
+
+    The phases are uniform over the whole circle, so that the Fourier terms
+    have zero mean and the time series is stationary.  The time series made
+    here match those of the oversampled recipe with full_circle=True, see
+    noisy_fourier_transform.
+
+    Parameters
+    ----------
+    Q : ndarray[nt // 2 + 1]
+        folded power spectrum
+    nt : int
+        length of the time series
+    size : int
+        number of time series
+    N : int
+        length of the oversampled time series, used to scale fft_zero
+    fft_zero : scalar number
+        The value at the zero Fourier frequency of the oversampled time
+        series.
+    random_state : numpy.random.RandomState or Generator
+        source of random numbers
+
+    Returns
+    -------
+    ndarray[size, nt]
+    """
+    nf = len(Q)
+
+    # The terms at the zero frequency, and at the Nyquist frequency when nt
+    # is even, are real and have one degree of freedom
+    real = np.zeros(nf, dtype=bool)
+    real[0] = True
+    if nt % 2 == 0:
+        real[-1] = True
+
+    if power_noise:
+        X = random_state.chisquare(2, size=(size, nf)) / 2.0
+        X[:, real] = random_state.chisquare(1, size=(size, np.sum(real)))
+        I = Q * X
+    else:
+        I = np.tile(Q, (size, 1))
+
+    if phase_noise:
+        ph = random_state.uniform(low=-np.pi, high=np.pi, size=(size, nf))
+        ph[:, real] = np.where(random_state.uniform(size=(size, np.sum(real))) < 0.5, 0.0, np.pi)
+    else:
+        ph = np.zeros((size, nf))
+
+    F = np.sqrt(I) * np.exp(-1j * ph)
+    F[:, 0] = F[:, 0] + fft_zero * nt / (1.0 * N)
+    return np.fft.irfft(F, n=nt, axis=-1)
@@ -11,6 +11,23 @@ def fnorm(f, fnorm):
     """ Normalize the frequency spectrum."""
     return f / fnorm
 
+
+#
+# Arrange the parameters for evaluation
+#
+def arrange_parameters(a):
+    """
+    Arrange model parameters for evaluation.  All the models accept either
+    a single parameter set, a[nparameters], or many parameter sets at once
+    as an ndarray[nsets, nparameters].  Many parameter sets are rearranged
+    such that each parameter is a column vector, so that the models broadcast
+    over the parameter sets and return spectra of shape [nsets, nfreq].
+    """
+    if isinstance(a, np.ndarray) and a.ndim == 2:
+        return a.T[:, :, np.newaxis]
+    return a
+
+
 # ----------------------------------------------------------------------------
 # Power law
 #
@@ -27,6 +44,7 @@ def power_law(f, a):
         a[0] : the natural logarithm of the normalization constant
         a[1] : the power law index
     """
+    a = arrange_parameters(a)
     return np.exp(a[0]) * ((fnorm(f, f[0]) ** (-a[1])))
 
 
@@ -48,6 +66,7 @@ def power_law_with_constant(f, a):
         a[1] : the power law index
         a[2] : the natural logarithm of the constant background
     """
+    a = arrange_parameters(a)
     return power_law(f, a[0:2]) + np.exp(a[2])
 
 
@@ -63,6 +82,7 @@ def Log_splwc_CF(f, a0, a1, a2):
 # Normal distribution.
 #
 def NormalBump2(x, a):
+    a = arrange_parameters(a)
     z = (x - a[1]) / a[2]
     amplitude = np.exp(a[0])
     norm = 1.0 / (np.sqrt(2 * np.pi * a[2] ** 2))
@@ -81,6 +101,7 @@ def Log_NormalBump2_CF(x, a0, a1, a2):
 # Normal distribution, all exponential parameters.
 #
 def NormalBump2_allexp(x, a):
+    a = arrange_parameters(a)
     amplitude = np.exp(a[0])
     position = np.exp(a[1])
     width = np.exp(a[2])
@@ -130,6 +151,7 @@ def splwc_AddLognormalBump2(f, a):
         a[4] : the natural logarithm of the frequency of the center of the distribution
         a[5] : the width of the distribution in units of the natural logarithm of the frequency
     """
+    a = arrange_parameters(a)
     return power_law_with_constant(f, a[0:3]) + NormalBump2(np.log(f), a[3:6])
 
 
@@ -147,6 +169,7 @@ def Log_splwc_AddLognormalBump2_CF(f, a0, a1, a2, a3, a4, a5):
 # Harvey 1993.
 #
 def exp_decay_autocor(f, a):
+    a = arrange_parameters(a)
     return np.exp(a[0]) / (1.0 + (2 * np.pi * f / a[1]) ** a[2])
 
 
@@ -173,6 +196,7 @@ def splwc_AddExpDecayAutocor(f, a):
         a[4] : period
         a[5] : power law of decay
     """
+    a = arrange_parameters(a)
     return power_law_with_constant(f, a[0:3]) + exp_decay_autocor(f, a[3:6])
 
 
@@ -195,21 +219,16 @@ def double_broken_power_law_with_constant(f, a):
     a[3] = natural logarithm of the location of the break in the power law
     a[4] = power law index at frequencies greater than a[3]
     """
-    power = np.float64(np.zeros_like(f))
+    a = arrange_parameters(a)
     fbreak = np.exp(a[3])
-    # Where the first power law is valid
-    p1_location = f < fbreak
-    # Where the second power law is valid
-    p2_location = f >= fbreak
+    x = fnorm(f, f[0])
     # First power law
-    p1 = np.exp(a[0]) * ((fnorm(f[p1_location], f[0]) ** (-a[1]))) + np.exp(a[2])
+    p1 = np.exp(a[0]) * ((x ** (-a[1]))) + np.exp(a[2])
     # Second power law
     p2_amplitude = np.exp(a[0]) * fbreak ** (a[4] - a[1])
-    p2 = p2_amplitude * ((fnorm(f[p2_location], f[0]) ** (-a[4]))) + np.exp(a[2])
-    #Fill in the power
-    power[p1_location] = p1
-    power[p2_location] = p2
-    return power
+    p2 = p2_amplitude * ((x ** (-a[4]))) + np.exp(a[2])
+    # The first power law is valid below the break, the second above it
+    return np.where(f < fbreak, p1, p2)
 
 
 def Log_double_broken_power_law_with_constant(f, a):
@@ -239,6 +258,7 @@ def splwc_AddNormalBump2(f, a):
         a[4] : center of the Gaussian
         a[5] : width of the Gaussian
     """
+    a = arrange_parameters(a)
     return power_law_with_constant(f, a[0:3]) + NormalBump2(f, a[3:6])
 
 
@@ -270,6 +290,7 @@ def splwc_AddNormalBump2_allexp(f, a):
         a[4] : center of the Gaussian
         a[5] : width of the Gaussian
     """
+    a = arrange_parameters(a)
     return power_law_with_constant(f, a[0:3]) + NormalBump2_allexp(f, a[3:6])
 
 
@@ -279,3 +300,223 @@ def Log_splwc_AddNormalBump2_allexp(f, a):
 
 def Log_splwc_AddNormalBump2_allexp_CF(f, a0, a1, a2, a3, a4, a5):
     return Log_splwc_AddNormalBump2_allexp(f, [a0, a1, a2, a3, a4, a5])
+
+
+# ----------------------------------------------------------------------------
+# Models bound to a frequency grid
+#
+# The frequencies at which a model is evaluated do not change during a fit.
+# These objects take the frequencies once and calculate everything that
+# depends only on them, such as the normalized frequencies and the logarithm
+# of the frequencies.  Evaluating a model then needs only a few array
+# operations per call.  The results are identical to those of the
+# corresponding functions above.
+#
+class SpectralModel:
+    # The function this model is equivalent to
+    function = None
+
+    def __init__(self, f):
+        """
+        Parent class of the spectral models bound to a frequency grid.
+
+        Parameters
+        ----------
+        f : ndarray
+            frequencies
+        """
+        self.f = np.asarray(f)
+        # Normalized frequencies
+        self.x = fnorm(self.f, self.f[0])
+        self.logf = np.log(self.f)
+        self.logx = np.log(self.x)
+        self.nfreq = self.f.size
+
+    def __call__(self, a):
+        return self.power(a)
+
+    def power(self, a):
+        """
+        Return the power spectrum.  Placeholder for the methods defined below
+        """
+        return None
+
+    def log(self, a):
+        """Natural logarithm of the power spectrum"""
+        return np.log(self.power(a))
+
+    def log_at(self, *a):
+        """Natural logarithm of the power spectrum of one parameter set,
+        given as separate arguments as the PyMC deterministic nodes have
+        them"""
+        return np.log(self.power(a))
+
+    def jacobian(self, a):
+        """Derivative of the power spectrum with respect to the parameters"""
+        return jacobians[self.function](self.f, a)
+
+
+class PowerLaw(SpectralModel):
+    function = staticmethod(power_law)
+
+    def power(self, a):
+        a = arrange_parameters(a)
+        return np.exp(a[0]) * (self.x ** (-a[1]))
+
+
+class PowerLawWithConstant(SpectralModel):
+    function = staticmethod(power_law_with_constant)
+
+    def power(self, a):
+        a = arrange_parameters(a)
+        return np.exp(a[0]) * (self.x ** (-a[1])) + np.exp(a[2])
+
+
+class SplwcAddLognormalBump2(PowerLawWithConstant):
+    function = staticmethod(splwc_AddLognormalBump2)
+
+    def power(self, a):
+        a = arrange_parameters(a)
+        return PowerLawWithConstant.power(self, a[0:3]) + NormalBump2(self.logf, a[3:6])
+
+
+class SplwcAddNormalBump2(PowerLawWithConstant):
+    function = staticmethod(splwc_AddNormalBump2)
+
+    def power(self, a):
+        a = arrange_parameters(a)
+        return PowerLawWithConstant.power(self, a[0:3]) + NormalBump2(self.f, a[3:6])
+
+
+class SplwcAddNormalBump2Allexp(PowerLawWithConstant):
+    function = staticmethod(splwc_AddNormalBump2_allexp)
+
+    def power(self, a):
+        a = arrange_parameters(a)
+        return PowerLawWithConstant.power(self, a[0:3]) + NormalBump2_allexp(self.f, a[3:6])
+
+
+class SplwcAddExpDecayAutocor(PowerLawWithConstant):
+    function = staticmethod(splwc_AddExpDecayAutocor)
+
+    def __init__(self, f):
+        PowerLawWithConstant.__init__(self, f)
+        self.angular_f = 2 * np.pi * self.f
+
+    def power(self, a):
+        a = arrange_parameters(a)
+        return PowerLawWithConstant.power(self, a[0:3]) + \
+            np.exp(a[3]) / (1.0 + (self.angular_f / a[4]) ** a[5])
+
+
+class DoubleBrokenPowerLawWithConstant(SpectralModel):
+    function = staticmethod(double_broken_power_law_with_constant)
+
+    def __init__(self, f):
+        SpectralModel.__init__(self, f)
+        # For frequencies in ascending order the location of the break
+        # divides the frequencies into two contiguous pieces.
+        self.ascending = np.all(np.diff(self.f) > 0)
+
+    def power(self, a):
+        if (not self.ascending) or isinstance(a, np.ndarray) and a.ndim == 2:
+            return double_broken_power_law_with_constant(self.f, a)
+        fbreak = np.exp(a[3])
+        # Index of the first frequency where the second power law is valid
+        ibreak = np.searchsorted(self.f, fbreak, side='left')
+        power = np.empty(self.nfreq, dtype=np.float64)
+        power[:ibreak] = np.exp(a[0]) * (self.x[:ibreak] ** (-a[1])) + np.exp(a[2])
+        p2_amplitude = np.exp(a[0]) * fbreak ** (a[4] - a[1])
+        power[ibreak:] = p2_amplitude * (self.x[ibreak:] ** (-a[4])) + np.exp(a[2])
+        return power
+
+    def jacobian(self, a):
+        raise NotImplementedError('No analytic Jacobian for the double broken power law.')
+
+
+# ----------------------------------------------------------------------------
+# Jacobians
+#
+# Analytic derivatives of the models above with respect to their parameters.
+# Each function returns an array whose first axis runs over the parameters,
+# such that jacobian[k] = d model / d a[k].  For many parameter sets the
+# Jacobian has shape [nparameters, nsets, nfreq].
+#
+def power_law_jacobian(f, a):
+    a = arrange_parameters(a)
+    pl = power_law(f, a)
+    return np.asarray([pl, -pl * np.log(fnorm(f, f[0]))])
+
+
+def power_law_with_constant_jacobian(f, a):
+    a = arrange_parameters(a)
+    pl = power_law(f, a[0:2])
+    return np.asarray([pl,
+                       -pl * np.log(fnorm(f, f[0])),
+                       np.exp(a[2]) * np.ones_like(pl)])
+
+
+def NormalBump2_jacobian(x, a):
+    a = arrange_parameters(a)
+    bump = NormalBump2(x, a)
+    z = (x - a[1]) / a[2]
+    return np.asarray([bump,
+                       bump * z / a[2],
+                       bump * (z ** 2 - 1.0) / a[2]])
+
+
+def NormalBump2_allexp_jacobian(x, a):
+    a = arrange_parameters(a)
+    bump = NormalBump2_allexp(x, a)
+    position = np.exp(a[1])
+    width = np.exp(a[2])
+    z = (x - position) / width
+    return np.asarray([bump,
+                       bump * z * position / width,
+                       bump * (z ** 2 - 1.0)])
+
+
+def exp_decay_autocor_jacobian(f, a):
+    a = arrange_parameters(a)
+    eda = exp_decay_autocor(f, a)
+    u = 2 * np.pi * f / a[1]
+    q = u ** a[2]
+    return np.asarray([eda,
+                       eda * a[2] * q / (a[1] * (1.0 + q)),
+                       -eda * q * np.log(u) / (1.0 + q)])
+
+
+def splwc_AddLognormalBump2_jacobian(f, a):
+    a = arrange_parameters(a)
+    return np.concatenate((power_law_with_constant_jacobian(f, a[0:3]),
+                           NormalBump2_jacobian(np.log(f), a[3:6])))
+
+
+def splwc_AddExpDecayAutocor_jacobian(f, a):
+    a = arrange_parameters(a)
+    return np.concatenate((power_law_with_constant_jacobian(f, a[0:3]),
+                           exp_decay_autocor_jacobian(f, a[3:6])))
+
+
+def splwc_AddNormalBump2_jacobian(f, a):
+    a = arrange_parameters(a)
+    return np.concatenate((power_law_with_constant_jacobian(f, a[0:3]),
+                           NormalBump2_jacobian(f, a[3:6])))
+
+
+def splwc_AddNormalBump2_allexp_jacobian(f, a):
+    a = arrange_parameters(a)
+    return np.concatenate((power_law_with_constant_jacobian(f, a[0:3]),
+                           NormalBump2_allexp_jacobian(f, a[3:6])))
+
+
+# Models that have an analytic Jacobian
+jacobians = {power_law: power_law_jacobian,
+             power_law_with_constant: power_law_with_constant_jacobian,
+             NormalBump2: NormalBump2_jacobian,
+             NormalBump2_allexp: NormalBump2_allexp_jacobian,
+             exp_decay_autocor: exp_decay_autocor_jacobian,
+             splwc_AddLognormalBump2: splwc_AddLognormalBump2_jacobian,
+             splwc_AddExpDecayAutocor: splwc_AddExpDecayAutocor_jacobian,
+             splwc_AddNormalBump2: splwc_AddNormalBump2_jacobian,
+             splwc_AddNormalBump2_allexp: splwc_AddNormalBump2_allexp_jacobian}
@@ -0,0 +1,136 @@
+"""
+Goodness-of-fit test statistics of many spectra at once.
+
+The statistics of Vaughan (2010, MNRAS, 402, 307) compare a power spectrum
+with a fitted model spectrum.  In a posterior predictive check they are
+needed for every simulated spectrum.  Here the spectra and the fits are held
+in arrays [nsamples, nfreq], and every statistic is computed for all the
+samples with a few array operations.  A single spectrum [nfreq] gives a
+single value.  The fits may also be one model spectrum [nfreq] shared by all
+the samples.
+"""
+
+import numpy as np
+
+
+def T_R(data, fit):
+    """Vaughan, 2010, MNRAS, 402, 307. Eq. 15.  The largest value of twice
+    the ratio of the data to the fit."""
+    return np.max(2 * data / fit, axis=-1)
+
+
+def T_SSE(data, fit, sigma=None):
+    """
+    Sum of the squared residuals.  If sigma is given the residuals are
+    divided by sigma, otherwise by the fit as in Vaughan, 2010, MNRAS, 402,
+    307. Eq. 21.
+    """
+    if sigma is None:
+        sigma = fit
+    return np.sum(((data - fit) / sigma) ** 2, axis=-1)
+
+
+def reduced_chi2(data, fit, sigma, k):
+    """Sum of the squared residuals over the number of degrees of freedom,
+    for a fit with k parameters"""
+    return T_SSE(data, fit, sigma) / (1.0 * (np.shape(data)[-1] - k))
+
+
+def T_LRT(l0, l1):
+    """Vaughan, 2010, MNRAS, 402, 307. Eq. 22.  Likelihood ratio test
+    statistic from the maximum log likelihoods of the models M0 and M1."""
+    return -2 * (np.asarray(l0) - np.asarray(l1))
+
+
+# The statistics that compare spectra with fits, and whether they need the
+# uncertainty sigma and the number of parameters k
+_statistics = {"T_R": (T_R, False, False),
+               "T_SSE": (T_SSE, True, False),
+               "reduced_chi2": (reduced_chi2, True, True),
+               # As in ppcheck2, where T_SSE is always relative to the fit
+               "vaughan_2010_T_R": (T_R, False, False),
+               "vaughan_2010_T_SSE": (T_SSE, False, False)}
+
+
+def statistics(data, fit, names=('T_R', 'T_SSE'), sigma=None, k=None):
+    """
+    Calculate a set of test statistics of spectra and their fits.
+
+    Parameters
+    ----------
+    data : ndarray[..., nfreq]
+        the spectra
+    fit : ndarray[..., nfreq]
+        the fitted model spectra, broadcast against data
+    names : sequence of str
+        which statistics: 'T_R', 'T_SSE', 'reduced_chi2', or the ppcheck2
+        statistics 'vaughan_2010_T_R' and 'vaughan_2010_T_SSE', which
+        ignore sigma
+    sigma : ndarray
+        uncertainty of the spectra, used by 'T_SSE' and 'reduced_chi2'
+    k : int
+        number of fitted parameters, used by 'reduced_chi2'
+
+    Returns
+    -------
+    dict
+        the values of each statistic, an array [...] keyed by name
+    """
+    data = np.asarray(data)
+    fit = np.asarray(fit)
+    answer = {}
+    for name in names:
+        function, uses_sigma, uses_k = _statistics[name]
+        if uses_k:
+            if (sigma is None) or (k is None):
+                raise ValueError("%s needs sigma and k" % name)
+            answer[name] = function(data, fit, sigma, k)
+        elif uses_sigma:
+            answer[name] = function(data, fit, sigma=sigma)
+        else:
+            answer[name] = function(data, fit)
+    return answer
+
+
+def p_value(observed, distribution):
+    """
+    Posterior predictive p-value, the fraction of the finite values of the
+    distribution that are at least as large as the observed value.  The
+    distribution is along the first axis.
+    """
+    distribution = np.asarray(distribution, dtype=np.float64)
+    finite = np.isfinite(distribution)
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return np.sum(finite & (distribution >= observed), axis=0) / (1.0 * np.sum(finite, axis=0))
+
+
+def posterior_predictive_check(data, fit, predictive, predictive_fit,
+                               names=('T_R', 'T_SSE'), sigma=None, k=None):
+    """
+    Posterior predictive check of a fit to an observed spectrum.
+
+    Parameters
+    ----------
+    data : ndarray[nfreq]
+        the observed spectrum
+    fit : ndarray[nfreq]
+        the best fit to the observed spectrum
+    predictive : ndarray[nsamples, nfreq]
+        spectra drawn from the posterior predictive distribution
+    predictive_fit : ndarray[nsamples, nfreq]
+        the best fit to each predictive spectrum
+    names, sigma, k :
+        as for statistics
+
+    Returns
+    -------
+    dict
+        "observed" : the statistics of the observed spectrum
+        "distribution" : the statistics of the predictive spectra
+        "p_value" : the posterior predictive p-value of each statistic
+    """
+    observed = statistics(data, fit, names=names, sigma=sigma, k=k)
+    distribution = statistics(predictive, predictive_fit, names=names, sigma=sigma, k=k)
+    return {"observed": observed,
+            "distribution": distribution,
+            "p_value": dict([(name, p_value(observed[name], distribution[name])) for name in names])}
@@ -0,0 +1,211 @@
+"""
+Maximum likelihood fits of spectral models to periodograms using the Whittle
+likelihood.
+
+The periodogram I of a noisy time series with an underlying power spectrum S
+is distributed as S * chi-squared(2) / 2 at each frequency (see
+rnsimulation.noisy_power_spectrum).  The log likelihood of the periodogram
+given the model is therefore
+
+    log L = - sum( log(S) + I / S )
+
+which depends on the model only.  No estimate of the width of the
+distribution of the power at each frequency is required.
+
+Notes
+-----
+The Nyquist frequency is chi-squared(1) distributed and not chi-squared(2).
+The difference is ignored, as is usual for the Whittle likelihood.
+"""
+
+import numpy as np
+import rnspectralmodels
+
+
+def whittle_loglike(power, S):
+    """
+    The Whittle log likelihood of observed periodograms.
+
+    Parameters
+    ----------
+    power : ndarray[..., nfreq]
+        observed periodogram(s)
+    S : ndarray[..., nfreq]
+        model power spectrum(s)
+    """
+    return -np.sum(np.log(S) + power / S, axis=-1)
+
+
+def model_power(model, f, a):
+    """
+    Evaluate a model for many parameter sets at once.
+
+    Parameters
+    ----------
+    model : function
+        a model from rnspectralmodels, such as power_law_with_constant
+    f : ndarray[nfreq]
+        frequencies
+    a : ndarray[npixel, nparameters]
+        one set of model parameters per pixel
+
+    Returns
+    -------
+    ndarray[npixel, nfreq]
+    """
+    return model(f, a)
+
+
+def model_jacobian(model, f, a, step=1e-6):
+    """
+    The derivative of the model with respect to each of its parameters.
+    Models listed in rnspectralmodels.jacobians use the analytic derivatives,
+    all other models use central differences.
+
+    Returns
+    -------
+    ndarray[npixel, nfreq, nparameters]
+    """
+    if model in rnspectralmodels.jacobians:
+        J = rnspectralmodels.jacobians[model](f, a)
+        return np.rollaxis(J, 0, 3)
+
+    J = np.zeros((a.shape[0], f.size, a.shape[1]))
+    for k in range(0, a.shape[1]):
+        h = np.zeros_like(a)
+        h[:, k] = step * np.maximum(1.0, np.abs(a[:, k]))
+        J[:, :, k] = (model_power(model, f, a + h) -
+                      model_power(model, f, a - h)) / (2 * h[:, k:k + 1])
+    return J
+
+
+def fit(model, f, power, p0, lower=None, upper=None, maxiter=100, tol=1e-8):
+    """
+    Find the maximum of the Whittle likelihood for one or more periodograms.
+    The maximum is found using Fisher scoring, with Levenberg-Marquardt
+    damping, simultaneously for all the input periodograms.
+
+    Parameters
+    ----------
+    model : function
+        a model from rnspectralmodels, such as power_law_with_constant
+    f : ndarray[nfreq]
+        frequencies
+    power : ndarray[nfreq] or ndarray[npixel, nfreq]
+        observed periodogram(s)
+    p0 : ndarray[nparameters] or ndarray[npixel, nparameters]
+        initial estimate of the model parameters.  A single estimate is used
+        for all the periodograms.
+    lower, upper : ndarray[nparameters]
+        optional bounds on the model parameters
+    maxiter : int
+        maximum number of iterations
+    tol : float
+        fractional change in the log likelihood at which the fit is
+        considered to have converged
+
+    Returns
+    -------
+    dict
+        "parameters" : maximum likelihood parameters
+        "covariance" : covariance estimated from the inverse of the Fisher
+                       information at the maximum
+        "loglike" : Whittle log likelihood at the maximum
+        "converged" : whether the fit converged, that is an accepted and
+                      lightly damped step changed the log likelihood by
+                      less than the tolerance
+        "failed" : whether the fit stopped because the gradient or the
+                   Fisher information was not finite
+        "status" : why each fit stopped, a key of npmodels.map_status.
+                   Fits that stop at the maximum number of iterations or
+                   because the damping grew too large are not converged.
+        "niter" : the number of iterations taken
+    """
+    f = np.asarray(f, dtype=np.float64)
+    power = np.asarray(power, dtype=np.float64)
+    single = power.ndim == 1
+    power = np.atleast_2d(power)
+    npixel = power.shape[0]
+    a = np.array(np.broadcast_to(p0, (npixel, np.size(p0, -1))),
+                 dtype=np.float64)
+    nparameters = a.shape[1]
+    if lower is None:
+        lower = -np.inf
+    if upper is None:
+        upper = np.inf
+    a = np.clip(a, lower, upper)
+
+    nll = -whittle_loglike(power, model_power(model, f, a))
+    damping = np.ones(npixel) * 1e-3
+    status = np.ones(npixel, dtype=int)
+    finished = np.zeros(npixel, dtype=bool)
+    niter = np.zeros(npixel, dtype=int)
+    eye = np.eye(nparameters)
+
+    for iteration in range(0, maxiter):
+        active = np.flatnonzero(~finished)
+        if active.size == 0:
+            break
+        aa = a[active]
+        I = power[active]
+        S = model_power(model, f, aa)
+
+        # Gradient of the negative log likelihood and the Fisher information
+        J = model_jacobian(model, f, aa) / S[:, :, np.newaxis]
+        g = np.einsum('pf,pfi->pi', 1.0 - I / S, J)
+        F = np.einsum('pfi,pfj->pij', J, J)
+
+        # Damped Fisher scoring step
+        dF = np.diagonal(F, axis1=1, axis2=2)
+        A = F + damping[active, np.newaxis, np.newaxis] * dF[:, np.newaxis, :] * eye
+        A = A + 1e-12 * eye
+        ok = np.all(np.isfinite(A), axis=(1, 2)) & np.all(np.isfinite(g), axis=1)
+        delta = np.zeros_like(aa)
+        if np.any(ok):
+            try:
+                delta[ok] = np.linalg.solve(A[ok], -g[ok][:, :, np.newaxis])[:, :, 0]
+            except np.linalg.LinAlgError:
+                # A singular pixel would stop the whole batch
+                delta[ok] = np.einsum('pij,pj->pi', np.linalg.pinv(A[ok]), -g[ok])
+        trial = np.clip(aa + delta, lower, upper)
+        trial_nll = -whittle_loglike(I, model_power(model, f, trial))
+
+        # Accept the steps that improve the fit.  A rejected or heavily
+        # damped step can barely change the likelihood far from the maximum,
+        # so only an accepted, lightly damped step can end the fit.
+        better = ok & np.isfinite(trial_nll) & (trial_nll <= nll[active])
+        with np.errstate(invalid='ignore'):
+            change = np.abs(nll[active] - trial_nll)
+            done = better & (damping[active] < 1.0) & \
+                (change <= tol * (np.abs(nll[active]) + tol))
+        a[active[better]] = trial[better]
+        nll[active[better]] = trial_nll[better]
+        damping[active[better]] = damping[active[better]] / 10.0
+        damping[active[~better]] = damping[active[~better]] * 10.0
+        niter[active] = iteration + 1
+        # Cannot improve on the current position
+        stuck = damping[active] > 1e10
+        status[active] = np.where(~ok, 3, np.where(done, 0, np.where(stuck, 2, 1)))
+        finished[active[done | ~ok | stuck]] = True
+
+    # Covariance from the Fisher information at the maximum
+    with np.errstate(all='ignore'):
+        S = model_power(model, f, a)
+        J = model_jacobian(model, f, a) / S[:, :, np.newaxis]
+        F = np.einsum('pfi,pfj->pij', J, J)
+    finite = np.all(np.isfinite(F), axis=(1, 2))
+    covariance = np.empty_like(F)
+    covariance[~finite] = np.nan
+    covariance[finite] = np.linalg.pinv(F[finite])
+
+    results = {"parameters": a,
+               "covariance": covariance,
+               "loglike": -nll,
+               "converged": status == 0,
+               "failed": status == 3,
+               "status": status,
+               "niter": niter}
+    if single:
+        for key in results.keys():
+            results[key] = results[key][0]
+    return results
@@ -0,0 +1,189 @@
+"""
+Compact storage of MCMC traces.
+
+Only the free parameters of a model are stored.  The deterministic nodes
+(the model spectrum and the posterior predictive spectra) hold nfreq values
+per sample and are regenerated from the parameters when they are needed.
+
+A store is a directory.  Each column (one per parameter, plus the log
+posterior) is a sequence of chunks, one per call to append:
+
+    store.pickle                 : names of the columns and the chunk lengths
+    chunk00000.npz               : compressed chunk, one array per column
+    chunk00000/<column>.npy      : uncompressed chunk, memory-mappable
+
+Compressed chunks are smaller on disk.  Uncompressed chunks are read through
+memory maps, so opening a large store costs almost nothing.
+"""
+
+import os
+import pickle
+import numpy as np
+import rnsampler
+
+
+class TraceStore:
+    def __init__(self, directory, names=None, compress=True, description=None):
+        """
+        Open a trace store, creating it if it does not exist.
+
+        Parameters
+        ----------
+        directory : str
+            where the store is kept
+        names : list
+            names of the free parameters.  Required when creating a store.
+        compress : bool
+            whether new chunks are compressed.  Uncompressed chunks are
+            memory-mapped when read.
+        description : dict
+            anything worth recording about what was sampled
+        """
+        self.directory = os.path.expanduser(directory)
+        self._meta_file = os.path.join(self.directory, 'store.pickle')
+        if os.path.isfile(self._meta_file):
+            f = open(self._meta_file, 'rb')
+            self.meta = pickle.load(f)
+            f.close()
+            if names is not None and list(names) != self.meta["names"]:
+                raise ValueError('Store in ' + self.directory + ' has different parameters.')
+        else:
+            if names is None:
+                raise ValueError('Parameter names are needed to create a store.')
+            if not os.path.isdir(self.directory):
+                os.makedirs(self.directory)
+            self.meta = {"names": list(names),
+                         "chunks": [],
+                         "description": description}
+            self._write_meta()
+        self.names = self.meta["names"]
+        self.columns = self.names + ['logp']
+        self.compress = compress
+
+    def _write_meta(self):
+        # Write then rename so an interrupted append leaves a valid store
+        tmp = self._meta_file + '.tmp'
+        f = open(tmp, 'wb')
+        pickle.dump(self.meta, f)
+        f.close()
+        os.rename(tmp, self._meta_file)
+
+    def __len__(self):
+        """Number of samples per chain"""
+        return sum([c["length"] for c in self.meta["chunks"]])
+
+    def append(self, trace, logp=None):
+        """
+        Add samples to the store.
+
+        Parameters
+        ----------
+        trace : ndarray[nsamples, nchains, nparameters]
+            parameter samples, as in the results of rnsampler
+        logp : ndarray[nsamples, nchains]
+            log posterior of the samples
+        """
+        trace = np.asarray(trace, dtype=np.float64)
+        if trace.ndim == 2:
+            trace = trace[:, np.newaxis, :]
+        if trace.shape[2] != len(self.names):
+            raise ValueError('Expected %i parameters, got %i.' % (len(self.names), trace.shape[2]))
+        if logp is None:
+            logp = np.zeros(trace.shape[0:2]) + np.nan
+        arrays = {}
+        for i, name in enumerate(self.names):
+            arrays[name] = trace[:, :, i]
+        arrays['logp'] = np.asarray(logp, dtype=np.float64).reshape(trace.shape[0:2])
+
+        chunk = 'chunk%05i' % (len(self.meta["chunks"]))
+        if self.compress:
+            np.savez_compressed(os.path.join(self.directory, chunk + '.npz'), **arrays)
+        else:
+            os.makedirs(os.path.join(self.directory, chunk))
+            for name in self.columns:
+                np.save(os.path.join(self.directory, chunk, name + '.npy'), arrays[name])
+        self.meta["chunks"].append({"name": chunk,
+                                    "length": trace.shape[0],
+                                    "compressed": self.compress})
+        self._write_meta()
+        return self
+
+    def _chunk_column(self, chunk, name):
+        if chunk["compressed"]:
+            z = np.load(os.path.join(self.directory, chunk["name"] + '.npz'))
+            column = z[name]
+            z.close()
+            return column
+        return np.load(os.path.join(self.directory, chunk["name"], name + '.npy'), mmap_mode='r')
+
+    def column(self, name):
+        """
+        All the samples of one column, [nsamples, nchains].  A store with a
+        single uncompressed chunk returns a read-only memory map.
+        """
+        if name not in self.columns:
+            raise KeyError(name)
+        parts = [self._chunk_column(c, name) for c in self.meta["chunks"]]
+        if len(parts) == 1:
+            return parts[0]
+        return np.concatenate(parts)
+
+    def trace(self, name=None):
+        """
+        Samples with the chains concatenated, as returned by
+        rnsampler.MCMC.trace.  With no name, all the parameters are returned
+        as an array [nsamples, nparameters].
+        """
+        if name is not None:
+            return np.asarray(self.column(name)).T.flatten()
+        return np.asarray([self.trace(n) for n in self.names]).T
+
+    def spectrum(self, logposterior, index=None):
+        """
+        Regenerate the model spectra, the 'fourier_power_spectrum' node,
+        from the stored parameters.
+
+        Parameters
+        ----------
+        logposterior : npmodels.LogPosterior
+            the posterior that was sampled
+        index : ndarray
+            optional indices of the samples to use
+        """
+        theta = self.trace()
+        if index is not None:
+            theta = theta[index]
+        return logposterior.spectrum(theta)
+
+    def predictive(self, logposterior, index=None, random_state=np.random):
+        """
+        Draw posterior predictive spectra, the 'predictive' node, from the
+        stored parameters.
+        """
+        theta = self.trace()
+        if index is not None:
+            theta = theta[index]
+        return logposterior.predictive(theta, random_state=random_state)
+
+    def stats(self, logposterior=None):
+        """
+        Summary statistics of the parameters in the layout of PyMC's
+        stats().  If the posterior is given the statistics of the model
+        spectrum and the posterior predictive spectra are included.
+        """
+        s = {}
+        for name in self.names:
+            s[name] = rnsampler.trace_stats(self.trace(name))
+        if logposterior is not None:
+            s['fourier_power_spectrum'] = rnsampler.trace_stats(self.spectrum(logposterior))
+            s['predictive'] = rnsampler.trace_stats(self.predictive(logposterior))
+        return s
+
+
+def save(mcmc, directory, compress=True, description=None):
+    """
+    Append the samples of an rnsampler.MCMC run to the store in directory.
+    """
+    store = TraceStore(directory, names=mcmc.names, compress=compress,
+                       description=description)
+    return store.append(mcmc.results["trace"], logp=mcmc.results["logp"])
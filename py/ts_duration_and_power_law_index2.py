@@ -0,0 +1,204 @@
+"""
+The purpose of this program is analyze test data so we can find out how long
+a time series has to be in order for it to have enough information in it that
+we are able to determine its power law index a reasonable percentage of the
+time.
+
+This is ts_duration_and_power_law_index.py run as a Monte Carlo experiment.
+The cases are every combination of time series length and power law index.
+The trials of each case are simulated together in units of many trials, and
+each trial is fit by maximizing the Whittle likelihood of a single power
+law.  With flat priors the posterior of the parameters is approximated by
+a normal distribution centered at the maximum, with the covariance from the
+Fisher information, so the posterior mean and mode are the maximum
+likelihood parameters and the 68% credible interval is the maximum plus or
+minus z68 standard deviations.  The units are run by a pool of processes and
+saved as they finish, so running the program again carries on where an
+interrupted run stopped.  The results are saved in the same form as by
+ts_duration_and_power_law_index.py.
+"""
+
+import numpy as np
+import pickle, os
+import rnsimulation
+import rnspectralmodels
+import rnwhittle
+import montecarlo
+
+# Number of processes to run the trials.  None runs them in this process
+processes = 4
+
+# Where to dump the pickle data
+pickle_directory = os.path.expanduser('~/ts/pickle/')
+
+# Where the units of the experiment are saved as they finish
+experiment_directory = os.path.expanduser('~/ts/montecarlo/ts_duration_and_power_law_index/')
+
+# Set up the simulated data
+# Initial length of the time series
+n_initial = 300
+
+# Sampling (SDO AIA sample rate is once every 12 seconds)
+dt = 1.0
+
+# power law indices
+alphas = [2.0]
+
+# Alpha range - this is the half width of a range.  Three measures of
+# how close we are getting to the true value are calculated
+# (1) The 68% CI lies within alpha-alpha_range -> alpha+alpha_range
+# (2) The mean value of alpha found lies within
+#     alpha-alpha_range -> alpha+alpha_range
+# (3) The mode value of alpha found lies within
+#     alpha-alpha_range -> alpha+alpha_range
+alpha_range = 0.1
+
+# The time-series is multiplied by this factor
+n_increment = np.sqrt(2.0)
+
+# Maximum number of increments
+max_increment = 10
+
+# Number of trial data runs at each time-series length
+ntrial = 500
+
+# Number of trials in each unit of the experiment
+block = 50
+
+# Root seed of the random numbers of the experiment
+seed = 0
+
+# Oversampling of the simulated time series in duration and in cadence
+V = 10
+W = 10
+
+# Make the simulated time series from the folded power spectrum.  The
+# folded time series have random phases over the whole circle, so the
+# oversampled time series are made the same way when folded is False
+folded = True
+
+# Number of standard deviations either side of the mean of a normal
+# distribution that holds 68% of the probability
+z68 = 0.994457883209753
+
+
+def trials(case, trial, random_state):
+    """
+    Simulate and fit the trials of one unit of the experiment.
+
+    Parameters
+    ----------
+    case : dict
+        "n" : the length of the time series
+        "alpha" : the true power law index
+    trial : ndarray
+        the trial numbers
+    random_state : numpy.random.RandomState or Generator
+        source of random numbers
+
+    Returns
+    -------
+    dict
+        arrays with one row per trial of the least squares fit, the
+        posterior mean and mode of the normalization and the index, the
+        68% credible interval of the index, and whether the fit converged
+    """
+    n = case["n"]
+    spectrum = rnsimulation.SimplePowerLawSpectrum([0.0, case["alpha"]], nt=n, dt=dt)
+    test_data = rnsimulation.TimeSeriesRealizations(spectrum, len(trial), V=V, W=W,
+                                                    folded=folded, full_circle=True,
+                                                    random_state=random_state).sample
+
+    # get the power spectrum and frequencies we will analyze at, the
+    # positive frequencies below the Nyquist frequency
+    nf = (n - 1) // 2
+    analysis_frequencies = np.fft.fftfreq(n, dt)[1:nf + 1]
+    analysis_power = (np.absolute(np.fft.rfft(test_data, axis=-1)[:, 1:nf + 1])) ** 2
+
+    # get a simple estimate of the power law index
+    coefficients = np.polyfit(np.log(analysis_frequencies), np.log(analysis_power).T, 1)
+    m_estimate = -coefficients[0]
+    lstsqr_fit = np.column_stack((np.exp(coefficients[1]), m_estimate))
+
+    # Maximum likelihood fit, starting from the least squares fit.  The
+    # normalization of the model is at the lowest frequency
+    p0 = np.column_stack((coefficients[1] - m_estimate * np.log(analysis_frequencies[0]),
+                          m_estimate))
+    fit = rnwhittle.fit(rnspectralmodels.power_law, analysis_frequencies,
+                        analysis_power, p0)
+    sd = np.sqrt(fit["covariance"][:, 1, 1])
+    ci_keep68 = np.column_stack((fit["parameters"][:, 1] - z68 * sd,
+                                 fit["parameters"][:, 1] + z68 * sd))
+    return {"lstsqr_fit": lstsqr_fit,
+            "bayes_mean": fit["parameters"],
+            "bayes_mode": fit["parameters"],
+            "ci_keep68": ci_keep68,
+            "converged": fit["converged"]}
+
+
+if __name__ == '__main__':
+    nkeep = np.array([int(np.rint(n_initial * (n_increment ** i))) for i in range(0, max_increment)])
+
+    experiment = montecarlo.Experiment(experiment_directory,
+                                       [("n", nkeep.tolist()), ("alpha", alphas)],
+                                       trials, ntrial, block=block, seed=seed,
+                                       config={"dt": dt, "V": V, "W": W, "folded": folded,
+                                               "full_circle": True})
+    experiment.run(processes=processes)
+    answer = experiment.results()
+
+    for alpha in alphas:
+        # storage arrays in the layout of ts_duration_and_power_law_index.py
+        ci_keep68 = np.zeros((max_increment, ntrial, 2))
+        lstsqr_fit = np.zeros((max_increment, ntrial, 2))
+        bayes_mean = np.zeros((max_increment, ntrial, 2))
+        bayes_mode = np.zeros((max_increment, ntrial, 2))
+        fraction_found_ci = np.zeros((max_increment))
+        fraction_found_mean = np.zeros((max_increment))
+        fraction_found_mode = np.zeros((max_increment))
+
+        for i, n in enumerate(nkeep):
+            result = answer[(n, alpha)]
+            ci_keep68[i] = result["ci_keep68"]
+            lstsqr_fit[i] = result["lstsqr_fit"]
+            bayes_mean[i] = result["bayes_mean"]
+            bayes_mode[i] = result["bayes_mode"]
+            if not np.all(result["converged"]):
+                print('n=%i, alpha=%4.2f: %i fits did not converge' %
+                      (n, alpha, np.sum(~result["converged"])))
+
+            # (1) The 68% CI lies within alpha-alpha_range -> alpha+alpha_range
+            low = ci_keep68[i, :, 0] >= alpha - alpha_range
+            high = ci_keep68[i, :, 1] <= alpha + alpha_range
+            fraction_found_ci[i] = np.sum(low * high) / (1.0 * ntrial)
+
+            # (2) The mean value of alpha found lies within
+            #     alpha-alpha_range -> alpha+alpha_range
+            low = bayes_mean[i, :, 1] >= alpha - alpha_range
+            high = bayes_mean[i, :, 1] <= alpha + alpha_range
+            fraction_found_mean[i] = np.sum(low * high) / (1.0 * ntrial)
+
+            # (3) The mode value of alpha found lies within
+            #     alpha-alpha_range -> alpha+alpha_range
+            low = bayes_mode[i, :, 1] >= alpha - alpha_range
+            high = bayes_mode[i, :, 1] <= alpha + alpha_range
+            fraction_found_mode[i] = np.sum(low * high) / (1.0 * ntrial)
+
+        print('alpha=%4.2f' % alpha)
+        print('fraction found (68% CI) ' + str(fraction_found_ci))
+        print('fraction found (mean)   ' + str(fraction_found_mean))
+        print('fraction found (mode)   ' + str(fraction_found_mode))
+
+        # Save the data to a pickle file, which
+        # rn_utils.plot_ts_duration_and_power_law_index_results plots
+        alpha_S = str(np.around(alpha, decimals=2))
+        filename = "ts_duration_and_power_law_index_" + alpha_S
+        results = {"bayes_mean": bayes_mean,
+                   "bayes_mode": bayes_mode,
+                   "ci_keep68": ci_keep68,
+                   "lstsqr_fit": lstsqr_fit,
+                   "fraction_found_ci": fraction_found_ci,
+                   "fraction_found_mean": fraction_found_mean,
+                   "fraction_found_mode": fraction_found_mode,
+                   "nkeep": nkeep, "alpha": alpha, "alpha_range": alpha_range}
+        pickle.dump(results, open(pickle_directory + filename + '.pickle', "wb"))